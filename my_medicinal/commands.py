@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Bench commands for my_medicinal
+Usage: bench --site <site> <command>
+"""
+
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-adherence-rollups")
+@click.option("--from-date", help="First day to rebuild (YYYY-MM-DD); defaults to the oldest Medication Log")
+@click.option("--to-date", help="Last day to rebuild (YYYY-MM-DD); defaults to today")
+@pass_context
+def rebuild_adherence_rollups(context, from_date=None, to_date=None):
+    """Backfill or repair Adherence Daily Rollup rows from Medication Log"""
+    from my_medicinal.my_medicinal.adherence_rollup import rebuild_rollups
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        written = rebuild_rollups(from_date, to_date)
+        click.echo(f"Rebuilt {written} adherence rollup rows")
+    finally:
+        frappe.destroy()
+
+
+@click.command("partition-api-request-log")
+@click.option("--interval", type=click.Choice(["day", "week"]), default="day", help="Partition width")
+@click.option("--ahead", type=int, default=7, help="Future partitions to create")
+@pass_context
+def partition_api_request_log(context, interval="day", ahead=7):
+    """Convert API Request Log to RANGE partitions on timestamp (rewrites the table once)"""
+    from my_medicinal.my_medicinal.log_partitions import partition_table
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        partitions = partition_table(interval, ahead)
+        click.echo(f"Partitioned API Request Log into {len(partitions)} partitions")
+    finally:
+        frappe.destroy()
+
+
+@click.command("api-request-log-partitions")
+@click.option("--create-ahead", type=int, help="Create future partitions up to this many periods ahead")
+@click.option("--drop-older-than", type=int, help="Drop partitions older than this many days")
+@pass_context
+def api_request_log_partitions(context, create_ahead=None, drop_older_than=None):
+    """List API Request Log partitions, optionally creating or dropping some first"""
+    from my_medicinal.my_medicinal import log_partitions
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        if not log_partitions.is_partitioned():
+            click.echo("API Request Log is not partitioned; run partition-api-request-log first")
+            return
+
+        if create_ahead:
+            created = log_partitions.create_future_partitions(create_ahead)
+            click.echo(f"Created {len(created)} partitions")
+
+        if drop_older_than:
+            dropped = log_partitions.drop_expired_partitions(drop_older_than)
+            click.echo(f"Dropped partitions holding about {dropped} rows")
+
+        for partition in log_partitions.get_partitions():
+            click.echo(f"{partition.name}\t< {partition.upper_bound}\t~{partition.estimated_rows} rows")
+    finally:
+        frappe.destroy()
+
+
+@click.command("archive-medication-logs")
+@click.option("--horizon-days", type=int, help="Keep this many days of logs in the database")
+@pass_context
+def archive_medication_logs(context, horizon_days=None):
+    """Move old Medication Log rows into the monthly gzip archive"""
+    from my_medicinal.my_medicinal.log_archive import archive_medication_logs as archive
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        archived = archive(horizon_days)
+        click.echo(f"Archived {archived or 0} medication logs")
+    finally:
+        frappe.destroy()
+
+
+@click.command("run-reminder-dispatcher")
+@pass_context
+def run_reminder_dispatcher(context):
+    """Long-running medication reminder dispatcher (run one per site under supervisor)"""
+    from my_medicinal.my_medicinal.reminder_queue import run_dispatcher_loop
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        click.echo(f"Dispatching medication reminders for {site}")
+        run_dispatcher_loop()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        frappe.destroy()
+
+
+@click.command("benchmark-imports")
+@click.option("--module", "modules", multiple=True, help="Module to measure (repeatable); defaults to every app module")
+@click.option("--repeat", type=int, default=3, help="Runs per measurement; the fastest is kept")
+@click.option("--module-ms", type=float, help="Import time budget per module")
+@click.option("--module-rss-mb", type=float, help="Memory budget per module")
+@click.option("--total-ms", type=float, help="Import time budget for all modules together")
+@click.option("--total-rss-mb", type=float, help="Memory budget for all modules together")
+def benchmark_imports(modules=None, repeat=3, module_ms=None, module_rss_mb=None, total_ms=None, total_rss_mb=None):
+    """Measure import time and RSS of my_medicinal modules; exits 1 when over budget"""
+    from my_medicinal.my_medicinal.startup_benchmark import run_benchmark
+
+    report = run_benchmark(modules, {
+        "module_ms": module_ms,
+        "module_rss_mb": module_rss_mb,
+        "total_ms": total_ms,
+        "total_rss_mb": total_rss_mb
+    }, repeat)
+
+    for result in report["results"]:
+        heavy = f"\t{', '.join(result['heavy'])}" if result["heavy"] else ""
+        click.echo(f"{result['ms']:>8} ms {result['rss_mb']:>6} MB\t{result['module']}{heavy}")
+
+    total = report["total"]
+    click.echo(f"{total['ms']:>8} ms {total['rss_mb']:>6} MB\tall modules")
+
+    if report["failures"]:
+        for failure in report["failures"]:
+            click.echo(f"OVER BUDGET {failure}", err=True)
+        raise click.ClickException(f"{len(report['failures'])} import budget violations")
+
+    click.echo("All modules within the import budget")
+
+
+commands = [
+    rebuild_adherence_rollups,
+    archive_medication_logs,
+    partition_api_request_log,
+    api_request_log_partitions,
+    run_reminder_dispatcher,
+    benchmark_imports
+]
@@ -123,6 +123,13 @@ website_context = {
 # before_install = "my_medicinal.install.before_install"
 # after_install = "my_medicinal.install.after_install"
 
+# Migration
+# ------------
+
+after_migrate = [
+    "my_medicinal.my_medicinal.indexes.ensure_indexes"
+]
+
 # Uninstallation
 # ------------
 
@@ -200,26 +207,30 @@ website_context = {
 
 
 scheduler_events = {
-    # Every 5 minutes - Medication Reminders
     "cron": {
+        # Every minute - Dispatch due doses from the delayed-delivery queue, retry outbox deliveries
+        "* * * * *": [
+            "my_medicinal.my_medicinal.reminder_queue.run_dispatcher",
+            "my_medicinal.my_medicinal.outbox.drain_outbox"
+        ],
+
+        # Every 5 minutes - Medication Reminders (queue top-up and safety net)
         "*/5 * * * *": [
-            "my_medicinal.my_medicinal.tasks.send_medication_reminders"
+            "my_medicinal.my_medicinal.tasks.send_medication_reminders",
+            "my_medicinal.my_medicinal.stock.compact_stock_movements"
         ]
     },
 
-    # Hourly - Check medications and send reminders
+    # Hourly - Check medications and send reminders, slot dose times added outside the form
     "hourly": [
-        "my_medicinal.my_medicinal.tasks.hourly"
+        "my_medicinal.my_medicinal.tasks.hourly",
+        "my_medicinal.my_medicinal.reminder_index.assign_missing_slots"
     ],
 
-    # Daily - Run all daily tasks (stock check, adherence reports)
+    # Daily - Run all daily tasks (stock check, adherence reports, retention purge)
     "daily": [
-        "my_medicinal.my_medicinal.tasks.all"
-    ],
-
-    # Weekly - Cleanup old notifications
-    "weekly": [
-        "my_medicinal.my_medicinal.tasks.cleanup_old_notifications"
+        "my_medicinal.my_medicinal.tasks.all",
+        "my_medicinal.my_medicinal.log_partitions.maintain_partitions"
     ]
 }
 
@@ -229,13 +240,34 @@ doc_events = {
     "Medication Schedule": {
         "validate": "my_medicinal.my_medicinal.api.medication.validate",
         "after_insert": "my_medicinal.my_medicinal.api.medication.after_insert",
-        "on_update": "my_medicinal.my_medicinal.api.medication.on_update",
+        "on_update": [
+            "my_medicinal.my_medicinal.api.medication.on_update",
+            "my_medicinal.my_medicinal.reminder_index.on_schedule_change"
+        ],
+        "after_delete": "my_medicinal.my_medicinal.reminder_index.on_schedule_change",
         "before_save": "my_medicinal.my_medicinal.api.medication.calculate_depletion"
     },
 
-    # Medication Log - الدالة موجودة ✓
+    # Patient / API Key - drop cached notification recipients (user, name, FCM tokens)
+    "patient": {
+        "on_update": "my_medicinal.my_medicinal.recipients.on_patient_change",
+        "after_delete": "my_medicinal.my_medicinal.recipients.on_patient_change"
+    },
+    "API Key": {
+        "on_update": "my_medicinal.my_medicinal.recipients.on_api_key_change",
+        "after_delete": "my_medicinal.my_medicinal.recipients.on_api_key_change"
+    },
+
+    # Medication Log - stock is taken in MedicationLog._decrease_stock (stock.decrement_stock)
     "Medication Log": {
-        "after_insert": "my_medicinal.my_medicinal.api.medication.update_adherence"
+        "on_update": "my_medicinal.my_medicinal.adherence_rollup.on_log_update",
+        "on_trash": "my_medicinal.my_medicinal.adherence_rollup.on_log_trash"
+    },
+
+    # Notification Log - unread badge counters (the outbox adjusts them for its bulk inserts)
+    "Notification Log": {
+        "after_insert": "my_medicinal.my_medicinal.unread_counter.on_log_change",
+        "on_trash": "my_medicinal.my_medicinal.unread_counter.on_log_change"
     }
 
     # Medical Prescription - معلق (الدوال غير موجودة)
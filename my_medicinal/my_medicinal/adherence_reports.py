@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Nightly Adherence Reports
+Totals for every patient come from one grouped query over the daily
+rollups. They are written with chunked multi-row upserts into one rolling
+Adherence Report per patient and period (named "{patient}-{period}"),
+plus a compact Adherence Report Snapshot per night for history. The same
+pass refreshes each patient's Patient Adherence Summary (latest adherence
+and band) read by the provider dashboards.
+"""
+
+import frappe
+from frappe.utils import add_days, now_datetime, today
+
+UPSERT_CHUNK_SIZE = 1000
+
+PERIOD_DAYS = {
+    "Weekly": 7,
+    "Monthly": 30,
+    "Quarterly": 90
+}
+
+REPORT_FIELDS = (
+    "patient", "report_period", "start_date", "end_date",
+    "total_doses_scheduled", "doses_taken", "doses_missed", "doses_skipped",
+    "adherence_percentage", "generated_at"
+)
+
+SUMMARY_FIELDS = (
+    "patient", "report_period", "adherence_percentage", "band", "computed_at"
+)
+
+# Lower bound of each band, checked in order
+BANDS = (
+    ("High", 80),
+    ("Medium", 50),
+    ("Low", 0)
+)
+
+SNAPSHOT_FIELDS = (
+    "patient", "report_period", "snapshot_date",
+    "total_doses_scheduled", "doses_taken", "doses_missed", "doses_skipped",
+    "adherence_percentage"
+)
+
+
+def generate_reports(report_period="Monthly"):
+    """
+    Refresh the rolling report and tonight's snapshot of every active patient
+
+    Args:
+        report_period: "Weekly", "Monthly" or "Quarterly"
+
+    Returns:
+        List of (patient, adherence_percentage) for the patients reported
+    """
+    from my_medicinal.my_medicinal.adherence_rollup import get_patient_totals
+
+    end_date = today()
+    start_date = add_days(end_date, -PERIOD_DAYS[report_period])
+    totals = [row for row in get_patient_totals(start_date, end_date) if row.scheduled_doses]
+
+    now = now_datetime()
+    user = frappe.session.user
+    reported = []
+
+    for start in range(0, len(totals), UPSERT_CHUNK_SIZE):
+        reports = []
+        snapshots = []
+        summaries = []
+
+        for row in totals[start:start + UPSERT_CHUNK_SIZE]:
+            scheduled = int(row.scheduled_doses)
+            taken = int(row.taken_doses or 0)
+            adherence = round(taken / scheduled * 100, 2)
+
+            reports.append((
+                f"{row.patient}-{report_period}",
+                row.patient, report_period, start_date, end_date,
+                scheduled, taken, int(row.missed_doses or 0), int(row.skipped_doses or 0),
+                adherence, now
+            ))
+            snapshots.append((
+                f"{row.patient}-{report_period}-{end_date}",
+                row.patient, report_period, end_date,
+                scheduled, taken, int(row.missed_doses or 0), int(row.skipped_doses or 0),
+                adherence
+            ))
+            summaries.append((
+                row.patient,
+                row.patient, report_period, adherence, get_band(adherence), now
+            ))
+            reported.append((row.patient, adherence))
+
+        _upsert("Adherence Report", REPORT_FIELDS, reports, now, user)
+        _upsert("Adherence Report Snapshot", SNAPSHOT_FIELDS, snapshots, now, user)
+        _upsert("Patient Adherence Summary", SUMMARY_FIELDS, summaries, now, user)
+
+        # One transaction per chunk keeps lock time bounded
+        frappe.db.commit()
+
+    return reported
+
+
+def get_band(adherence):
+    """High (>= 80%), Medium (>= 50%) or Low"""
+    for band, lower_bound in BANDS:
+        if adherence >= lower_bound:
+            return band
+
+    return "Low"
+
+
+def _upsert(doctype, fields, rows, now, user):
+    """Multi-row INSERT ... ON DUPLICATE KEY UPDATE keyed on the deterministic name"""
+    if not rows:
+        return
+
+    columns = ("name", "creation", "modified", "owner", "modified_by", "docstatus", "idx") + fields
+    row_placeholder = "({})".format(", ".join(["%s"] * len(columns)))
+
+    values = []
+    for row in rows:
+        values.extend((row[0], now, now, user, user, 0, 0) + tuple(row[1:]))
+
+    updates = ", ".join(f"`{field}` = VALUES(`{field}`)" for field in fields + ("modified", "modified_by"))
+
+    frappe.db.sql("""
+        INSERT INTO `tab{doctype}` ({columns})
+        VALUES {rows}
+        ON DUPLICATE KEY UPDATE {updates}
+    """.format(
+        doctype=doctype,
+        columns=", ".join(f"`{column}`" for column in columns),
+        rows=", ".join([row_placeholder] * len(rows)),
+        updates=updates
+    ), tuple(values))
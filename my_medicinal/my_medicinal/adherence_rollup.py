@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Daily Adherence Rollups
+One Adherence Daily Rollup row per (patient, schedule, day) with dose
+counts by status. Medication Log hooks keep the rows current inside the
+same transaction, so adherence readers scan O(days) rollup rows instead
+of O(doses) log rows. rebuild_rollups repairs them from the raw logs.
+"""
+
+import frappe
+from frappe.utils import add_days, getdate, get_datetime, now_datetime, today
+
+REBUILD_CHUNK_DAYS = 7
+
+COUNT_FIELDS = ("scheduled_doses", "taken_doses", "missed_doses", "skipped_doses", "on_time_doses")
+
+
+# ============================================
+# DOC EVENTS (hooks.py)
+# ============================================
+
+def on_log_update(doc, method=None):
+    """
+    Move the log's counts from its old rollup bucket to its new one
+    Called by hooks.py: doc_events["Medication Log"]["on_update"] (insert and save)
+    """
+    before = doc.get_doc_before_save()
+
+    if before and _bucket(before) == _bucket(doc) and _counts(before) == _counts(doc):
+        return
+
+    if before:
+        _apply(before, -1)
+    _apply(doc, 1)
+
+
+def on_log_trash(doc, method=None):
+    """
+    Called by hooks.py: doc_events["Medication Log"]["on_trash"]
+    """
+    _apply(doc, -1)
+
+
+# ============================================
+# READERS
+# ============================================
+
+def get_totals(patient_id, from_date, to_date=None):
+    """
+    Dose counts of a patient between two dates (inclusive)
+
+    Returns:
+        dict with scheduled_doses, taken_doses, missed_doses, skipped_doses, on_time_doses
+    """
+    totals = frappe.db.sql("""
+        SELECT
+            IFNULL(SUM(scheduled_doses), 0) as scheduled_doses,
+            IFNULL(SUM(taken_doses), 0) as taken_doses,
+            IFNULL(SUM(missed_doses), 0) as missed_doses,
+            IFNULL(SUM(skipped_doses), 0) as skipped_doses,
+            IFNULL(SUM(on_time_doses), 0) as on_time_doses
+        FROM `tabAdherence Daily Rollup`
+        WHERE patient = %(patient)s
+        AND rollup_date BETWEEN %(from_date)s AND %(to_date)s
+    """, {
+        "patient": patient_id,
+        "from_date": getdate(from_date),
+        "to_date": getdate(to_date or today())
+    }, as_dict=True)[0]
+
+    return frappe._dict({field: int(totals[field]) for field in COUNT_FIELDS})
+
+
+def get_daily_totals(patient_id, from_date, to_date=None):
+    """
+    Per-day dose counts of a patient (all schedules)
+
+    Returns:
+        dict of date -> counts dict; days without doses are omitted
+    """
+    rows = frappe.db.sql("""
+        SELECT
+            rollup_date,
+            SUM(scheduled_doses) as scheduled_doses,
+            SUM(taken_doses) as taken_doses,
+            SUM(missed_doses) as missed_doses,
+            SUM(skipped_doses) as skipped_doses,
+            SUM(on_time_doses) as on_time_doses
+        FROM `tabAdherence Daily Rollup`
+        WHERE patient = %(patient)s
+        AND rollup_date BETWEEN %(from_date)s AND %(to_date)s
+        GROUP BY rollup_date
+    """, {
+        "patient": patient_id,
+        "from_date": getdate(from_date),
+        "to_date": getdate(to_date or today())
+    }, as_dict=True)
+
+    return {
+        getdate(row.rollup_date): frappe._dict({field: int(row[field]) for field in COUNT_FIELDS})
+        for row in rows
+    }
+
+
+def get_patient_totals(from_date, to_date=None, active_only=True):
+    """
+    Dose counts per patient in one grouped query (nightly reports)
+
+    Args:
+        active_only: Only patients with an active Medication Schedule
+
+    Returns:
+        List of dicts with patient and the count fields
+    """
+    condition = """
+        AND patient IN (
+            SELECT patient FROM `tabMedication Schedule` WHERE is_active = 1
+        )
+    """ if active_only else ""
+
+    return frappe.db.sql(f"""
+        SELECT
+            patient,
+            SUM(scheduled_doses) as scheduled_doses,
+            SUM(taken_doses) as taken_doses,
+            SUM(missed_doses) as missed_doses,
+            SUM(skipped_doses) as skipped_doses,
+            SUM(on_time_doses) as on_time_doses
+        FROM `tabAdherence Daily Rollup`
+        WHERE rollup_date BETWEEN %(from_date)s AND %(to_date)s
+        {condition}
+        GROUP BY patient
+    """, {
+        "from_date": getdate(from_date),
+        "to_date": getdate(to_date or today())
+    }, as_dict=True)
+
+
+# ============================================
+# BACKFILL / REPAIR
+# ============================================
+
+def rebuild_rollups(from_date=None, to_date=None):
+    """
+    Recompute rollups from the raw Medication Log rows
+    Used by the rebuild-adherence-rollups bench command
+
+    Args:
+        from_date: First day to rebuild (defaults to the oldest log;
+            never before the archive horizon)
+        to_date: Last day to rebuild (defaults to today)
+
+    Returns:
+        Number of rollup rows written
+    """
+    if not from_date:
+        oldest = frappe.db.sql("SELECT MIN(scheduled_time) FROM `tabMedication Log`")[0][0]
+        if not oldest:
+            return 0
+        from_date = oldest
+
+    day = getdate(from_date)
+    to_date = getdate(to_date or today())
+    written = 0
+
+    # Archived days have no raw rows left; their rollups are the only record
+    from my_medicinal.my_medicinal.log_archive import get_archived_before
+
+    archived_before = get_archived_before()
+    if archived_before and day < getdate(archived_before):
+        day = getdate(archived_before)
+
+    while day <= to_date:
+        chunk_end = min(add_days(day, REBUILD_CHUNK_DAYS - 1), to_date)
+        written += _rebuild_range(day, chunk_end)
+        frappe.db.commit()
+
+        day = add_days(chunk_end, 1)
+
+    return written
+
+
+def _rebuild_range(from_date, to_date):
+    frappe.db.sql("""
+        DELETE FROM `tabAdherence Daily Rollup`
+        WHERE rollup_date BETWEEN %(from_date)s AND %(to_date)s
+    """, {"from_date": from_date, "to_date": to_date})
+
+    now = now_datetime()
+    user = frappe.session.user
+
+    frappe.db.sql("""
+        INSERT INTO `tabAdherence Daily Rollup`
+            (name, creation, modified, owner, modified_by, docstatus, idx,
+             patient, medication_schedule, rollup_date,
+             scheduled_doses, taken_doses, missed_doses, skipped_doses, on_time_doses)
+        SELECT
+            CONCAT(medication_schedule, '-', DATE(scheduled_time)),
+            %(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+            patient, medication_schedule, DATE(scheduled_time),
+            COUNT(*),
+            SUM(status = 'Taken'),
+            SUM(status = 'Missed'),
+            SUM(status = 'Skipped'),
+            SUM(status = 'Taken' AND was_on_time = 1)
+        FROM `tabMedication Log`
+        WHERE scheduled_time >= %(from_time)s
+        AND scheduled_time < %(to_time)s
+        AND IFNULL(patient, '') != ''
+        AND IFNULL(medication_schedule, '') != ''
+        GROUP BY patient, medication_schedule, DATE(scheduled_time)
+    """, {
+        "now": now,
+        "user": user,
+        "from_time": get_datetime(from_date),
+        "to_time": get_datetime(add_days(to_date, 1))
+    })
+
+    return frappe.db.sql("""
+        SELECT COUNT(*) FROM `tabAdherence Daily Rollup`
+        WHERE rollup_date BETWEEN %(from_date)s AND %(to_date)s
+    """, {"from_date": from_date, "to_date": to_date})[0][0]
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _apply(log, sign):
+    """Add (sign=1) or remove (sign=-1) one log's counts with a single upsert"""
+    bucket = _bucket(log)
+    if not bucket:
+        return
+
+    patient, schedule, rollup_date = bucket
+    counts = [sign * count for count in _counts(log)]
+    now = now_datetime()
+    user = frappe.session.user
+
+    frappe.db.sql("""
+        INSERT INTO `tabAdherence Daily Rollup`
+            (name, creation, modified, owner, modified_by, docstatus, idx,
+             patient, medication_schedule, rollup_date,
+             scheduled_doses, taken_doses, missed_doses, skipped_doses, on_time_doses)
+        VALUES
+            (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+             %(patient)s, %(schedule)s, %(rollup_date)s,
+             %(scheduled)s, %(taken)s, %(missed)s, %(skipped)s, %(on_time)s)
+        ON DUPLICATE KEY UPDATE
+            scheduled_doses = scheduled_doses + VALUES(scheduled_doses),
+            taken_doses = taken_doses + VALUES(taken_doses),
+            missed_doses = missed_doses + VALUES(missed_doses),
+            skipped_doses = skipped_doses + VALUES(skipped_doses),
+            on_time_doses = on_time_doses + VALUES(on_time_doses),
+            modified = VALUES(modified)
+    """, {
+        "name": f"{schedule}-{rollup_date}",
+        "now": now,
+        "user": user,
+        "patient": patient,
+        "schedule": schedule,
+        "rollup_date": rollup_date,
+        "scheduled": counts[0],
+        "taken": counts[1],
+        "missed": counts[2],
+        "skipped": counts[3],
+        "on_time": counts[4]
+    })
+
+
+def _bucket(log):
+    if not (log.patient and log.medication_schedule and log.scheduled_time):
+        return None
+
+    return (log.patient, log.medication_schedule, getdate(get_datetime(log.scheduled_time)))
+
+
+def _counts(log):
+    taken = log.status == "Taken"
+    return (
+        1,
+        int(taken),
+        int(log.status == "Missed"),
+        int(log.status == "Skipped"),
+        int(taken and bool(log.was_on_time))
+    )
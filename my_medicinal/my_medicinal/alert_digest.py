@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Patient Alert Digest
+Stock, adherence and missed-dose alerts are collected per patient in Redis
+and delivered once a night as one combined Notification Log row and one
+push per device, queued in bulk through the notification outbox.
+
+Alerts are deduplicated by tier: an alert whose tier was already delivered
+(e.g. "Critical" stock for the same schedule) is not repeated until the
+condition clears and comes back.
+"""
+
+import json
+
+import frappe
+
+PENDING_KEY = "alert_digest:pending:{0}"
+PATIENTS_KEY = "alert_digest:patients"
+SENT_TIERS_KEY = "alert_digest:sent:{0}"
+
+SENT_TIERS_TTL = 30 * 86400
+FLUSH_BATCH_SIZE = 500
+
+
+def add_alert(patient_id, kind, key, tier, title, message,
+              document_type=None, document_name=None, remember=True):
+    """
+    Queue an alert for the patient's next digest
+
+    Args:
+        patient_id: Patient name
+        kind: "stock", "adherence" or "missed"
+        key: Identifies the alert within its kind (e.g. the schedule)
+        tier: Severity; an alert is skipped if this tier was already delivered
+        title, message: Text shown in the digest
+        remember: Store the delivered tier for deduplication (off for
+            one-off events such as a missed dose)
+    """
+    if not patient_id:
+        return
+
+    alert = json.dumps({
+        "kind": kind,
+        "key": key,
+        "tier": tier,
+        "title": title,
+        "message": message,
+        "document_type": document_type,
+        "document_name": document_name,
+        "remember": remember
+    }, ensure_ascii=False)
+
+    pipe = frappe.cache().pipeline()
+    pipe.rpush(_key(PENDING_KEY.format(patient_id)), alert)
+    pipe.sadd(_key(PATIENTS_KEY), patient_id)
+    pipe.execute()
+
+
+def clear_alert(patient_id, kind, key):
+    """Forget the delivered tier so the alert is sent again if it comes back"""
+    pipe = frappe.cache().pipeline()
+    pipe.hdel(_key(SENT_TIERS_KEY.format(patient_id)), f"{kind}:{key}")
+    pipe.execute()
+
+
+def flush_digests():
+    """
+    Deliver every pending digest
+    Runs at the end of the nightly tasks.all
+
+    Returns:
+        Number of digest notifications written
+    """
+    redis = frappe.cache()
+    delivered = 0
+
+    while True:
+        pipe = redis.pipeline()
+        pipe.spop(_key(PATIENTS_KEY), FLUSH_BATCH_SIZE)
+        patients = [_decode(patient) for patient in pipe.execute()[0] or []]
+
+        if not patients:
+            break
+
+        # Take each patient's pending alerts and their delivered tiers
+        pipe = redis.pipeline(transaction=True)
+        for patient in patients:
+            pipe.lrange(_key(PENDING_KEY.format(patient)), 0, -1)
+            pipe.delete(_key(PENDING_KEY.format(patient)))
+            pipe.hgetall(_key(SENT_TIERS_KEY.format(patient)))
+        results = pipe.execute()
+
+        digests = {}
+        for index, patient in enumerate(patients):
+            pending, _, sent_tiers = results[index * 3:index * 3 + 3]
+            alerts = _dedupe(
+                [json.loads(alert) for alert in pending],
+                {_decode(field): _decode(tier) for field, tier in (sent_tiers or {}).items()}
+            )
+            if alerts:
+                digests[patient] = alerts
+
+        delivered += _deliver(digests)
+        frappe.db.commit()
+
+        if len(patients) < FLUSH_BATCH_SIZE:
+            break
+
+    return delivered
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _dedupe(alerts, sent_tiers):
+    """Keep the latest alert per kind/key, minus tiers already delivered"""
+    latest = {}
+    for alert in alerts:
+        latest[f"{alert['kind']}:{alert['key']}"] = alert
+
+    return [
+        alert for field, alert in latest.items()
+        if not (alert["remember"] and sent_tiers.get(field) == alert["tier"])
+    ]
+
+
+def _deliver(digests):
+    """One outbox entry (Notification Log row plus a push per device) for each patient, in bulk"""
+    if not digests:
+        return 0
+
+    from my_medicinal.my_medicinal.outbox import enqueue_many
+    from my_medicinal.my_medicinal.recipients import prefetch_recipients
+
+    patients = prefetch_recipients(digests.keys())
+    entries = []
+    delivered_tiers = {}
+
+    for patient_id, alerts in digests.items():
+        patient = patients.get(patient_id)
+        if not patient or not patient.user:
+            continue
+
+        subject = alerts[0]["title"] if len(alerts) == 1 else f"Daily medication summary ({len(alerts)} alerts)"
+        items = "".join(f"<li><strong>{alert['title']}</strong>: {alert['message']}</li>" for alert in alerts)
+        single = alerts[0] if len(alerts) == 1 else {}
+        body = alerts[0]["message"] if len(alerts) == 1 else "; ".join(alert["title"] for alert in alerts)
+
+        entries.append({
+            "event_type": "alert_digest",
+            "for_user": patient.user,
+            "patient": patient_id,
+            "subject": subject,
+            "document_type": single.get("document_type"),
+            "document_name": single.get("document_name"),
+            "message": f"""
+                <p>Dear {patient.patient_name},</p>
+                <ul>{items}</ul>
+            """,
+            "push": {
+                "title": subject,
+                "body": body,
+                "data": {"type": "alert_digest", "patient_id": patient_id, "count": len(alerts)}
+            }
+        })
+
+        delivered_tiers[patient_id] = {
+            f"{alert['kind']}:{alert['key']}": alert["tier"]
+            for alert in alerts if alert["remember"]
+        }
+
+    # Logged and pushed by the outbox worker once flush_digests commits
+    enqueue_many(entries)
+
+    pipe = frappe.cache().pipeline()
+    for patient_id, tiers in delivered_tiers.items():
+        if tiers:
+            sent_key = _key(SENT_TIERS_KEY.format(patient_id))
+            pipe.hset(sent_key, mapping=tiers)
+            pipe.expire(sent_key, SENT_TIERS_TTL)
+    pipe.execute()
+
+    return len(entries)
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _key(name):
+    return frappe.cache().make_key(name)
@@ -3,10 +3,6 @@
 # For license information, please see license.txt
 from __future__ import unicode_literals
 
-from . import patient
-from . import medication
-from . import order
-from . import prescription
-from . import consultation
-from . import product
-from . import provider
\ No newline at end of file
+# API modules are imported on demand by their dotted path (whitelisted
+# methods, doc_events); importing them all here made every hook that
+# touches one API module load the whole package.
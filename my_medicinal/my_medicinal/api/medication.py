@@ -160,37 +160,6 @@ def on_update(doc, method=None):
         frappe.logger().error(f"? On update error: {str(e)}")
 
 
-def update_adherence(doc, method=None):
-    """
-    Update adherence statistics after logging medication
-    Called by hooks.py: doc_events["Medication Log"]["after_insert"]
-    """
-    try:
-        if not doc.medication_schedule:
-            return
-        
-        schedule = frappe.get_doc("Medication Schedule", doc.medication_schedule)
-        
-        # ????? ??????? ??? ?? ????? ??????
-        if doc.status == "Taken" and doc.quantity_taken:
-            new_stock = (schedule.current_stock or 0) - doc.quantity_taken
-            
-            if new_stock < 0:
-                frappe.msgprint(_("Warning: Stock is now negative!"), indicator="orange")
-                new_stock = 0
-            
-            schedule.current_stock = new_stock
-            schedule.save(ignore_permissions=True)
-            
-            frappe.logger().info(
-                f"? Stock updated for {schedule.medication_name}: "
-                f"Old={schedule.current_stock}, New={new_stock}"
-            )
-        
-    except Exception as e:
-        frappe.logger().error(f"? Update adherence error: {str(e)}")
-
-
 # ============================================================================
 # API METHODS (Whitelisted for external access)
 # ============================================================================
@@ -220,8 +189,16 @@ def get_patient_medications(patient_id, active_only=1):
             order_by="creation desc"
         )
         
+        # Snapshot + pending stock movements
+        from my_medicinal.my_medicinal.stock import get_current_stocks
+        stocks = get_current_stocks(med.name for med in medications)
+        
         # ????? ??????? ??? ????
         for med in medications:
+            if med.name in stocks:
+                med.current_stock = stocks[med.name].current_stock
+                med.days_until_depletion = stocks[med.name].days_until_depletion
+            
             times = frappe.get_all(
                 "Medication Time",
                 filters={"parent": med.name},
@@ -339,22 +316,23 @@ def update_stock(medication_schedule, new_stock, reason=None):
     Update medication stock
     """
     try:
-        schedule = frappe.get_doc("Medication Schedule", medication_schedule)
+        from my_medicinal.my_medicinal.stock import get_current_stock, set_stock
         
-        old_stock = schedule.current_stock
-        schedule.current_stock = new_stock
-        schedule.last_refill_date = frappe.utils.today()
+        old_stock = get_current_stock(medication_schedule).current_stock
         
-        if reason:
-            schedule.add_comment("Comment", f"Stock updated from {old_stock} to {new_stock}. Reason: {reason}")
-        
-        schedule.save(ignore_permissions=True)
+        # Correction movement (the reason is kept on the ledger row)
+        stock = set_stock(medication_schedule, new_stock, reason=reason)
+        frappe.db.set_value(
+            "Medication Schedule", medication_schedule,
+            "last_refill_date", frappe.utils.today(),
+            update_modified=False
+        )
         
         return {
             "message": "Stock updated successfully",
             "old_stock": old_stock,
-            "new_stock": new_stock,
-            "days_until_depletion": schedule.days_until_depletion
+            "new_stock": stock.current_stock,
+            "days_until_depletion": stock.days_until_depletion
         }
         
     except Exception as e:
@@ -421,29 +399,29 @@ def send_low_stock_alert(schedule):
 def create_notification(patient, title, body, notification_type, 
                        related_doctype=None, related_document=None):
     """
-    Create notification log
+    Queue a notification log and push for the patient
+    
+    Written to the outbox in the caller's transaction (these run inside
+    document hooks); the outbox worker delivers after commit.
     """
     try:
-        notification = frappe.get_doc({
-            "doctype": "Notification Log",
-            "patient": patient,
-            "type": notification_type,
-            "title": title,
-            "body": body,
-            "status": "Sent",
-            "sent_at": frappe.utils.now(),
-            "related_doctype": related_doctype,
-            "related_document": related_document
-        })
+        from my_medicinal.my_medicinal.outbox import enqueue
+        from my_medicinal.my_medicinal.recipients import get_recipient
         
-        notification.insert(ignore_permissions=True)
+        recipient = get_recipient(patient)
+        if not recipient or not recipient.user:
+            return
         
-        # ????? FCM notification ??? ??? ??????
-        try:
-            from my_medicinal.my_medicinal.notifications import send_fcm_notification
-            send_fcm_notification(patient, title, body)
-        except:
-            pass
+        enqueue(
+            recipient.user,
+            title,
+            f"<p>{body}</p>",
+            document_type=related_doctype,
+            document_name=related_document,
+            push={"title": title, "body": body, "data": {"type": notification_type}},
+            event_type=notification_type,
+            patient=patient
+        )
         
     except Exception as e:
         frappe.logger().error(f"? Create notification error: {str(e)}")
@@ -5,6 +5,7 @@
 import frappe
 from frappe import _
 import json
+from my_medicinal.my_medicinal.pagination import as_response, paginate
 
 # ============================================
 # ORDER APIs
@@ -61,21 +62,28 @@ def create_order(patient_id, items, delivery_address, payment_method="Cash on De
 
 
 @frappe.whitelist()
-def get_my_orders(patient_id, limit=20):
-    """Get patient orders"""
+def get_my_orders(patient_id, limit=20, cursor=None):
+    """
+    Get patient orders, newest first
+    
+    Args:
+        limit: Page size
+        cursor: next_cursor of the previous page
+    """
     try:
-        orders = frappe.get_all(
+        page = paginate(
             "patient_order",
             filters={"patient": patient_id},
             fields=[
                 "name", "creation", "total_amount",
                 "status", "delivery_address"
             ],
-            limit=limit,
-            order_by="creation desc"
+            sort_field="creation",
+            cursor=cursor,
+            page_size=limit
         )
         
-        return orders
+        return as_response(page)
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Get Orders Error")
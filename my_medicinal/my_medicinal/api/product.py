@@ -5,33 +5,55 @@
 import frappe
 from frappe import _
 from frappe.utils import cint
+from my_medicinal.my_medicinal.pagination import as_response, paginate
 
 # ============================================
 # PRODUCT APIs (Guest Allowed)
 # ============================================
 
 @frappe.whitelist(allow_guest=True)
-def get_products(category=None, limit=20, offset=0):
-    """Get products list"""
+def get_products(category=None, limit=20, offset=None, cursor=None):
+    """
+    Get products list by item name
+    
+    Args:
+        limit: Page size
+        offset: Deprecated, use cursor; only read when no cursor is given
+        cursor: next_cursor of the previous page
+    """
     try:
         filters = {"is_active": 1}
         if category:
             filters["category"] = category
         
-        products = frappe.get_all(
+        fields = [
+            "name", "item_name", "scientific_name",
+            "category", "standard_rate", "stock_quantity",
+            "requires_prescription"
+        ]
+        
+        # Deprecated OFFSET paging for clients that have not moved to cursors
+        if offset is not None and not cursor:
+            return frappe.get_all(
+                "medication_item",
+                filters=filters,
+                fields=fields,
+                limit=cint(limit),
+                start=cint(offset),
+                order_by="item_name asc, name asc"
+            )
+        
+        page = paginate(
             "medication_item",
             filters=filters,
-            fields=[
-                "name", "item_name", "scientific_name",
-                "category", "standard_rate", "stock_quantity",
-                "requires_prescription"
-            ],
-            limit=cint(limit),
-            start=cint(offset),
-            order_by="item_name"
+            fields=fields,
+            sort_field="item_name",
+            descending=False,
+            cursor=cursor,
+            page_size=limit
         )
         
-        return products
+        return as_response(page)
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Get Products Error")
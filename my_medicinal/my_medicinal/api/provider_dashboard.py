@@ -2,8 +2,12 @@
 
 import frappe
 from frappe import _
+from frappe.utils import flt
 from datetime import datetime, timedelta
 
+# Risk score (0-100) from the nightly risk scoring at which a patient needs outreach
+HIGH_RISK_SCORE = 60
+
 @frappe.whitelist()
 def get_dashboard_stats():
     """Get dashboard statistics for healthcare provider"""
@@ -92,35 +96,19 @@ def get_average_adherence(provider=None):
     if not provider:
         provider = frappe.session.user
     
-    # Get all patients
-    patients = frappe.get_all("Patient", 
-        filters={"primary_doctor": provider},
-        pluck="name"
-    )
-    
-    if not patients:
-        return 0
-    
-    # Get latest adherence for each patient
-    total_adherence = 0
-    count = 0
-    
-    for patient in patients:
-        adherence = frappe.db.get_value(
-            "Adherence Report",
-            {"patient": patient},
-            "adherence_percentage",
-            order_by="creation desc"
-        )
-        
-        if adherence:
-            total_adherence += adherence
-            count += 1
+    # Latest adherence of every patient from the maintained summary in one aggregate
+    result = frappe.db.sql("""
+        SELECT AVG(pas.adherence_percentage) as avg_adherence, COUNT(*) as count
+        FROM `tabPatient` p
+        INNER JOIN `tabPatient Adherence Summary` pas ON pas.patient = p.name
+        WHERE p.primary_doctor = %s
+        AND pas.adherence_percentage > 0
+    """, (provider,), as_dict=True)
     
-    if count == 0:
+    if not result or not result[0].count:
         return 0
     
-    avg = round(total_adherence / count, 1)
+    avg = round(result[0].avg_adherence, 1)
     
     return {
         "value": avg,
@@ -167,12 +155,12 @@ def get_period_adherence(provider, start_date, end_date):
     if not patients:
         return 0
     
-    # Get adherence reports in period
-    reports = frappe.get_all("Adherence Report",
+    # Nightly snapshots taken in the period (Adherence Report only keeps the latest)
+    reports = frappe.get_all("Adherence Report Snapshot",
         filters={
             "patient": ["in", patients],
-            "start_date": [">=", start_date],
-            "end_date": ["<=", end_date]
+            "report_period": "Monthly",
+            "snapshot_date": ["between", [start_date, end_date]]
         },
         fields=["adherence_percentage"]
     )
@@ -250,22 +238,10 @@ def get_adherence_distribution(provider=None):
     # Get all patients with latest adherence
     data = frappe.db.sql("""
         SELECT 
-            CASE
-                WHEN ar.adherence_percentage >= 80 THEN 'High'
-                WHEN ar.adherence_percentage >= 50 THEN 'Medium'
-                ELSE 'Low'
-            END as level,
+            IFNULL(pas.band, 'Low') as level,
             COUNT(*) as count
         FROM `tabPatient` p
-        LEFT JOIN (
-            SELECT patient, adherence_percentage
-            FROM `tabAdherence Report` ar1
-            WHERE creation = (
-                SELECT MAX(creation)
-                FROM `tabAdherence Report` ar2
-                WHERE ar2.patient = ar1.patient
-            )
-        ) ar ON ar.patient = p.name
+        LEFT JOIN `tabPatient Adherence Summary` pas ON pas.patient = p.name
         WHERE p.primary_doctor = %s
         GROUP BY level
     """, (provider,), as_dict=True)
@@ -310,21 +286,15 @@ def get_my_patients_detailed(filter_by=None, sort_by="adherence"):
             p.date_of_birth,
             p.gender,
             GROUP_CONCAT(pcd.chronic_disease SEPARATOR ', ') as chronic_diseases,
-            ar.adherence_percentage,
-            ar.report_period,
+            pas.adherence_percentage,
+            pas.report_period,
+            pas.risk_score,
+            pas.risk_reasons,
             COUNT(DISTINCT ms.name) as medication_count,
             MAX(mc.creation) as last_consultation
         FROM `tabPatient` p
         LEFT JOIN `tabPatient Chronic Disease` pcd ON pcd.parent = p.name
-        LEFT JOIN (
-            SELECT patient, adherence_percentage, report_period
-            FROM `tabAdherence Report` ar1
-            WHERE creation = (
-                SELECT MAX(creation)
-                FROM `tabAdherence Report` ar2
-                WHERE ar2.patient = ar1.patient
-            )
-        ) ar ON ar.patient = p.name
+        LEFT JOIN `tabPatient Adherence Summary` pas ON pas.patient = p.name
         LEFT JOIN `tabMedication Schedule` ms ON ms.patient = p.name AND ms.is_active = 1
         LEFT JOIN `tabMedical Consultation` mc ON mc.patient = p.name
         WHERE p.primary_doctor = %s
@@ -336,6 +306,8 @@ def get_my_patients_detailed(filter_by=None, sort_by="adherence"):
         patients = [p for p in patients if p.adherence_percentage and p.adherence_percentage >= 80]
     elif filter_by == "low_adherence":
         patients = [p for p in patients if p.adherence_percentage and p.adherence_percentage < 70]
+    elif filter_by == "high_risk":
+        patients = [p for p in patients if (p.risk_score or 0) >= HIGH_RISK_SCORE]
     elif filter_by == "new":
         thirty_days_ago = (datetime.now() - timedelta(days=30)).date()
         patients = [p for p in patients if p.creation and p.creation.date() >= thirty_days_ago]
@@ -376,15 +348,24 @@ def get_my_patients_detailed(filter_by=None, sort_by="adherence"):
         patients.sort(key=lambda x: x.patient_name)
     elif sort_by == "last_consultation":
         patients.sort(key=lambda x: x.last_consultation or datetime.min, reverse=True)
+    elif sort_by == "risk":
+        patients.sort(key=lambda x: x.risk_score or 0, reverse=True)
     
     return patients
 
 @frappe.whitelist()
-def get_pending_consultations_detailed():
-    """Get pending consultations with full details and priority"""
+def get_pending_consultations_detailed(sort_by="priority", min_risk=None):
+    """Get pending consultations with full details and priority
+    
+    sort_by "risk" triages by the patient's nightly adherence risk score first
+    """
     
     provider = frappe.session.user
     
+    order_by = "FIELD(c.priority, 'High', 'Medium', 'Low'), c.creation ASC"
+    if sort_by == "risk":
+        order_by = "IFNULL(pas.risk_score, 0) DESC, " + order_by
+    
     consultations = frappe.db.sql("""
         SELECT 
             c.name,
@@ -396,15 +377,20 @@ def get_pending_consultations_detailed():
             p.patient_name,
             p.mobile,
             p.name as patient_id,
+            pas.risk_score,
+            pas.risk_reasons,
             TIMESTAMPDIFF(HOUR, c.creation, NOW()) as hours_ago
         FROM `tabMedical Consultation` c
         LEFT JOIN `tabPatient` p ON c.patient = p.name
-        WHERE c.provider = %s
+        LEFT JOIN `tabPatient Adherence Summary` pas ON pas.patient = c.patient
+        WHERE c.provider = %(provider)s
         AND c.status = 'Pending'
-        ORDER BY 
-            FIELD(c.priority, 'High', 'Medium', 'Low'),
-            c.creation ASC
-    """, (provider,), as_dict=True)
+        AND IFNULL(pas.risk_score, 0) >= %(min_risk)s
+        ORDER BY {order_by}
+    """.format(order_by=order_by), {
+        "provider": provider,
+        "min_risk": flt(min_risk)
+    }, as_dict=True)
     
     # Add formatting
     for cons in consultations:
@@ -0,0 +1,44 @@
+# my_medicinal/my_medicinal/api/provider_insights.py
+
+import frappe
+from frappe.utils import cint
+
+from my_medicinal.my_medicinal import dose_analytics
+
+
+@frappe.whitelist()
+def get_dose_heatmap(days=30):
+    """Taken doses by weekday and hour across the provider's patients"""
+    
+    provider = frappe.session.user
+    
+    return dose_analytics.get_hour_heatmap(provider, cint(days) or 30)
+
+@frappe.whitelist()
+def get_dose_lateness(days=30):
+    """Percentiles of minutes between scheduled and actual intake"""
+    
+    provider = frappe.session.user
+    
+    return dose_analytics.get_lateness_percentiles(provider, cint(days) or 30)
+
+@frappe.whitelist()
+def get_medication_on_time_rates(days=30):
+    """Adherence and on-time rate per medication, worst first"""
+    
+    provider = frappe.session.user
+    
+    return dose_analytics.get_on_time_rates(provider, cint(days) or 30)
+
+@frappe.whitelist()
+def get_dose_insights(days=30):
+    """Heatmap, lateness and per-medication rates in one call"""
+    
+    provider = frappe.session.user
+    days = cint(days) or 30
+    
+    return {
+        "heatmap": dose_analytics.get_hour_heatmap(provider, days),
+        "lateness": dose_analytics.get_lateness_percentiles(provider, days),
+        "medications": dose_analytics.get_on_time_rates(provider, days)
+    }
@@ -567,17 +567,17 @@ def _send_message_notification(consultation, sender_type, message, message_type)
         else:
             notif_message = f"Sent a {message_type}"
 
-        # Create notification log
-        notification = frappe.get_doc({
-            "doctype": "Notification Log",
-            "subject": f"New message from {sender_name}",
-            "email_content": notif_message,
-            "for_user": frappe.session.user,
-            "type": "Alert",
-            "document_type": "Medical Consultation",
-            "document_name": consultation.name
-        })
-        notification.insert(ignore_permissions=True)
+        # Create notification log (through the outbox, delivered after this request commits)
+        from my_medicinal.my_medicinal.outbox import enqueue
+
+        enqueue(
+            frappe.session.user,
+            f"New message from {sender_name}",
+            notif_message,
+            document_type="Medical Consultation",
+            document_name=consultation.name,
+            event_type="chat_message"
+        )
 
         # Send push notification if FCM is enabled
         # This will integrate with existing FCM setup in hooks.py
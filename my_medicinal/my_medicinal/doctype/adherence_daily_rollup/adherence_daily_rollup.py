@@ -0,0 +1,19 @@
+# Copyright (c) 2026, mohammedsuliman and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class AdherenceDailyRollup(Document):
+    pass
+
+
+def on_doctype_update():
+    """One row per (patient, schedule, day); adherence readers scan by patient and date"""
+    frappe.db.add_unique(
+        "Adherence Daily Rollup",
+        ["patient", "medication_schedule", "rollup_date"],
+        constraint_name="unique_patient_schedule_date"
+    )
+    frappe.db.add_index("Adherence Daily Rollup", ["patient", "rollup_date"])
+    frappe.db.add_index("Adherence Daily Rollup", ["rollup_date"])
@@ -0,0 +1,14 @@
+# Copyright (c) 2026, mohammedsuliman and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class AdherenceReportSnapshot(Document):
+    pass
+
+
+def on_doctype_update():
+    """History and trend queries read a patient's snapshots by date"""
+    frappe.db.add_index("Adherence Report Snapshot", ["patient", "snapshot_date"])
+    frappe.db.add_index("Adherence Report Snapshot", ["snapshot_date"])
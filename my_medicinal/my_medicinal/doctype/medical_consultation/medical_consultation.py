@@ -91,6 +91,14 @@ class MedicalConsultation(Document):
         self.status = "Cancelled"
 
 
+def on_doctype_update():
+    """Cursor pages of consultations by date: all, or by patient, provider or status"""
+    frappe.db.add_index("Medical Consultation", ["consultation_date", "name"])
+    frappe.db.add_index("Medical Consultation", ["patient", "consultation_date", "name"])
+    frappe.db.add_index("Medical Consultation", ["healthcare_provider", "consultation_date", "name"])
+    frappe.db.add_index("Medical Consultation", ["status", "consultation_date", "name"])
+
+
 # ============================================
 # API Functions
 # ============================================
@@ -143,9 +151,9 @@ def create_consultation(patient, healthcare_provider, consultation_type,consulta
 
 @frappe.whitelist()
 def get_consultations(patient_id=None, provider_id=None, status=None, 
-                     from_date=None, to_date=None):
+                     from_date=None, to_date=None, limit=None, cursor=None):
     """
-    Get list of consultations with filters
+    Get list of consultations with filters, newest first
     
     Args:
         patient_id: Filter by patient
@@ -153,10 +161,14 @@ def get_consultations(patient_id=None, provider_id=None, status=None,
         status: Filter by status
         from_date: Start date filter
         to_date: End date filter
+        limit: Page size; without limit and cursor every match is returned
+        cursor: next_cursor of the previous page
     
     Returns:
-        List of consultations
+        One page of consultations (next_cursor is set on the response)
     """
+    from my_medicinal.my_medicinal.pagination import as_response, paginate
+    
     filters = {}
     
     if patient_id:
@@ -177,26 +189,39 @@ def get_consultations(patient_id=None, provider_id=None, status=None,
         else:
             filters["consultation_date"] = ["<=", to_date]
     
-    consultations = frappe.get_all(
+    fields = [
+        "name",
+        "patient",
+        "patient_name",
+        "healthcare_provider",
+        "provider_name",
+        "consultation_type",
+        "consultation_date",
+        "status",
+        "priority",
+        "consultation_fee",
+        "payment_status"
+    ]
+    
+    # Callers that send neither limit nor cursor keep the unpaged list
+    if not limit and not cursor:
+        return frappe.get_all(
+            "Medical Consultation",
+            filters=filters,
+            fields=fields,
+            order_by="consultation_date desc, name desc"
+        )
+    
+    page = paginate(
         "Medical Consultation",
         filters=filters,
-        fields=[
-            "name",
-            "patient",
-            "patient_name",
-            "healthcare_provider",
-            "provider_name",
-            "consultation_type",
-            "consultation_date",
-            "status",
-            "priority",
-            "consultation_fee",
-            "payment_status"
-        ],
-        order_by="consultation_date desc"
+        fields=fields,
+        sort_field="consultation_date",
+        cursor=cursor,
+        page_size=limit
     )
     
-    return consultations
+    return as_response(page)
 
 
 @frappe.whitelist()
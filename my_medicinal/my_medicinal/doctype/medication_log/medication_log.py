@@ -72,17 +72,20 @@ class MedicationLog(Document):
     def _decrease_stock(self):
         """Decrease stock in Medication Schedule"""
         try:
-            med_schedule = frappe.get_doc("Medication Schedule", self.medication_schedule)
+            from my_medicinal.my_medicinal.stock import decrement_stock
             
-            if med_schedule.current_stock > 0:
-                med_schedule.current_stock -= 1
-                med_schedule.save(ignore_permissions=True)
-                
+            # Appends a Dose movement instead of saving the Medication Schedule
+            stock = decrement_stock(
+                self.medication_schedule, 1,
+                reference_doctype="Medication Log", reference_name=self.name
+            )
+            
+            if stock and stock.current_stock > 0:
                 frappe.msgprint(
-                    f"Stock updated: {med_schedule.current_stock} {med_schedule.stock_unit} remaining",
+                    f"Stock updated: {stock.current_stock} remaining",
                     indicator="green"
                 )
-            else:
+            elif stock:
                 frappe.msgprint(
                     "Warning: Medication stock is 0",
                     indicator="orange"
@@ -103,24 +106,27 @@ class MedicationLog(Document):
             self.send_missed_notification()
     
     def send_missed_notification(self):
-        """Send notification for missed medication"""
-        patient = frappe.get_doc("patient", self.patient)
+        """Queue a missed medication notice for the patient's nightly digest"""
+        from my_medicinal.my_medicinal.alert_digest import add_alert
         
-        if patient.user:
-            frappe.get_doc({
-                "doctype": "Notification Log",
-                "subject": f"Missed Medication: {self.medication_name}",
-                "for_user": patient.user,
-                "type": "Alert",
-                "document_type": "Medication Log",
-                "document_name": self.name,
-                "email_content": f"""
-                    <p>Dear {patient.patient_name},</p>
-                    <p>You missed your medication <strong>{self.medication_name}</strong>.</p>
-                    <p>Scheduled time: {self.scheduled_time}</p>
-                    <p>Please try to maintain your medication schedule for better health outcomes.</p>
-                """
-            }).insert(ignore_permissions=True)
+        # Several misses of the same medication on one day collapse into one notice
+        add_alert(
+            self.patient, "missed",
+            f"{self.medication_schedule}|{get_datetime(self.scheduled_time).date()}", "Missed",
+            f"Missed Medication: {self.medication_name}",
+            f"You missed {self.medication_name} scheduled at {self.scheduled_time}. "
+            "Please try to maintain your medication schedule for better health outcomes.",
+            document_type="Medication Log", document_name=self.name,
+            remember=False
+        )
+
+
+def on_doctype_update():
+    """Per-patient time-range reads and cursor pages, incremental loads of dose analytics and archiving by age"""
+    frappe.db.add_index("Medication Log", ["patient", "scheduled_time", "name"])
+    frappe.db.add_index("Medication Log", ["medication_schedule", "scheduled_time", "name"])
+    frappe.db.add_index("Medication Log", ["patient", "modified"])
+    frappe.db.add_index("Medication Log", ["scheduled_time"])
 
 
 # API Functions
@@ -169,30 +175,39 @@ def log_medication(
 
 
 @frappe.whitelist()
-def get_medication_history(patient_id, medication_schedule_id=None, days=30):
-    """Get medication log history"""
+def get_medication_history(patient_id, medication_schedule_id=None, days=30, limit=None, cursor=None):
+    """
+    Get medication log history, newest first
     
-    from datetime import datetime, timedelta
-    
-    filters = {
-        "patient": patient_id,
-        "scheduled_time": [">=", (datetime.now() - timedelta(days=int(days))).strftime("%Y-%m-%d")]
-    }
+    With limit or cursor one page is returned per call (next_cursor is set on
+    the response); without either, every log of the range is returned.
+    """
     
-    if medication_schedule_id:
-        filters["medication_schedule"] = medication_schedule_id
-    
-    logs = frappe.get_all("Medication Log",
-        filters=filters,
-        fields=[
-            "name", "medication_name", "scheduled_time",
-            "actual_time", "status", "was_on_time",
-            "time_difference", "skip_reason", "notes"
-        ],
-        order_by="scheduled_time desc"
+    from datetime import datetime, timedelta
+    from my_medicinal.my_medicinal.log_archive import get_logs, get_logs_page
+    from my_medicinal.my_medicinal.pagination import as_response
+    
+    from_time = (datetime.now() - timedelta(days=int(days))).strftime("%Y-%m-%d")
+    fields = [
+        "name", "medication_name", "scheduled_time",
+        "actual_time_taken as actual_time", "status", "was_on_time",
+        "time_difference", "skip_reason", "notes"
+    ]
+    
+    # Ranges older than the archive horizon are streamed from the archive files
+    if not limit and not cursor:
+        return get_logs(patient_id, from_time, fields, medication_schedule=medication_schedule_id)
+    
+    page = get_logs_page(
+        patient_id,
+        from_time,
+        fields=fields,
+        cursor=cursor,
+        page_size=limit,
+        medication_schedule=medication_schedule_id
     )
     
-    return logs
+    return as_response(page)
 
 
 @frappe.whitelist()
@@ -200,19 +215,13 @@ def get_adherence_stats(patient_id, days=30):
     """Calculate adherence statistics"""
     
     from datetime import datetime, timedelta
+    from my_medicinal.my_medicinal.adherence_rollup import get_totals
     
-    # Get logs from last X days
-    start_date = (datetime.now() - timedelta(days=int(days))).strftime("%Y-%m-%d")
+    # Sum the daily rollups of the last X days
+    start_date = (datetime.now() - timedelta(days=int(days))).date()
+    totals = get_totals(patient_id, start_date)
     
-    logs = frappe.get_all("Medication Log",
-        filters={
-            "patient": patient_id,
-            "scheduled_time": [">=", start_date]
-        },
-        fields=["status", "was_on_time"]
-    )
-    
-    if not logs:
+    if not totals.scheduled_doses:
         return {
             "total_doses": 0,
             "taken": 0,
@@ -222,11 +231,11 @@ def get_adherence_stats(patient_id, days=30):
             "on_time_rate": 0
         }
     
-    total = len(logs)
-    taken = len([l for l in logs if l.status == "Taken"])
-    missed = len([l for l in logs if l.status == "Missed"])
-    skipped = len([l for l in logs if l.status == "Skipped"])
-    on_time = len([l for l in logs if l.was_on_time])
+    total = totals.scheduled_doses
+    taken = totals.taken_doses
+    missed = totals.missed_doses
+    skipped = totals.skipped_doses
+    on_time = totals.on_time_doses
     
     adherence_rate = (taken / total * 100) if total > 0 else 0
     on_time_rate = (on_time / taken * 100) if taken > 0 else 0
@@ -354,26 +363,20 @@ def get_weekly_adherence_chart(patient_id):
     """Get adherence data for weekly chart"""
     
     from datetime import datetime, timedelta
+    from my_medicinal.my_medicinal.adherence_rollup import get_daily_totals
     
     data = []
     
+    # One query for the whole week
+    first_date = (datetime.now() - timedelta(days=6)).date()
+    daily = get_daily_totals(patient_id, first_date, datetime.now().date())
+    
     for i in range(7):
-        date = (datetime.now() - timedelta(days=6-i)).date()
-        
-        # Count logs for this date
-        logs = frappe.get_all("Medication Log",
-            filters={
-                "patient": patient_id,
-                "scheduled_time": ["between", [
-                    f"{date} 00:00:00",
-                    f"{date} 23:59:59"
-                ]]
-            },
-            fields=["status"]
-        )
+        date = first_date + timedelta(days=i)
+        totals = daily.get(date)
         
-        total = len(logs)
-        taken = len([l for l in logs if l.status == "Taken"])
+        total = totals.scheduled_doses if totals else 0
+        taken = totals.taken_doses if totals else 0
         adherence = (taken / total * 100) if total > 0 else 0
         
         data.append({
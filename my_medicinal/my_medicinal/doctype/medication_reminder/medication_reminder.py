@@ -1,8 +1,13 @@
 # Copyright (c) 2025, mohammedsuliman and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 class MedicationReminder(Document):
 	pass
+
+
+def on_doctype_update():
+	# Reminder ticks load every reminder sent for the window's dates and schedules in one query
+	frappe.db.add_index("Medication Reminder", ["reminder_date", "medication_schedule"])
@@ -12,10 +12,12 @@ class MedicationSchedule(Document):
     def validate(self):
         """Validation on save"""
         self.validate_times()
+        self.assign_ledger_slots()
         self.validate_dates()
         self.validate_stock()
         self.calculate_daily_consumption()
         self.calculate_days_until_depletion()
+        self.record_stock_edit()
 
     def validate_times(self):
         """Validate medication times"""
@@ -27,6 +29,12 @@ class MedicationSchedule(Document):
         if len(times_list) != len(set(times_list)):
             frappe.throw("Duplicate medication times found")
 
+    def assign_ledger_slots(self):
+        """Durable sent-ledger bit offset for each dose time"""
+        from my_medicinal.my_medicinal.reminder_ledger import assign_slots
+
+        assign_slots(self.times)
+
     def validate_dates(self):
         """Validate start and end dates"""
         if self.start_date:
@@ -59,21 +67,12 @@ class MedicationSchedule(Document):
     #-------------------------------------------------
     def calculate_daily_consumption(self):
         """Calculate daily consumption based on dosage and frequency"""
-        # Parse dosage (e.g., "500mg" -> 1 tablet)
-        # For simplicity, we assume 1 dose per time
-        dosage_per_time = 1
-
-        # Parse dosage if it contains a number
-        import re
-        if self.dosage:
-            numbers = re.findall(r'\d+', self.dosage)
-            if numbers:
-                dosage_per_time = float(numbers[0]) / float(numbers[0])  # Normalize to 1
-
-        # Calculate based on number of times per day
+        # Same formula as the nightly forecast, so both write the same value
+        from my_medicinal.my_medicinal.stock_forecast import get_daily_consumption
+
         times_per_day = len(self.times) if self.times else 0
 
-        self.daily_consumption = dosage_per_time * times_per_day
+        self.daily_consumption = get_daily_consumption(self.dosage, self.frequency, times_per_day)
 
     #____________________________________________________
 
@@ -86,6 +85,13 @@ class MedicationSchedule(Document):
             self.days_until_depletion = 0
 
 
+    def record_stock_edit(self):
+        """Keep the Stock Movement ledger in step with a direct stock edit"""
+        if not self.is_new() and self.has_value_changed("current_stock"):
+            from my_medicinal.my_medicinal.stock import absorb_stock_edit
+            absorb_stock_edit(self)
+
+
     #-------------------------------
 
     def after_insert(self):
@@ -110,50 +116,51 @@ class MedicationSchedule(Document):
 
     def send_low_stock_alert(self):
         """Send low stock alert"""
+        from my_medicinal.my_medicinal.outbox import enqueue
+
         patient = frappe.get_doc("patient", self.patient)
 
-        # Create notification
-        frappe.get_doc({
-            "doctype": "Notification Log",
-            "subject": f"Low Stock Alert: {self.medication_name}",
-            "for_user": patient.user,
-            "type": "Alert",
-            "document_type": "Medication Schedule",
-            "document_name": self.name,
-            "email_content": f"""
+        # Create notification (delivered by the outbox worker after this transaction commits)
+        enqueue(
+            patient.user,
+            f"Low Stock Alert: {self.medication_name}",
+            f"""
                 <p>Dear {patient.patient_name},</p>
                 <p>Your medication <strong>{self.medication_name}</strong> is running low.</p>
                 <p>Current stock: {self.current_stock} {self.stock_unit}</p>
                 <p>Days remaining: {self.days_until_depletion} days</p>
                 <p>Please order more medication soon.</p>
-            """
-        }).insert(ignore_permissions=True)
+            """,
+            document_type="Medication Schedule",
+            document_name=self.name,
+            event_type="low_stock"
+        )
 
     def refill_stock(self, quantity):
         """Refill medication stock"""
-        self.current_stock += quantity
-        self.calculate_days_until_depletion()
-        self.save()
+        from my_medicinal.my_medicinal.stock import refill_stock
+
+        stock = refill_stock(self.name, quantity)
 
         return {
             "message": "Stock refilled successfully",
-            "new_stock": self.current_stock,
-            "days_until_depletion": self.days_until_depletion
+            "new_stock": stock.current_stock,
+            "days_until_depletion": stock.days_until_depletion
         }
 
     def consume_medication(self):
         """Consume one dose of medication"""
-        if self.current_stock <= 0:
+        from my_medicinal.my_medicinal.stock import decrement_stock, get_current_stock
+
+        if get_current_stock(self.name).current_stock <= 0:
             frappe.throw("No stock available")
 
-        self.current_stock -= 1
-        self.calculate_days_until_depletion()
-        self.save()
+        stock = decrement_stock(self.name, 1)
 
         return {
             "message": "Medication consumed",
-            "remaining_stock": self.current_stock,
-            "days_until_depletion": self.days_until_depletion
+            "remaining_stock": stock.current_stock,
+            "days_until_depletion": stock.days_until_depletion
         }
 
 
@@ -179,8 +186,16 @@ def get_medications(patient_id, active_only=1):
         order_by="medication_name"
     )
 
+    # Snapshot + pending stock movements
+    from my_medicinal.my_medicinal.stock import get_current_stocks
+    stocks = get_current_stocks(med.name for med in medications)
+
     # Get times for each medication
     for med in medications:
+        if med.name in stocks:
+            med.current_stock = stocks[med.name].current_stock
+            med.days_until_depletion = stocks[med.name].days_until_depletion
+
         med['times'] = frappe.get_all("Medication Time",
             filters={"parent": med.name},
             fields=["time", "before_after_meal", "notes"],
@@ -302,14 +317,15 @@ def add_medication(
 @frappe.whitelist()
 def update_stock(schedule_id, new_stock):
     """Update medication stock"""
-    med_schedule = frappe.get_doc("Medication Schedule", schedule_id)
-    med_schedule.current_stock = int(new_stock)
-    med_schedule.save()
+    from my_medicinal.my_medicinal.stock import set_stock
+
+    frappe.has_permission("Medication Schedule", "write", schedule_id, throw=True)
+    stock = set_stock(schedule_id, int(new_stock))
 
     return {
         "message": "Stock updated successfully",
-        "current_stock": med_schedule.current_stock,
-        "days_until_depletion": med_schedule.days_until_depletion
+        "current_stock": stock.current_stock,
+        "days_until_depletion": stock.days_until_depletion
     }
 
 
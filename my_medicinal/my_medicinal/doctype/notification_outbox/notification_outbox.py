@@ -0,0 +1,14 @@
+# Copyright (c) 2026, mohammedsuliman and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class NotificationOutbox(Document):
+    pass
+
+
+def on_doctype_update():
+    """The drain worker claims due rows by status and time, then reads its claim back by token"""
+    frappe.db.add_index("Notification Outbox", ["status", "next_attempt_at"])
+    frappe.db.add_index("Notification Outbox", ["claim_token"])
@@ -0,0 +1,13 @@
+# Copyright (c) 2026, mohammedsuliman and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class PatientAdherenceSummary(Document):
+    pass
+
+
+def on_doctype_update():
+    """Dashboards group and filter a provider's patients by band"""
+    frappe.db.add_index("Patient Adherence Summary", ["band", "adherence_percentage"])
@@ -0,0 +1,14 @@
+# Copyright (c) 2026, mohammedsuliman and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class ScheduledJobRun(Document):
+    pass
+
+
+def on_doctype_update():
+    """Duration trend queries filter by job and start time; retention purges by start time"""
+    frappe.db.add_index("Scheduled Job Run", ["job_name", "started_at"])
+    frappe.db.add_index("Scheduled Job Run", ["started_at"])
@@ -0,0 +1,18 @@
+# Copyright (c) 2026, mohammedsuliman and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+class StockMovement(Document):
+    """Append-only: movements are never edited, corrections are new movements"""
+
+    def validate(self):
+        if not self.is_new():
+            frappe.throw(_("Stock Movements cannot be changed"))
+
+
+def on_doctype_update():
+    """Pending movements of a schedule are read by (medication_schedule, name > watermark)"""
+    frappe.db.add_index("Stock Movement", ["medication_schedule", "name"])
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Dose Analytics
+Columnar, in-process cache of Medication Log rows for provider insights.
+
+Each provider panel (patients whose primary_doctor is the provider) is
+held as NumPy columns: patient, schedule and medication codes, scheduled
+and actual times, status, was_on_time and time_difference. The first
+request loads the last WINDOW_DAYS of logs. Later requests append or
+overwrite only the logs modified since the last load, checked at most
+every REFRESH_SECONDS. Heatmaps, lateness percentiles and on-time rates
+are then answered with vectorized reductions instead of SQL per request.
+
+The cache lives in each worker process and holds at most MAX_PANELS
+panels, evicting the least recently used.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import frappe
+from frappe.utils import add_days, cint, now_datetime
+
+WINDOW_DAYS = 90
+REFRESH_SECONDS = 30
+MAX_PANELS = 64
+
+STATUSES = ("Scheduled", "Taken", "Missed", "Skipped", "Reminder Sent")
+TAKEN = STATUSES.index("Taken")
+
+LATENESS_PERCENTILES = (50, 75, 90, 95, 99)
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+LOG_FIELDS = (
+    "name", "patient", "medication_schedule", "medication_name",
+    "scheduled_time", "actual_time_taken", "status", "was_on_time",
+    "time_difference", "modified"
+)
+
+_panels = OrderedDict()
+_panels_lock = threading.Lock()
+
+
+# ============================================
+# AGGREGATES
+# ============================================
+
+def get_hour_heatmap(provider, days=30):
+    """
+    Taken doses by weekday and hour of the actual intake time
+
+    Returns:
+        dict with weekdays, hours and matrix (7 x 24 counts, Monday first)
+    """
+    import numpy as np
+
+    panel = get_panel(provider)
+    with panel.lock:
+        rows = panel.select(days) & (panel.column("status") == TAKEN)
+        actual = panel.column("actual")[rows]
+        actual = actual[~np.isnat(actual)]
+
+        seconds = actual.astype("datetime64[s]").astype(np.int64)
+        day_number = np.floor_divide(seconds, 86400)
+        hour = np.floor_divide(np.mod(seconds, 86400), 3600)
+        # 1970-01-01 was a Thursday
+        weekday = np.mod(day_number + 3, 7)
+
+        matrix = np.bincount(weekday * 24 + hour, minlength=7 * 24).reshape(7, 24)
+
+    return {
+        "weekdays": list(WEEKDAYS),
+        "hours": list(range(24)),
+        "matrix": matrix.tolist(),
+        "total": int(matrix.sum())
+    }
+
+
+def get_lateness_percentiles(provider, days=30, percentiles=LATENESS_PERCENTILES):
+    """
+    Percentiles of time_difference (minutes after the scheduled time) of taken doses
+
+    Returns:
+        dict with count, mean and percentiles ({"p50": minutes, ...})
+    """
+    import numpy as np
+
+    panel = get_panel(provider)
+    with panel.lock:
+        rows = panel.select(days) & (panel.column("status") == TAKEN)
+        lateness = panel.column("lateness")[rows]
+        lateness = lateness[~np.isnan(lateness)]
+
+    if not len(lateness):
+        return {"count": 0, "mean": None, "percentiles": {f"p{p}": None for p in percentiles}}
+
+    values = np.percentile(lateness, percentiles)
+
+    return {
+        "count": int(len(lateness)),
+        "mean": round(float(lateness.mean()), 1),
+        "percentiles": {f"p{p}": round(float(value), 1) for p, value in zip(percentiles, values)}
+    }
+
+
+def get_on_time_rates(provider, days=30):
+    """
+    Adherence and on-time rate per medication across the panel
+
+    Only doses whose scheduled time has passed are counted.
+
+    Returns:
+        List of dicts with medication_name, scheduled, taken, on_time,
+        adherence (taken / scheduled) and on_time_rate (on_time / taken),
+        sorted by on_time_rate ascending
+    """
+    import numpy as np
+
+    panel = get_panel(provider)
+    with panel.lock:
+        rows = panel.select(days) & (panel.column("scheduled") <= np.datetime64(now_datetime(), "s"))
+        medication = panel.column("medication")[rows]
+        taken = panel.column("status")[rows] == TAKEN
+        on_time = taken & panel.column("on_time")[rows]
+        medication_names = list(panel.medications)
+
+    size = len(medication_names)
+    scheduled_counts = np.bincount(medication, minlength=size)
+    taken_counts = np.bincount(medication, weights=taken, minlength=size)
+    on_time_counts = np.bincount(medication, weights=on_time, minlength=size)
+
+    rates = []
+    for code in np.flatnonzero(scheduled_counts):
+        scheduled = int(scheduled_counts[code])
+        taken_doses = int(taken_counts[code])
+        on_time_doses = int(on_time_counts[code])
+
+        rates.append({
+            "medication_name": medication_names[code],
+            "scheduled": scheduled,
+            "taken": taken_doses,
+            "on_time": on_time_doses,
+            "adherence": round(taken_doses / scheduled * 100, 1),
+            "on_time_rate": round(on_time_doses / taken_doses * 100, 1) if taken_doses else 0
+        })
+
+    rates.sort(key=lambda rate: (rate["on_time_rate"], -rate["scheduled"]))
+    return rates
+
+
+# ============================================
+# CACHE
+# ============================================
+
+def get_panel(provider):
+    """
+    Cached panel of a provider, loaded on first use and refreshed incrementally
+    """
+    key = (frappe.local.site, provider)
+
+    with _panels_lock:
+        panel = _panels.get(key)
+        if panel:
+            _panels.move_to_end(key)
+        else:
+            panel = _panels[key] = DosePanel(provider)
+            while len(_panels) > MAX_PANELS:
+                _panels.popitem(last=False)
+
+    with panel.lock:
+        panel.refresh()
+
+    return panel
+
+
+def clear_cache(provider=None):
+    """Drop cached panels (all of this site's, or one provider's)"""
+    with _panels_lock:
+        for key in list(_panels):
+            if key[0] == frappe.local.site and (not provider or key[1] == provider):
+                del _panels[key]
+
+
+class DosePanel:
+    """Medication Log columns of one provider's patients"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.lock = threading.Lock()
+        self.patients = None
+        self.checked_at = 0
+        self._reset()
+
+    def column(self, name):
+        """Filled part of a column"""
+        return self.columns[name][:self.size]
+
+    def select(self, days):
+        """Mask of rows scheduled within the last `days` days"""
+        import numpy as np
+
+        since = np.datetime64(add_days(now_datetime(), -min(cint(days) or 1, WINDOW_DAYS)), "s")
+        return self.column("scheduled") >= since
+
+    def refresh(self):
+        if time.monotonic() - self.checked_at < REFRESH_SECONDS:
+            return
+
+        patients = frozenset(frappe.get_all(
+            "Patient",
+            filters={"primary_doctor": self.provider},
+            pluck="name"
+        ))
+
+        # Panel membership changed or the window start drifted a day: reload everything
+        window_start = add_days(now_datetime(), -WINDOW_DAYS)
+        if patients != self.patients or not self.loaded_from or (window_start - self.loaded_from).days >= 1:
+            self._reset()
+            self.patients = patients
+            self.loaded_from = window_start
+            self._append(self._fetch(scheduled_after=window_start))
+        else:
+            self._append(self._fetch(modified_since=self.watermark))
+
+        self.checked_at = time.monotonic()
+
+    def _reset(self):
+        import numpy as np
+
+        self.size = 0
+        self.index = {}
+        self.patient_codes = {}
+        self.schedule_codes = {}
+        self.medication_codes = {}
+        self.medications = []
+        self.watermark = None
+        self.loaded_from = None
+        self.columns = {
+            "patient": np.zeros(0, dtype=np.int32),
+            "schedule": np.zeros(0, dtype=np.int32),
+            "medication": np.zeros(0, dtype=np.int32),
+            "scheduled": np.zeros(0, dtype="datetime64[s]"),
+            "actual": np.zeros(0, dtype="datetime64[s]"),
+            "status": np.zeros(0, dtype=np.int8),
+            "on_time": np.zeros(0, dtype=bool),
+            "lateness": np.zeros(0, dtype=np.float64)
+        }
+
+    def _fetch(self, scheduled_after=None, modified_since=None):
+        if not self.patients:
+            return []
+
+        if modified_since:
+            # >= so rows sharing the watermark's timestamp are not lost; re-reads overwrite in place
+            condition = "modified >= %(modified_since)s AND scheduled_time >= %(scheduled_after)s"
+            scheduled_after = self.loaded_from
+        else:
+            condition = "scheduled_time >= %(scheduled_after)s"
+
+        return frappe.db.sql("""
+            SELECT {fields}
+            FROM `tabMedication Log`
+            WHERE patient IN %(patients)s
+            AND {condition}
+        """.format(fields=", ".join(LOG_FIELDS), condition=condition), {
+            "patients": tuple(self.patients),
+            "scheduled_after": scheduled_after,
+            "modified_since": modified_since
+        })
+
+    def _append(self, rows):
+        """Overwrite rows already cached (status changes) and append new ones"""
+        import numpy as np
+
+        rows = [row for row in rows if row[4]]
+        if not rows:
+            return
+
+        names, patients, schedules, medication_names, scheduled, actual, statuses, on_time, lateness, modified = zip(*rows)
+
+        batch = {
+            "patient": _encode(patients, self.patient_codes, np),
+            "schedule": _encode(schedules, self.schedule_codes, np),
+            "medication": _encode(medication_names, self.medication_codes, np),
+            "scheduled": np.array(scheduled, dtype="datetime64[s]"),
+            "actual": np.array(actual, dtype="datetime64[s]"),
+            "status": np.array([STATUSES.index(s) if s in STATUSES else 0 for s in statuses], dtype=np.int8),
+            "on_time": np.array([bool(value) for value in on_time], dtype=bool),
+            "lateness": np.array([np.nan if value is None else value for value in lateness], dtype=np.float64)
+        }
+        self.medications = sorted(self.medication_codes, key=self.medication_codes.get)
+
+        positions = np.array([self.index.get(name, -1) for name in names], dtype=np.int64)
+        existing = positions >= 0
+        new = np.flatnonzero(~existing)
+
+        self._reserve(self.size + len(new))
+        targets = positions.copy()
+        targets[new] = np.arange(self.size, self.size + len(new))
+
+        for column, values in batch.items():
+            self.columns[column][targets] = values
+
+        for offset, i in enumerate(new):
+            self.index[names[i]] = self.size + offset
+
+        self.size += len(new)
+        self.watermark = max(modified) if not self.watermark else max(self.watermark, max(modified))
+
+    def _reserve(self, capacity):
+        """Grow columns geometrically so appends are amortized O(1)"""
+        import numpy as np
+
+        current = len(self.columns["patient"])
+        if capacity <= current:
+            return
+
+        new_capacity = max(capacity, current * 2, 1024)
+        for column, values in self.columns.items():
+            grown = np.empty(new_capacity, dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            self.columns[column] = grown
+
+
+def _encode(values, codes, np):
+    """Map strings to dense integer codes, extending the vocabulary; one lookup per distinct value"""
+    unique, inverse = np.unique(np.array([value or "" for value in values], dtype=object), return_inverse=True)
+    mapped = np.array([codes.setdefault(value, len(codes)) for value in unique], dtype=np.int32)
+    return mapped[inverse]
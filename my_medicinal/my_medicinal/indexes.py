@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Secondary Indexes
+Indexes on tables whose doctype this app does not own (or that several
+modules depend on), created after every migrate. Indexes on the app's own
+doctypes live in each doctype's on_doctype_update.
+"""
+
+import frappe
+
+# Tables queried by paginated endpoints: products by name (optionally in a
+# category), a patient's orders and a user's notifications newest first
+PAGINATION_INDEXES = {
+    "medication_item": [
+        ["is_active", "item_name", "name"],
+        ["is_active", "category", "item_name", "name"]
+    ],
+    "patient_order": [
+        ["patient", "creation", "name"]
+    ],
+    "Notification Log": [
+        ["for_user", "creation", "name"]
+    ]
+}
+
+# (doctype, columns) of indexes an index above or in on_doctype_update replaced
+SUPERSEDED_INDEXES = [
+    ("Notification Log", ["for_user", "creation"]),
+    ("Medical Consultation", ["patient", "consultation_date"]),
+    ("Medical Consultation", ["healthcare_provider", "consultation_date"]),
+    ("Medication Log", ["patient", "scheduled_time"])
+]
+
+
+def ensure_indexes():
+    """
+    Create missing indexes; add_index skips ones that already exist
+    Called by hooks.py: after_migrate
+    """
+    from my_medicinal.my_medicinal.retention import RETENTION_POLICIES
+
+    # Retention purges walk these in (date, name) order
+    for doctype, policy in RETENTION_POLICIES.items():
+        if frappe.db.table_exists(doctype):
+            frappe.db.add_index(doctype, policy.index)
+
+    # Cursor pages (see pagination) seek on (filter columns, sort field, name)
+    for doctype, indexes in PAGINATION_INDEXES.items():
+        if frappe.db.table_exists(doctype):
+            for columns in indexes:
+                frappe.db.add_index(doctype, columns)
+
+    # Unread counts and bulk read-state changes
+    if frappe.db.table_exists("Notification Log"):
+        frappe.db.add_index("Notification Log", ["for_user", "read"])
+
+    # Prefixes of the pagination indexes above
+    for doctype, columns in SUPERSEDED_INDEXES:
+        index_name = frappe.db.get_index_name(columns)
+        if frappe.db.table_exists(doctype) and frappe.db.has_index(f"tab{doctype}", index_name):
+            frappe.db.sql_ddl(f"ALTER TABLE `tab{doctype}` DROP INDEX `{index_name}`")
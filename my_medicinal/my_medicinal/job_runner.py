@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Scheduled Job Runner
+Single-flight execution for scheduler_events entries.
+
+Each run holds a Redis lease lock that a heartbeat thread keeps extending,
+so a crashed worker frees the job once the lease runs out. When the lock is
+taken, the new run is either skipped or coalesced (the running holder runs
+the job once more when it finishes). Every run that executes is recorded
+in the Scheduled Job Run ledger once it finishes; skipped and coalesced
+triggers are not, and the ledger is trimmed by the retention purge.
+"""
+
+import threading
+import time as timer
+from functools import wraps
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+LOCK_KEY = "scheduled_job:lock:{0}"
+PENDING_KEY = "scheduled_job:pending:{0}"
+
+DEFAULT_LEASE_SECONDS = 120
+
+# Extend the lease only while we still own it
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Release the lock only if we still own it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def single_flight(job_name=None, mode="skip", lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Run a scheduled job at most once at a time across all workers
+
+    Args:
+        job_name: Lock and ledger name (defaults to module.function)
+        mode: "skip" drops an overlapping run; "coalesce" asks the running
+            holder to run the job once more after it finishes
+        lease_seconds: Lock lease, extended by a heartbeat while the job runs
+
+    The wrapped job may return an int (rows processed) or a dict with a
+    "rows" key; the count is stored in the ledger.
+    """
+    def decorator(fn):
+        name = job_name or f"{fn.__module__}.{fn.__name__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            lease = JobLease(name, lease_seconds)
+
+            if not lease.acquire():
+                if mode == "coalesce":
+                    frappe.cache().set(_key(PENDING_KEY.format(name)), 1, ex=lease_seconds * 10)
+                return None
+
+            try:
+                result = _run(name, fn, args, kwargs)
+
+                # Overlapping triggers arrived while we ran - serve them with one more pass
+                while mode == "coalesce" and _take_pending(name):
+                    result = _run(name, fn, args, kwargs)
+
+                return result
+            finally:
+                lease.release()
+
+        wrapper.single_flight_job = name
+        return wrapper
+
+    return decorator
+
+
+class JobLease:
+    """Redis lease lock (SET NX PX with an owner token) kept alive by a heartbeat thread"""
+
+    def __init__(self, job_name, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.redis = frappe.cache()
+        self.key = _key(LOCK_KEY.format(job_name))
+        self.lease_ms = cint(lease_seconds) * 1000
+        self.token = frappe.generate_hash(length=20)
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def acquire(self):
+        if not self.redis.set(self.key, self.token, nx=True, px=self.lease_ms):
+            return False
+
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+        return True
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.join(timeout=5)
+
+        self.redis.register_script(RELEASE_SCRIPT)(keys=[self.key], args=[self.token])
+
+    def _beat(self):
+        extend = self.redis.register_script(EXTEND_SCRIPT)
+
+        while not self._stop.wait(self.lease_ms / 3000):
+            try:
+                if not extend(keys=[self.key], args=[self.token, self.lease_ms]):
+                    # Lease lost (expired or taken over) - nothing left to extend
+                    return
+            except Exception:
+                # Redis hiccup; the next beat retries before the lease runs out
+                pass
+
+
+@frappe.whitelist()
+def get_job_durations(job_name=None, days=7):
+    """
+    Get run counts and duration trends per job and day (admin only)
+
+    Args:
+        job_name: Limit to one job
+        days: Number of days to return
+
+    Returns:
+        List of dicts with job_name, run_date, runs, failed,
+        avg/max duration and rows processed
+    """
+    if "System Manager" not in frappe.get_roles():
+        frappe.throw(frappe._("Not authorized"))
+
+    condition = "AND job_name = %(job_name)s" if job_name else ""
+
+    return frappe.db.sql(f"""
+        SELECT
+            job_name,
+            DATE(started_at) as run_date,
+            SUM(outcome IN ('Success', 'Failed')) as runs,
+            SUM(outcome = 'Failed') as failed,
+            ROUND(AVG(CASE WHEN outcome IN ('Success', 'Failed') THEN duration END), 3) as avg_duration,
+            ROUND(MAX(duration), 3) as max_duration,
+            SUM(rows_processed) as rows_processed
+        FROM `tabScheduled Job Run`
+        WHERE started_at >= DATE_SUB(NOW(), INTERVAL %(days)s DAY)
+        {condition}
+        GROUP BY job_name, DATE(started_at)
+        ORDER BY job_name, run_date
+    """, {"job_name": job_name, "days": cint(days) or 7}, as_dict=True)
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _run(name, fn, args, kwargs):
+    started_at = now_datetime()
+    started = timer.monotonic()
+
+    try:
+        result = fn(*args, **kwargs)
+    except Exception:
+        frappe.db.rollback()
+        _record_run(name, "Failed", started_at, started, error=frappe.get_traceback())
+        raise
+
+    _record_run(name, "Success", started_at, started, rows=_rows_processed(result))
+    return result
+
+
+def _record_run(name, outcome, started_at, started, rows=0, error=None):
+    """
+    Write the run's ledger row once the job has finished, so nothing the
+    caller had open is committed before the job runs
+    """
+    try:
+        frappe.get_doc({
+            "doctype": "Scheduled Job Run",
+            "job_name": name,
+            "outcome": outcome,
+            "started_at": started_at,
+            "ended_at": now_datetime(),
+            "duration": timer.monotonic() - started,
+            "rows_processed": rows,
+            "error": error
+        }).insert(ignore_permissions=True)
+        frappe.db.commit()
+    except Exception:
+        # The ledger is diagnostics; never fail (or mask the error of) the job
+        frappe.log_error(frappe.get_traceback(), "Scheduled Job Run Ledger Error")
+
+
+def _rows_processed(result):
+    if isinstance(result, dict):
+        return cint(result.get("rows"))
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return cint(result)
+
+
+def _take_pending(name):
+    pipe = frappe.cache().pipeline()
+    pipe.get(_key(PENDING_KEY.format(name)))
+    pipe.delete(_key(PENDING_KEY.format(name)))
+    pending, _ = pipe.execute()
+    return bool(pending)
+
+
+def _key(name):
+    return frappe.cache().make_key(name)
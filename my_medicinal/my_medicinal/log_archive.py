@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Medication Log Archive
+Moves Medication Log rows older than the archive horizon out of the
+database into gzip JSON Lines files, one file per month of scheduled_time
+and patient bucket (crc32 of the patient name modulo ARCHIVE_BUCKETS):
+
+    sites/<site>/private/archive/medication_log/2026-03/017.jsonl.gz
+
+A reader only opens its patient's bucket for each month it needs. Each
+archiving chunk is appended to its files as new gzip members (readers see
+one continuous stream), flushed to disk and only then deleted from the
+table. A crash between the two leaves rows in both
+places; readers skip names they have already seen.
+
+Rows are deleted with SQL, not through the document, so the Adherence
+Daily Rollup counts they contributed stay in the database. Readers that
+need raw rows for older ranges stream them from the archive.
+"""
+
+import gzip
+import json
+import os
+import zlib
+
+import frappe
+from frappe.utils import add_days, add_to_date, cint, get_datetime, getdate, now_datetime
+
+from my_medicinal.my_medicinal.job_runner import single_flight
+
+DEFAULT_HORIZON_DAYS = 180
+ARCHIVE_CHUNK_SIZE = 5000
+
+# Files per month; part of the layout, so changing it needs a rewrite of
+# the existing files
+ARCHIVE_BUCKETS = 256
+
+# Global default holding the scheduled_time below which logs may be archived
+ARCHIVED_BEFORE_KEY = "medication_log_archived_before"
+
+
+# ============================================
+# ARCHIVING
+# ============================================
+
+@single_flight(lease_seconds=600)
+def archive_medication_logs(horizon_days=None):
+    """
+    Move logs scheduled before the horizon into the monthly archive files
+    Runs daily (tasks.all)
+
+    Args:
+        horizon_days: Keep this many days in the table
+            (defaults to site config medication_log_archive_days, then 180)
+
+    Returns:
+        Number of logs archived
+    """
+    horizon_days = cint(horizon_days) or cint(frappe.conf.get("medication_log_archive_days")) or DEFAULT_HORIZON_DAYS
+    cutoff = get_datetime(add_days(getdate(now_datetime()), -horizon_days))
+
+    # Readers switch to the archive for anything before this point from now on
+    if not get_archived_before() or cutoff > get_archived_before():
+        frappe.db.set_default(ARCHIVED_BEFORE_KEY, str(cutoff))
+        frappe.db.commit()
+
+    archived = 0
+
+    while True:
+        rows = frappe.db.sql("""
+            SELECT *
+            FROM `tabMedication Log`
+            WHERE scheduled_time < %(cutoff)s
+            ORDER BY scheduled_time, name
+            LIMIT %(limit)s
+        """, {"cutoff": cutoff, "limit": ARCHIVE_CHUNK_SIZE}, as_dict=True)
+
+        if not rows:
+            break
+
+        by_file = {}
+        for row in rows:
+            by_file.setdefault(_archive_file(row), []).append(row)
+
+        for path, file_rows in by_file.items():
+            _append(path, file_rows)
+
+        frappe.db.sql(
+            "DELETE FROM `tabMedication Log` WHERE name IN %(names)s",
+            {"names": tuple(row.name for row in rows)}
+        )
+        frappe.db.commit()
+
+        archived += len(rows)
+
+        if len(rows) < ARCHIVE_CHUNK_SIZE:
+            break
+
+    return archived
+
+
+def get_archived_before():
+    """scheduled_time before which logs may live in the archive (None if never archived)"""
+    value = frappe.db.get_default(ARCHIVED_BEFORE_KEY)
+    return get_datetime(value) if value else None
+
+
+# ============================================
+# READING
+# ============================================
+
+def iter_archived_logs(patient, from_time, to_time=None, medication_schedule=None):
+    """
+    Stream a patient's archived logs scheduled in [from_time, to_time)
+
+    Only the patient's bucket file of each month is read, line by line,
+    oldest month first.
+
+    Yields:
+        frappe._dict rows with datetime fields parsed
+    """
+    archived_before = get_archived_before()
+    if not archived_before:
+        return
+
+    from_time = get_datetime(from_time)
+    to_time = min(get_datetime(to_time), archived_before) if to_time else archived_before
+    if from_time >= to_time:
+        return
+
+    seen = set()
+
+    for month in _months_between(from_time, to_time):
+        for row in _iter_month(patient, month, medication_schedule):
+            if row.name in seen or not (from_time <= row.scheduled_time < to_time):
+                continue
+
+            seen.add(row.name)
+            yield row
+
+
+def get_logs(patient, from_time, fields, medication_schedule=None, order_by_desc=True):
+    """
+    Logs of a patient since from_time from the table and, for older ranges, the archive
+
+    Args:
+        fields: Field names to return (archived rows are projected to the same keys)
+
+    Returns:
+        List of dicts ordered by scheduled_time
+    """
+    filters = {"patient": patient, "scheduled_time": [">=", from_time]}
+    if medication_schedule:
+        filters["medication_schedule"] = medication_schedule
+
+    logs = frappe.get_all(
+        "Medication Log",
+        filters=filters,
+        fields=fields,
+        order_by="scheduled_time desc" if order_by_desc else "scheduled_time asc"
+    )
+
+    archived_before = get_archived_before()
+    if not archived_before or get_datetime(from_time) >= archived_before:
+        return logs
+
+    names = {log.name for log in logs}
+    keys = [_field_key(field) for field in fields]
+
+    for row in iter_archived_logs(patient, from_time, medication_schedule=medication_schedule):
+        if row.name in names:
+            continue
+
+        logs.append(frappe._dict({key: row.get(column) for column, key in keys}))
+
+    logs.sort(key=lambda log: get_datetime(log.scheduled_time), reverse=order_by_desc)
+    return logs
+
+
+def get_logs_page(patient, from_time, fields, cursor=None, page_size=None, medication_schedule=None):
+    """
+    One page of a patient's logs since from_time, newest first
+
+    Pages are keyset seeks on (scheduled_time, name) in the table. Once the
+    table has no older rows, the page continues with archived rows below the
+    cursor: the patient's bucket file of the cursor's month first, then one
+    month further back at a time until the page is full.
+
+    Returns:
+        frappe._dict with data and next_cursor (see pagination)
+    """
+    from my_medicinal.my_medicinal import pagination
+
+    page_size = pagination.get_page_size(page_size)
+    fields = list(fields)
+    for field in ("scheduled_time", "name"):
+        if field not in fields:
+            fields.append(field)
+
+    filters = {"patient": patient, "scheduled_time": [">=", from_time]}
+    if medication_schedule:
+        filters["medication_schedule"] = medication_schedule
+
+    page = pagination.paginate(
+        "Medication Log",
+        filters=filters,
+        fields=fields,
+        sort_field="scheduled_time",
+        cursor=cursor,
+        page_size=page_size
+    )
+
+    archived_before = get_archived_before()
+    from_time = get_datetime(from_time)
+    if page.next_cursor or not archived_before or from_time >= archived_before:
+        return page
+
+    # Every table row below the cursor is in this page; fill it with archived
+    # rows, reading the patient's months newest first from the cursor's month
+    position = pagination.decode_cursor(cursor)
+    if position:
+        position = (get_datetime(position[0]), position[1])
+
+    if position and position[0] < archived_before:
+        upper = position[0]
+    else:
+        upper = add_to_date(archived_before, seconds=-1)
+    names = {row.name for row in page.data}
+    keys = [_field_key(field) for field in fields]
+    rows = list(page.data)
+
+    for month in reversed(list(_months_between(from_time, upper))):
+        month_rows = []
+
+        for row in _iter_month(patient, month, medication_schedule):
+            if row.name in names or not (from_time <= row.scheduled_time < archived_before):
+                continue
+            if position and (row.scheduled_time, row.name) >= position:
+                continue
+
+            names.add(row.name)
+            month_rows.append(frappe._dict({key: row.get(column) for column, key in keys}))
+
+        rows.extend(month_rows)
+
+        # Older months only hold older rows: stop once page_size + 1 rows are
+        # at or after this month's start
+        month_start = get_datetime(f"{month}-01")
+        if len([row for row in rows if get_datetime(row.scheduled_time) >= month_start]) > page_size:
+            break
+
+    rows.sort(key=lambda row: (get_datetime(row.scheduled_time), row.name), reverse=True)
+    return pagination.make_page(rows, page_size, "scheduled_time")
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def get_archive_path(*parts):
+    return frappe.get_site_path("private", "archive", "medication_log", *parts)
+
+
+def _iter_month(patient, month, medication_schedule=None):
+    """Rows of a patient in one month's bucket file (duplicates included)"""
+    path = _bucket_path(month, _bucket(patient))
+    if not os.path.exists(path):
+        return
+
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            row = json.loads(line)
+
+            if row["patient"] != patient:
+                continue
+            if medication_schedule and row["medication_schedule"] != medication_schedule:
+                continue
+
+            row["scheduled_time"] = get_datetime(row["scheduled_time"])
+            if row.get("actual_time_taken"):
+                row["actual_time_taken"] = get_datetime(row["actual_time_taken"])
+
+            yield frappe._dict(row)
+
+
+def _append(path, rows):
+    """Append rows to an archive file as one gzip member, durably"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    lines = "".join(json.dumps(row, default=str, separators=(",", ":")) + "\n" for row in rows)
+
+    with open(path, "ab") as archive:
+        archive.write(gzip.compress(lines.encode("utf-8")))
+        archive.flush()
+        os.fsync(archive.fileno())
+
+
+def _month(value):
+    return get_datetime(value).strftime("%Y-%m")
+
+
+def _bucket(patient):
+    return zlib.crc32((patient or "").encode("utf-8")) % ARCHIVE_BUCKETS
+
+
+def _bucket_path(month, bucket):
+    return get_archive_path(month, f"{bucket:03d}.jsonl.gz")
+
+
+def _archive_file(row):
+    return _bucket_path(_month(row["scheduled_time"]), _bucket(row["patient"]))
+
+
+def _months_between(from_time, to_time):
+    year, month = from_time.year, from_time.month
+
+    while (year, month) <= (to_time.year, to_time.month):
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _field_key(field):
+    """("actual_time_taken", "actual_time") for "actual_time_taken as actual_time" """
+    parts = field.split(" as ")
+    return (parts[0].strip(), parts[-1].strip())
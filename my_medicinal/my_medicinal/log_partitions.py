@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+API Request Log Partitions
+RANGE COLUMNS partitioning of `tabAPI Request Log` on `timestamp`, one
+partition per day or week.
+
+    p_before      rows older than the first partition at conversion time
+    pYYYYMMDD     rows with timestamp < that date (upper bound)
+    p_future      MAXVALUE catch-all, kept empty by creating partitions ahead
+
+MariaDB requires the partition column in every unique key, so the primary
+key becomes (name, timestamp). Lookups by name still use the key prefix.
+Queries with a timestamp range (request stats) only read the matching
+partitions, and retention drops whole partitions instead of deleting rows.
+
+Conversion rewrites the table once; run it with the
+partition-api-request-log bench command during a quiet window.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, getdate, today
+
+from my_medicinal.my_medicinal.job_runner import single_flight
+
+TABLE = "tabAPI Request Log"
+
+INTERVAL_DAYS = {
+    "day": 1,
+    "week": 7
+}
+
+DEFAULT_INTERVAL = "day"
+DEFAULT_AHEAD = 7
+
+FUTURE_PARTITION = "p_future"
+BEFORE_PARTITION = "p_before"
+
+
+# ============================================
+# CONVERSION
+# ============================================
+
+def partition_table(interval=None, ahead=None):
+    """
+    Convert the table to daily or weekly RANGE partitions
+
+    Args:
+        interval: "day" or "week" (defaults to site config api_log_partition_interval)
+        ahead: Number of future partitions to create
+
+    Returns:
+        List of partition names
+    """
+    if is_partitioned():
+        frappe.throw(_("{0} is already partitioned").format(TABLE))
+
+    interval = interval or get_interval()
+    if interval not in INTERVAL_DAYS:
+        frappe.throw(_("Partition interval must be one of {0}").format(", ".join(INTERVAL_DAYS)))
+
+    # Every row needs a partition key; the primary key may not hold NULLs
+    frappe.db.sql(f"UPDATE `{TABLE}` SET `timestamp` = creation WHERE `timestamp` IS NULL")
+
+    first = _period_start(today(), interval)
+    bounds = [add_days(first, INTERVAL_DAYS[interval] * i) for i in range(1, (cint(ahead) or DEFAULT_AHEAD) + 2)]
+
+    partitions = [f"PARTITION `{BEFORE_PARTITION}` VALUES LESS THAN ('{first}')"]
+    partitions += [f"PARTITION `{_partition_name(bound)}` VALUES LESS THAN ('{bound}')" for bound in bounds]
+    partitions.append(f"PARTITION `{FUTURE_PARTITION}` VALUES LESS THAN (MAXVALUE)")
+
+    frappe.db.sql_ddl(f"""
+        ALTER TABLE `{TABLE}`
+            MODIFY `timestamp` DATETIME(6) NOT NULL,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (name, `timestamp`)
+        PARTITION BY RANGE COLUMNS(`timestamp`) (
+            {", ".join(partitions)}
+        )
+    """)
+
+    frappe.db.set_default("api_log_partition_interval", interval)
+    return [row.name for row in get_partitions()]
+
+
+def is_partitioned():
+    return bool(frappe.db.sql("""
+        SELECT 1 FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = %s
+        AND PARTITION_NAME IS NOT NULL
+        LIMIT 1
+    """, (TABLE,)))
+
+
+def get_partitions():
+    """Partitions in order with their upper bound and estimated rows"""
+    return frappe.db.sql("""
+        SELECT
+            PARTITION_NAME as name,
+            PARTITION_DESCRIPTION as upper_bound,
+            TABLE_ROWS as estimated_rows
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = %s
+        AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (TABLE,), as_dict=True)
+
+
+def get_interval():
+    return (
+        frappe.db.get_default("api_log_partition_interval")
+        or frappe.conf.get("api_log_partition_interval")
+        or DEFAULT_INTERVAL
+    )
+
+
+# ============================================
+# MAINTENANCE
+# ============================================
+
+@single_flight()
+def maintain_partitions():
+    """
+    Keep DEFAULT_AHEAD partitions ahead of today
+    Runs daily (hooks.py); expired partitions are dropped by the retention purge
+
+    Returns:
+        Number of partitions created
+    """
+    if not is_partitioned():
+        return 0
+
+    return len(create_future_partitions())
+
+
+def create_future_partitions(ahead=None):
+    """
+    Split empty ranges off p_future until `ahead` periods after today are covered
+
+    Returns:
+        Names of the partitions created
+    """
+    interval = get_interval()
+    step = INTERVAL_DAYS[interval]
+    horizon = add_days(_period_start(today(), interval), step * ((cint(ahead) or DEFAULT_AHEAD) + 1))
+
+    bounds = _bounds()
+    last = bounds[-1] if bounds else _period_start(today(), interval)
+
+    new_bounds = []
+    while last < horizon:
+        last = add_days(last, step)
+        new_bounds.append(last)
+
+    if not new_bounds:
+        return []
+
+    partitions = [f"PARTITION `{_partition_name(bound)}` VALUES LESS THAN ('{bound}')" for bound in new_bounds]
+    partitions.append(f"PARTITION `{FUTURE_PARTITION}` VALUES LESS THAN (MAXVALUE)")
+
+    # p_future is empty, so reorganizing it only rewrites metadata
+    frappe.db.sql_ddl(f"""
+        ALTER TABLE `{TABLE}`
+        REORGANIZE PARTITION `{FUTURE_PARTITION}` INTO ({", ".join(partitions)})
+    """)
+
+    return [_partition_name(bound) for bound in new_bounds]
+
+
+def drop_expired_partitions(days):
+    """
+    Drop partitions whose rows are all older than `days` days
+
+    Returns:
+        Estimated number of rows dropped
+    """
+    cutoff = getdate(add_days(today(), -cint(days)))
+    expired = []
+    rows = 0
+
+    for partition in get_partitions():
+        if partition.name == FUTURE_PARTITION:
+            continue
+
+        upper_bound = getdate(partition.upper_bound.strip("'").split(" ")[0])
+        if upper_bound <= cutoff:
+            expired.append(partition.name)
+            rows += cint(partition.estimated_rows)
+
+    if expired:
+        frappe.db.sql_ddl(f"""
+            ALTER TABLE `{TABLE}`
+            DROP PARTITION {", ".join(f"`{name}`" for name in expired)}
+        """)
+
+    return rows
+
+
+@frappe.whitelist()
+def get_partition_status():
+    """Partition layout of API Request Log (admin only)"""
+    if "System Manager" not in frappe.get_roles():
+        frappe.throw(_("Not authorized"))
+
+    return {
+        "partitioned": is_partitioned(),
+        "interval": get_interval(),
+        "partitions": get_partitions()
+    }
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _bounds():
+    """Upper bounds (dates) of the dated partitions"""
+    return [
+        getdate(partition.upper_bound.strip("'").split(" ")[0])
+        for partition in get_partitions()
+        if partition.name not in (FUTURE_PARTITION, BEFORE_PARTITION)
+    ]
+
+
+def _period_start(day, interval):
+    day = getdate(day)
+    if interval == "week":
+        return add_days(day, -day.weekday())
+    return day
+
+
+def _partition_name(upper_bound):
+    return "p" + getdate(upper_bound).strftime("%Y%m%d")
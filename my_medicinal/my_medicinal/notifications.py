@@ -7,6 +7,9 @@ from frappe import _
 import json
 import os
 
+# Rows per statement of the bulk read-state endpoints
+BULK_CHUNK_SIZE = 1000
+
 # ============================================
 # NOTIFICATION CONFIGURATION (المطلوب من Frappe)
 # ============================================
@@ -58,12 +61,12 @@ def get_notification_config():
 class NotificationManager:
     """Manage all types of notifications"""
     
-    def __init__(self):
-        self.fcm_handler = FCMHandler()
-    
     def send_notification(self, user_id, title, body, data=None, channels=None):
         """
-        Send notification through multiple channels
+        Queue a notification through multiple channels
+        
+        The Notification Log row and the push are written to the outbox in the
+        caller's transaction and delivered by the outbox worker after it commits.
         
         Args:
             user_id: User email
@@ -72,14 +75,20 @@ class NotificationManager:
             data: Additional data dict
             channels: List of channels ['push', 'sms', 'email']
         """
+        from my_medicinal.my_medicinal.outbox import enqueue
+        
         if channels is None:
             channels = ['push']  # Default to push only
         
         results = {}
+        push = None
         
         # 1. Push Notification (FCM)
         if 'push' in channels:
-            results['push'] = self.fcm_handler.send_push(user_id, title, body, data)
+            push = {"title": title, "body": body, "data": data}
+            # Delivery (and whether the user has a device) is only known
+            # once the outbox worker sends it
+            results['push'] = {"success": False, "queued": True, "message": "Queued"}
         
         # 2. SMS (TODO)
         if 'sms' in channels:
@@ -89,30 +98,98 @@ class NotificationManager:
         if 'email' in channels:
             results['email'] = {"success": False, "message": "Email not implemented yet"}
         
-        # Log notification
-        self.log_notification(user_id, title, body, results)
+        # Log notification (and push) through the outbox
+        results['outbox'] = enqueue(
+            user_id,
+            title,
+            f"<p>{body}</p>",
+            push=push,
+            event_type=(data or {}).get("type")
+        )
         
         return results
+
+
+class FCMHandler:
+    """Handle Firebase Cloud Messaging"""
+    
+    def __init__(self):
+        # Shared per process: the Firebase app and its HTTP session are reused
+        self.transport = get_fcm_transport()
+    
+    @property
+    def app(self):
+        return getattr(self.transport, "app", None)
     
-    def log_notification(self, user_id, title, body, results):
-        """Log notification in database"""
+    def send_push(self, user_id, title, body, data=None):
+        """
+        Send push notification via FCM
+        
+        Args:
+            user_id: User email
+            title: Notification title
+            body: Notification message
+            data: Additional data dict
+        
+        Returns:
+            dict with success status and message
+        """
         try:
-            notification = frappe.get_doc({
-                "doctype": "Notification Log",
-                "subject": title,
-                "for_user": user_id,
-                "type": "Alert",
-                "email_content": f"<p>{body}</p>",
-                "read": 0
-            })
-            notification.insert(ignore_permissions=True)
-            frappe.db.commit()
+            # Check if Firebase is initialized
+            if not self.transport.is_available():
+                return {
+                    "success": False,
+                    "message": "Firebase not initialized"
+                }
+            
+            # Get FCM token for user
+            fcm_token = self.get_user_fcm_token(user_id)
+            
+            if not fcm_token:
+                return {
+                    "success": False,
+                    "message": "No FCM token found for user"
+                }
+            
+            sender = FCMBatchSender(self.transport)
+            sender.add(fcm_token, title, body, data)
+            result = sender.flush()[0]
+            
+            if result.get("success"):
+                result["response"] = result.get("message_id")
+            
+            return result
+            
         except Exception as e:
-            frappe.log_error(frappe.get_traceback(), "Log Notification Error")
+            error_msg = str(e)
+            frappe.log_error(frappe.get_traceback(), "FCM Send Error")
+            
+            return {
+                "success": False,
+                "message": error_msg
+            }
+    
+    def get_user_fcm_token(self, user_id):
+        """Get latest active FCM token for a user from API Key table"""
+        try:
+            return get_fcm_tokens([user_id]).get(user_id)
+            
+        except Exception as e:
+            frappe.log_error(frappe.get_traceback(), "Get FCM Token Error")
+            return None
 
 
-class FCMHandler:
-    """Handle Firebase Cloud Messaging"""
+# ============================================
+# FCM TRANSPORTS & BATCH SENDER
+# ============================================
+
+class FirebaseTransport:
+    """
+    Send FCM batches through firebase_admin, one app per process
+    
+    Created by get_fcm_transport() on the first push, so processes that never
+    send one do not import firebase_admin or read the credentials.
+    """
     
     def __init__(self):
         self.app = None
@@ -133,133 +210,217 @@ class FCMHandler:
                     f"Firebase credentials not found at: {self.credentials_path}",
                     "Firebase Initialization Error"
                 )
-                print(f"❌ Firebase credentials not found at: {self.credentials_path}")
                 return
             
             # Import firebase_admin
             try:
                 import firebase_admin
-                from firebase_admin import credentials, messaging
+                from firebase_admin import credentials
                 
                 # Initialize app if not already done
                 if not firebase_admin._apps:
                     cred = credentials.Certificate(self.credentials_path)
                     self.app = firebase_admin.initialize_app(cred)
-                    print("✅ Firebase initialized successfully")
+                    frappe.logger().info("Firebase initialized")
                 else:
                     self.app = firebase_admin.get_app()
-                    print("✅ Firebase already initialized")
                 
             except ImportError:
                 frappe.log_error(
                     "firebase-admin not installed. Run: pip install firebase-admin --break-system-packages",
                     "Firebase Import Error"
                 )
-                print("❌ firebase-admin not installed")
                 
         except Exception as e:
             frappe.log_error(frappe.get_traceback(), "Firebase Initialization Error")
-            print(f"❌ Firebase initialization error: {str(e)}")
     
-    def send_push(self, user_id, title, body, data=None):
+    def is_available(self):
+        return self.app is not None
+    
+    def send_batch(self, messages):
         """
-        Send push notification via FCM
+        Send up to 500 messages in one FCM request
         
         Args:
-            user_id: User email
-            title: Notification title
-            body: Notification message
-            data: Additional data dict
+            messages: List of dicts with token, title, body and data
         
         Returns:
-            dict with success status and message
+            List of result dicts, in the same order as messages
         """
-        try:
-            # Check if Firebase is initialized
-            if not self.app:
-                return {
-                    "success": False,
-                    "message": "Firebase not initialized"
-                }
-            
-            # Get FCM token for user
-            fcm_token = self.get_user_fcm_token(user_id)
-            
-            if not fcm_token:
-                return {
-                    "success": False,
-                    "message": "No FCM token found for user"
-                }
-            
-            # Import messaging
-            from firebase_admin import messaging
-            
-            # Prepare notification
-            notification = messaging.Notification(
-                title=title,
-                body=body
-            )
-            
-            # Prepare data
-            if data is None:
-                data = {}
-            
-            # Create message
-            message = messaging.Message(
-                notification=notification,
-                data={str(k): str(v) for k, v in data.items()},
-                token=fcm_token
+        from firebase_admin import messaging
+        
+        fcm_messages = [
+            messaging.Message(
+                notification=messaging.Notification(
+                    title=message["title"],
+                    body=message["body"]
+                ),
+                data=message["data"],
+                token=message["token"]
             )
-            
-            # Send message
-            response = messaging.send(message)
-            
-            print(f"✅ Push notification sent: {response}")
-            
-            return {
-                "success": True,
-                "message": "Notification sent",
-                "response": response
-            }
-            
-        except Exception as e:
-            error_msg = str(e)
-            frappe.log_error(frappe.get_traceback(), "FCM Send Error")
-            print(f"❌ FCM send error: {error_msg}")
-            
-            return {
-                "success": False,
-                "message": error_msg
+            for message in messages
+        ]
+        
+        # send_each replaces send_all in firebase-admin >= 6.2
+        send = getattr(messaging, "send_each", None) or messaging.send_all
+        batch_response = send(fcm_messages, app=self.app)
+        
+        return [
+            {
+                "success": response.success,
+                "message_id": response.message_id,
+                "message": "Notification sent" if response.success else str(response.exception)
             }
+            for response in batch_response.responses
+        ]
+
+
+class FakeFCMTransport:
+    """
+    In-memory FCM stand-in for offline throughput tests
     
-    def get_user_fcm_token(self, user_id):
-        """Get FCM token for a user from API Key table"""
-        try:
-            # Get latest active token
-            token_data = frappe.db.get_value(
-                "API Key",
-                {
-                    "user": user_id,
-                    "enabled": 1
-                },
-                ["name"],
-                order_by="modified desc",
-                as_dict=True
-            )
-            
-            if token_data:
-                # Get the API Key doc to check for custom fields
-                api_key_doc = frappe.get_doc("API Key", token_data.name)
-                
-                # Try to get fcm_token if field exists
-                if hasattr(api_key_doc, 'fcm_token'):
-                    return api_key_doc.fcm_token
+    Enable with "fcm_transport": "fake" in site_config.json, or install one
+    with set_fcm_transport(). Sent messages are kept in `sent`.
+    """
+    
+    def __init__(self, latency=0.0, failing_tokens=None):
+        self.app = None
+        self.latency = latency
+        self.failing_tokens = set(failing_tokens or [])
+        self.sent = []
+        self.batches = 0
+    
+    def is_available(self):
+        return True
+    
+    def send_batch(self, messages):
+        import time
+        
+        if self.latency:
+            time.sleep(self.latency)
+        
+        self.batches += 1
+        results = []
+        
+        for message in messages:
+            self.sent.append(message)
             
-            return None
+            if message["token"] in self.failing_tokens:
+                results.append({
+                    "success": False,
+                    "message_id": None,
+                    "message": "Requested entity was not found."
+                })
+            else:
+                results.append({
+                    "success": True,
+                    "message_id": f"fake/{len(self.sent)}",
+                    "message": "Notification sent"
+                })
+        
+        return results
+
+
+class FCMBatchSender:
+    """
+    Collect pushes and send them in FCM batches
+    
+    Usage:
+        sender = FCMBatchSender()
+        ticket = sender.add(token, title, body, data)
+        results = sender.flush()
+        results[ticket]  # {"success": ..., "message_id": ..., "message": ...}
+    """
+    
+    MAX_BATCH_SIZE = 500
+    
+    def __init__(self, transport=None):
+        self.transport = transport or get_fcm_transport()
+        self.pending = []
+    
+    def add(self, token, title, body, data=None):
+        """Queue a push and return its ticket (index into the flush results)"""
+        self.pending.append({
+            "token": token,
+            "title": title,
+            "body": body,
+            "data": {str(k): str(v) for k, v in (data or {}).items()}
+        })
+        return len(self.pending) - 1
+    
+    def flush(self):
+        """Send every queued push; results are returned in ticket order"""
+        pending, self.pending = self.pending, []
+        
+        if not pending:
+            return []
+        
+        if not self.transport.is_available():
+            return [{"success": False, "message_id": None, "message": "Firebase not initialized"} for _ in pending]
+        
+        results = []
+        for start in range(0, len(pending), self.MAX_BATCH_SIZE):
+            batch = pending[start:start + self.MAX_BATCH_SIZE]
             
-        except Exception as e:
-            frappe.log_error(frappe.get_traceback(), "Get FCM Token Error")
-            return None
+            try:
+                results.extend(self.transport.send_batch(batch))
+            except Exception as e:
+                frappe.log_error(frappe.get_traceback(), "FCM Batch Send Error")
+                results.extend(
+                    {"success": False, "message_id": None, "message": str(e)}
+                    for _ in batch
+                )
+        
+        return results
+
+
+_fcm_transport = None
+
+
+def get_fcm_transport():
+    """Process-wide FCM transport (Firebase, or the fake one when configured)"""
+    global _fcm_transport
+    
+    if _fcm_transport is None:
+        if frappe.conf.get("fcm_transport") == "fake":
+            _fcm_transport = FakeFCMTransport(latency=frappe.utils.flt(frappe.conf.get("fcm_fake_latency")))
+        else:
+            _fcm_transport = FirebaseTransport()
+    
+    return _fcm_transport
+
+
+def set_fcm_transport(transport):
+    """Replace the process-wide FCM transport (e.g. with a FakeFCMTransport)"""
+    global _fcm_transport
+    _fcm_transport = transport
+
+
+def get_fcm_tokens(users):
+    """
+    Latest FCM token for each user in one query
+    
+    Returns:
+        dict of user -> fcm_token
+    """
+    users = [user for user in set(users or []) if user]
+    if not users:
+        return {}
+    
+    rows = frappe.db.sql("""
+        SELECT user, fcm_token
+        FROM `tabAPI Key`
+        WHERE user IN %(users)s
+        AND is_active = 1
+        AND IFNULL(fcm_token, '') != ''
+        ORDER BY modified DESC
+    """, {"users": tuple(users)}, as_dict=True)
+    
+    tokens = {}
+    for row in rows:
+        tokens.setdefault(row.user, row.fcm_token)
+    
+    return tokens
 
 
 # ============================================
@@ -304,7 +465,7 @@ def register_device(fcm_token, device_type="Android", device_id=None):
             doc = frappe.get_doc({
                 "doctype": "API Key",
                 "user": user_id,
-                "enabled": 1
+                "is_active": 1
             })
             
             doc.insert(ignore_permissions=True)
@@ -355,23 +516,32 @@ def send_test_notification(user_id=None, title="Test Notification", body="This i
 
 
 @frappe.whitelist()
-def get_my_notifications(limit=20):
-    """Get user notifications"""
+def get_my_notifications(limit=20, cursor=None):
+    """
+    Get user notifications, newest first
+    
+    Args:
+        limit: Page size
+        cursor: next_cursor of the previous page
+    """
+    from my_medicinal.my_medicinal.pagination import as_response, paginate
+    
     try:
         user_id = frappe.session.user
         
-        notifications = frappe.get_all(
+        page = paginate(
             "Notification Log",
             filters={"for_user": user_id},
             fields=[
                 "name", "subject", "email_content", "type",
                 "read", "creation"
             ],
-            limit=limit,
-            order_by="creation desc"
+            sort_field="creation",
+            cursor=cursor,
+            page_size=limit
         )
         
-        return notifications
+        return as_response(page)
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Get Notifications Error")
@@ -381,43 +551,234 @@ def get_my_notifications(limit=20):
 @frappe.whitelist()
 def mark_notification_read(notification_id):
     """Mark notification as read"""
+    return mark_notifications_read([notification_id])
+
+
+@frappe.whitelist()
+def get_notification_screen(limit=20, cursor=None):
+    """
+    Everything the notifications screen needs in one call
+    
+    Returns:
+        dict with notifications (one page), next_cursor, unread_count and
+        read_cursor (pass to mark_all_notifications_read to mark what is
+        shown and older)
+    """
+    from my_medicinal.my_medicinal.pagination import encode_cursor, paginate
+    from my_medicinal.my_medicinal.unread_counter import get_unread_count
+    
     try:
-        frappe.db.set_value(
+        user_id = frappe.session.user
+        
+        page = paginate(
             "Notification Log",
-            notification_id,
-            "read",
-            1
+            filters={"for_user": user_id},
+            fields=[
+                "name", "subject", "email_content", "type",
+                "read", "creation"
+            ],
+            sort_field="creation",
+            cursor=cursor,
+            page_size=limit
         )
         
+        return {
+            "notifications": page.data,
+            "next_cursor": page.next_cursor,
+            "unread_count": get_unread_count(user_id),
+            "read_cursor": encode_cursor(page.data[0].creation, page.data[0].name) if page.data else None
+        }
+        
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), "Get Notification Screen Error")
+        frappe.throw(_("Failed to get notifications: {0}").format(str(e)))
+
+
+@frappe.whitelist()
+def mark_notifications_read(notification_ids):
+    """
+    Mark several of the user's notifications as read with one UPDATE
+    
+    Args:
+        notification_ids: List (or JSON list) of Notification Log names
+    """
+    if isinstance(notification_ids, str):
+        notification_ids = json.loads(notification_ids)
+    
+    try:
+        user_id = frappe.session.user
+        names = list(notification_ids or [])
+        updated = 0
+        
+        for start in range(0, len(names), BULK_CHUNK_SIZE):
+            # Only the user's own unread rows count towards the badge
+            unread = frappe.db.sql_list("""
+                SELECT name FROM `tabNotification Log`
+                WHERE for_user = %(user)s AND `read` = 0 AND name IN %(names)s
+            """, {"user": user_id, "names": tuple(names[start:start + BULK_CHUNK_SIZE])})
+            
+            updated += _set_read(unread)
+        
         frappe.db.commit()
         
-        return {"success": True}
+        return {"success": True, "updated": updated, "unread_count": _badge(user_id, updated)}
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Mark Read Error")
         frappe.throw(_("Failed to mark as read: {0}").format(str(e)))
 
 
+@frappe.whitelist()
+def mark_all_notifications_read(before=None):
+    """
+    Mark the user's unread notifications as read, in chunks
+    
+    Args:
+        before: Optional cursor; only the notification it points at and older
+            ones are marked, so ones that arrived since the client loaded
+            its list stay unread
+    """
+    from my_medicinal.my_medicinal.pagination import decode_cursor
+    
+    try:
+        user_id = frappe.session.user
+        position = decode_cursor(before)
+        condition = "AND (creation < %(value)s OR (creation = %(value)s AND name <= %(name)s))" if position else ""
+        updated = 0
+        
+        while True:
+            unread = frappe.db.sql_list(f"""
+                SELECT name FROM `tabNotification Log`
+                WHERE for_user = %(user)s AND `read` = 0
+                {condition}
+                LIMIT {BULK_CHUNK_SIZE}
+            """, {
+                "user": user_id,
+                "value": position[0] if position else None,
+                "name": position[1] if position else None
+            })
+            
+            updated += _set_read(unread)
+            frappe.db.commit()
+            
+            if len(unread) < BULK_CHUNK_SIZE:
+                break
+        
+        return {"success": True, "updated": updated, "unread_count": _badge(user_id, updated)}
+        
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), "Mark All Read Error")
+        frappe.throw(_("Failed to mark as read: {0}").format(str(e)))
+
+
+@frappe.whitelist()
+def delete_read_notifications(notification_ids=None):
+    """
+    Delete the user's read notifications, in chunks
+    
+    Args:
+        notification_ids: Optional list (or JSON list) to limit the delete to;
+            unread ones in it are kept
+    """
+    if isinstance(notification_ids, str):
+        notification_ids = json.loads(notification_ids)
+    
+    try:
+        user_id = frappe.session.user
+        names = list(notification_ids or [])
+        deleted = 0
+        
+        while True:
+            name_condition = "AND name IN %(names)s" if names else ""
+            read = frappe.db.sql_list(f"""
+                SELECT name FROM `tabNotification Log`
+                WHERE for_user = %(user)s AND `read` = 1
+                {name_condition}
+                LIMIT {BULK_CHUNK_SIZE}
+            """, {"user": user_id, "names": tuple(names)})
+            
+            if read:
+                frappe.db.sql(
+                    "DELETE FROM `tabNotification Log` WHERE name IN %(names)s",
+                    {"names": tuple(read)}
+                )
+                frappe.db.commit()
+                deleted += len(read)
+            
+            if len(read) < BULK_CHUNK_SIZE:
+                break
+        
+        # Only read rows are deleted, so the unread badge is unchanged
+        return {"success": True, "deleted": deleted}
+        
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), "Delete Notifications Error")
+        frappe.throw(_("Failed to delete notifications: {0}").format(str(e)))
+
+
+def _set_read(names):
+    """
+    Mark rows read and return how many this UPDATE changed; a concurrent
+    call that marked them first makes it skip them, so the badge is only
+    decremented once
+    """
+    if not names:
+        return 0
+    
+    frappe.db.sql("""
+        UPDATE `tabNotification Log`
+        SET `read` = 1, modified = %(now)s
+        WHERE name IN %(names)s AND `read` = 0
+    """, {"now": frappe.utils.now(), "names": tuple(names)})
+    
+    return frappe.db._cursor.rowcount
+
+
+def _badge(user_id, marked):
+    """Apply a committed read change to the user's counter and return the new badge"""
+    from my_medicinal.my_medicinal import unread_counter
+    
+    if marked:
+        return unread_counter.adjust({user_id: -marked}).get(user_id)
+    
+    return unread_counter.get_unread_count(user_id)
+
+
 # ============================================
 # HELPER FUNCTION (for tasks.py)
 # ============================================
 
+def get_medication_reminder_push(patient_id, medication_name, dosage, time):
+    """Title, body and data of a medication reminder push"""
+    return (
+        "⏰ موعد الدواء",
+        f"{medication_name} - {dosage}\nالموعد: {time}",
+        {
+            "type": "medication_reminder",
+            "patient_id": patient_id,
+            "medication_name": medication_name,
+            "time": str(time)
+        }
+    )
+
+
 def send_medication_notification_fcm(patient_id, medication_name, dosage, time):
     """Helper function to send medication reminder via FCM"""
     try:
-        patient = frappe.get_doc("patient", patient_id)
+        from my_medicinal.my_medicinal.recipients import get_recipient
+        
+        patient = get_recipient(patient_id)
+        if not patient:
+            return {"success": False, "message": "Patient not found"}
+        
+        title, body, data = get_medication_reminder_push(patient_id, medication_name, dosage, time)
         
         manager = NotificationManager()
         result = manager.send_notification(
             user_id=patient.user,
-            title="⏰ موعد الدواء",
-            body=f"{medication_name} - {dosage}\nالموعد: {time}",
-            data={
-                "type": "medication_reminder",
-                "patient_id": patient_id,
-                "medication_name": medication_name,
-                "time": str(time)
-            },
+            title=title,
+            body=body,
+            data=data,
             channels=['push']
         )
         
@@ -426,11 +787,3 @@ def send_medication_notification_fcm(patient_id, medication_name, dosage, time):
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Send Medication FCM Error")
         return {"success": False, "message": str(e)}
-
-
-# ============================================
-# INITIALIZATION
-# ============================================
-
-# Create global instance
-notification_manager = NotificationManager()
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Notification Outbox
+Producers append delivery intents (a Notification Log entry and optionally
+a push) to Notification Outbox inside their own transaction, without
+committing. Once that transaction commits, a drain job claims due rows in
+batches and delivers each batch with one bulk Notification Log insert and
+batched FCM sends.
+
+Delivery semantics:
+    - Notification Log: exactly once. The insert and the row's log_written
+      flag commit together; an event_key makes retried producers idempotent.
+    - Push: at least once. A crash after sending but before the batch
+      commits re-sends once the claim lease runs out.
+
+Failed pushes are retried with exponential backoff until MAX_ATTEMPTS.
+"""
+
+import json
+import time as timer
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+from my_medicinal.my_medicinal.job_runner import single_flight
+
+BATCH_SIZE = 500
+INSERT_CHUNK_SIZE = 1000
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+
+# A claimed row is reclaimable after this long (the worker died mid-batch)
+CLAIM_LEASE_SECONDS = 300
+
+# One drain job stops after this long; coalesced triggers pick up the rest
+DRAIN_BUDGET_SECONDS = 120
+
+DRAIN_JOB_ID = "notification_outbox_drain"
+
+COLUMNS = (
+    "event_type", "event_key", "for_user", "patient", "due_at",
+    "subject", "notification_type", "document_type", "document_name", "email_content",
+    "push", "push_title", "push_body", "push_data"
+)
+
+LOG_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by",
+    "subject", "for_user", "type", "document_type", "document_name",
+    "email_content", "read"
+]
+
+
+# ============================================
+# PRODUCERS
+# ============================================
+
+def enqueue(for_user, subject, message=None, notification_type="Alert",
+            document_type=None, document_name=None, push=None,
+            event_type=None, event_key=None, patient=None, due_at=None):
+    """
+    Queue one notification in the caller's transaction
+
+    Args:
+        for_user: Recipient user
+        subject, message: Notification Log subject and content
+        push: Optional dict with title, body and data to also push to the
+            recipient's devices
+        event_key: Optional idempotency key; a second event with the same
+            key is not queued again and returns the stored row's name
+        patient: Resolve push tokens through the patient's cached recipient
+        due_at: Time the event refers to (used for delivery lag metrics)
+
+    Returns:
+        Outbox row name
+    """
+    return enqueue_many([{
+        "for_user": for_user,
+        "subject": subject,
+        "message": message,
+        "notification_type": notification_type,
+        "document_type": document_type,
+        "document_name": document_name,
+        "push": push,
+        "event_type": event_type,
+        "event_key": event_key,
+        "patient": patient,
+        "due_at": due_at
+    }])[0]
+
+
+def enqueue_many(entries):
+    """
+    Queue many notifications with one multi-row insert (arguments as in enqueue)
+
+    Returns:
+        Outbox row names, in entry order; an entry whose event_key was
+        already queued gets the stored row's name
+    """
+    entries = [entry for entry in entries if entry.get("for_user")]
+    if not entries:
+        return []
+
+    now = now_datetime()
+    user = frappe.session.user
+    names = []
+    rows = []
+
+    for entry in entries:
+        push = entry.get("push") or {}
+        name = frappe.generate_hash(length=12)
+        names.append(name)
+
+        rows.append((
+            name, now, now, user, user, 0, 0,
+            "Pending", 0, 0, now,
+            entry.get("event_type"),
+            entry.get("event_key"),
+            entry["for_user"],
+            entry.get("patient"),
+            entry.get("due_at"),
+            entry.get("subject"),
+            entry.get("notification_type") or "Alert",
+            entry.get("document_type"),
+            entry.get("document_name"),
+            entry.get("message"),
+            1 if push else 0,
+            push.get("title"),
+            push.get("body"),
+            json.dumps(push.get("data") or {}, default=str) if push else None
+        ))
+
+    columns = ("name", "creation", "modified", "owner", "modified_by", "docstatus", "idx",
+               "status", "attempts", "log_written", "next_attempt_at") + COLUMNS
+    row_placeholder = "({})".format(", ".join(["%s"] * len(columns)))
+
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + INSERT_CHUNK_SIZE]
+
+        # A duplicate event_key keeps the stored row; unlike IGNORE, data
+        # errors (truncation, NOT NULL) still fail the insert
+        frappe.db.sql("""
+            INSERT INTO `tabNotification Outbox` ({columns})
+            VALUES {rows}
+            ON DUPLICATE KEY UPDATE name = name
+        """.format(
+            columns=", ".join(f"`{column}`" for column in columns),
+            rows=", ".join([row_placeholder] * len(chunk))
+        ), tuple(value for row in chunk for value in row))
+
+    keys = {entry.get("event_key") for entry in entries if entry.get("event_key")}
+    if keys:
+        stored = dict(frappe.db.sql("""
+            SELECT event_key, name
+            FROM `tabNotification Outbox`
+            WHERE event_key IN %(keys)s
+        """, {"keys": tuple(keys)}))
+
+        names = [
+            stored.get(entry.get("event_key"), name) if entry.get("event_key") else name
+            for entry, name in zip(entries, names)
+        ]
+
+    _schedule_drain()
+    return names
+
+
+# ============================================
+# WORKER
+# ============================================
+
+@single_flight(mode="coalesce")
+def drain_outbox():
+    """
+    Deliver due outbox rows in batches
+    Triggered after producer commits; also runs every minute for retries
+
+    Returns:
+        Number of rows delivered
+    """
+    deadline = timer.monotonic() + DRAIN_BUDGET_SECONDS
+    delivered = 0
+
+    while timer.monotonic() < deadline:
+        rows = _claim(BATCH_SIZE)
+        if not rows:
+            break
+
+        delivered += deliver(rows)
+
+        if len(rows) < BATCH_SIZE:
+            break
+
+    return delivered
+
+
+def deliver_now(names):
+    """
+    Claim and deliver specific rows right away (e.g. a reminder shard's own rows)
+    Rows already claimed by the drain worker are left to it.
+
+    Returns:
+        Number of rows delivered
+    """
+    delivered = 0
+    names = list(names or [])
+
+    for start in range(0, len(names), BATCH_SIZE):
+        rows = _claim(BATCH_SIZE, names[start:start + BATCH_SIZE])
+        delivered += deliver(rows)
+
+    return delivered
+
+
+def deliver(rows):
+    """
+    One bulk Notification Log insert and batched pushes for claimed rows
+
+    Returns:
+        Number of rows delivered
+    """
+    if not rows:
+        return 0
+
+    from my_medicinal.my_medicinal import reminder_metrics, unread_counter
+    from my_medicinal.my_medicinal.notifications import FCMBatchSender
+
+    now = now_datetime()
+    unread = _write_logs([row for row in rows if not row.log_written], now)
+
+    tokens = _load_tokens([row for row in rows if row.push])
+    sender = FCMBatchSender()
+    tickets = {}
+
+    for row in rows:
+        if not row.push:
+            continue
+
+        data = json.loads(row.push_data or "{}")
+        for token in tokens.get(row.name, []):
+            tickets.setdefault(row.name, []).append(
+                sender.add(token, row.push_title or row.subject, row.push_body or "", data)
+            )
+
+    results = sender.flush()
+
+    delivered = []
+    retries = {}
+    reminder_lags = []
+    reminder_results = []
+
+    for row in rows:
+        row_results = [results[ticket] for ticket in tickets.get(row.name, [])]
+
+        if row.event_type == "medication_reminder":
+            reminder_results.extend(row_results)
+
+        # No push, or no device to push to, counts as delivered once logged
+        if not row_results or any(result.get("success") for result in row_results):
+            delivered.append(row.name)
+            if row.due_at and row_results and row.event_type == "medication_reminder":
+                reminder_lags.append((now - row.due_at).total_seconds())
+        else:
+            retries.setdefault(row.attempts + 1, []).append((row.name, row_results[0].get("message")))
+
+    _finish(delivered, retries, now)
+    frappe.db.commit()
+
+    # Badges follow the committed logs
+    unread_counter.adjust(unread)
+
+    if reminder_results:
+        failed = len([result for result in reminder_results if not result.get("success")])
+        reminder_metrics.observe("delivery_lag", reminder_lags)
+        reminder_metrics.incr("pushes_attempted", len(reminder_results))
+        reminder_metrics.incr("pushes_failed", failed)
+
+    if retries:
+        frappe.logger().warning(
+            f"Notification outbox: {sum(len(group) for group in retries.values())} of {len(rows)} pushes failed"
+        )
+
+    return len(delivered)
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _schedule_drain():
+    """Start a drain job once the producer's transaction commits (once per transaction)"""
+    if frappe.flags.notification_outbox_drain_scheduled:
+        return
+
+    frappe.flags.notification_outbox_drain_scheduled = True
+
+    def start_drain():
+        frappe.flags.notification_outbox_drain_scheduled = False
+        frappe.enqueue(
+            "my_medicinal.my_medicinal.outbox.drain_outbox",
+            queue="short",
+            job_id=DRAIN_JOB_ID,
+            deduplicate=True
+        )
+
+    frappe.db.after_commit.add(start_drain)
+    frappe.db.after_rollback.add(lambda: setattr(frappe.flags, "notification_outbox_drain_scheduled", False))
+
+
+def _claim(limit, names=None):
+    """Claim due rows (or expired claims) with one UPDATE and read them back by token"""
+    token = frappe.generate_hash(length=16)
+    now = now_datetime()
+    name_condition = "AND name IN %(names)s" if names else ""
+
+    frappe.db.sql(f"""
+        UPDATE `tabNotification Outbox`
+        SET status = 'Sending', claim_token = %(token)s, next_attempt_at = %(lease_until)s
+        WHERE status IN ('Pending', 'Sending')
+        AND next_attempt_at <= %(now)s
+        {name_condition}
+        ORDER BY next_attempt_at
+        LIMIT {int(limit)}
+    """, {
+        "token": token,
+        "now": now,
+        "lease_until": add_to_date(now, seconds=CLAIM_LEASE_SECONDS),
+        "names": tuple(names or ())
+    })
+    frappe.db.commit()
+
+    return frappe.db.sql("""
+        SELECT name, attempts, log_written, {columns}
+        FROM `tabNotification Outbox`
+        WHERE claim_token = %s
+    """.format(columns=", ".join(COLUMNS)), (token,), as_dict=True)
+
+
+def _write_logs(rows, now):
+    """Insert the rows' Notification Logs; returns new unread logs per user"""
+    if not rows:
+        return {}
+
+    owner = frappe.session.user
+    frappe.db.bulk_insert("Notification Log", LOG_FIELDS, [
+        (
+            frappe.generate_hash(length=10), now, now, owner, owner,
+            row.subject, row.for_user, row.notification_type or "Alert",
+            row.document_type, row.document_name, row.email_content, 0
+        )
+        for row in rows
+    ])
+
+    unread = {}
+    for row in rows:
+        unread[row.for_user] = unread.get(row.for_user, 0) + 1
+
+    return unread
+
+
+def _load_tokens(rows):
+    """Device tokens per outbox row: the patient's cached recipient tokens, else the user's latest token"""
+    from my_medicinal.my_medicinal.notifications import get_fcm_tokens
+    from my_medicinal.my_medicinal.recipients import prefetch_recipients
+
+    recipients = prefetch_recipients(row.patient for row in rows if row.patient)
+    user_tokens = get_fcm_tokens([row.for_user for row in rows if not row.patient])
+
+    tokens = {}
+    for row in rows:
+        if row.patient:
+            recipient = recipients.get(row.patient)
+            tokens[row.name] = list(recipient.tokens or []) if recipient else []
+        elif user_tokens.get(row.for_user):
+            tokens[row.name] = [user_tokens[row.for_user]]
+
+    return tokens
+
+
+def _finish(delivered, retries, now):
+    """Mark delivered rows and reschedule failed ones, one UPDATE per outcome"""
+    if delivered:
+        frappe.db.sql("""
+            UPDATE `tabNotification Outbox`
+            SET status = 'Delivered', log_written = 1, claim_token = NULL,
+                delivered_at = %(now)s, modified = %(now)s
+            WHERE name IN %(names)s
+        """, {"now": now, "names": tuple(delivered)})
+
+    for attempts, group in retries.items():
+        backoff = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+
+        frappe.db.sql("""
+            UPDATE `tabNotification Outbox`
+            SET status = %(status)s, attempts = %(attempts)s, log_written = 1, claim_token = NULL,
+                next_attempt_at = %(next_attempt_at)s, last_error = %(error)s, modified = %(now)s
+            WHERE name IN %(names)s
+        """, {
+            "status": "Failed" if attempts >= MAX_ATTEMPTS else "Pending",
+            "attempts": attempts,
+            "next_attempt_at": add_to_date(now, seconds=backoff),
+            "error": (group[0][1] or "")[:500],
+            "now": now,
+            "names": tuple(name for name, _error in group)
+        })
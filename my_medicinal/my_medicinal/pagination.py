@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Keyset Pagination
+List endpoints page on (sort_key, name) instead of OFFSET. The cursor is an
+opaque token holding the last row's sort value and name; the next page is
+
+    WHERE sort_key <= %(value)s AND (sort_key < %(value)s OR name < %(name)s)
+    ORDER BY sort_key DESC, name DESC
+    LIMIT page_size + 1
+
+which an index on (filter columns..., sort_key) answers with one seek, no
+matter how deep the client has scrolled. The extra row tells whether
+there is a next page.
+
+Endpoints keep returning the list of rows; the cursor for the next page is
+sent next to it as `next_cursor` in the response (None on the last page).
+"""
+
+import base64
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def paginate(doctype, filters=None, fields=None, sort_field="creation", descending=True,
+             cursor=None, page_size=None):
+    """
+    One page of a doctype in (sort_field, name) order
+
+    Args:
+        filters: frappe.get_all filters (dict or list)
+        fields: Fields to return; sort_field and name are added if missing
+        cursor: next_cursor of the previous page
+        page_size: Rows per page (capped at MAX_PAGE_SIZE)
+
+    Returns:
+        frappe._dict with data (rows) and next_cursor
+    """
+    page_size = get_page_size(page_size)
+    fields = list(fields or ["name"])
+    for field in (sort_field, "name"):
+        if field not in fields:
+            fields.append(field)
+
+    filters = _as_list(filters)
+    or_filters = None
+    position = decode_cursor(cursor)
+
+    if position:
+        value, name = position
+        operator = "<" if descending else ">"
+
+        # The first condition bounds the index range; the OR breaks ties on name
+        filters.append([sort_field, operator + "=", value])
+        or_filters = [[sort_field, operator, value], ["name", operator, name]]
+
+    direction = "desc" if descending else "asc"
+    rows = frappe.get_all(
+        doctype,
+        filters=filters,
+        or_filters=or_filters,
+        fields=fields,
+        order_by=f"{sort_field} {direction}, name {direction}",
+        limit=page_size + 1
+    )
+
+    return make_page(rows, page_size, sort_field)
+
+
+def make_page(rows, page_size, sort_key):
+    """Cut rows (fetched with one extra) to a page and build its next cursor"""
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    return frappe._dict({
+        "data": rows,
+        "next_cursor": encode_cursor(rows[-1][sort_key], rows[-1]["name"]) if has_more else None
+    })
+
+
+def as_response(page):
+    """Return a page from a whitelisted method: rows as the message, cursor beside it"""
+    frappe.response["next_cursor"] = page.next_cursor
+    return page.data
+
+
+def get_page_size(page_size, default=DEFAULT_PAGE_SIZE):
+    return min(max(cint(page_size) or default, 1), MAX_PAGE_SIZE)
+
+
+def encode_cursor(value, name):
+    payload = json.dumps([str(value), name], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """(sort value, name) of a cursor, None for the first page"""
+    if not cursor:
+        return None
+
+    try:
+        value, name = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        frappe.throw(_("Invalid cursor"))
+
+    return value, name
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _as_list(filters):
+    if not filters:
+        return []
+
+    if isinstance(filters, dict):
+        return [
+            [field, value[0], value[1]] if isinstance(value, (list, tuple)) else [field, "=", value]
+            for field, value in filters.items()
+        ]
+
+    return [list(condition) for condition in filters]
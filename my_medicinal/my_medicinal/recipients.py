@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Notification Recipient Resolution
+Resolves a patient to the slim projection every notification needs:
+user, display name and active FCM tokens.
+
+Lookups go through a per-run memo (frappe.local), then Redis, then one
+bulk query for whatever is still missing. Entries are invalidated when a
+patient or API Key changes.
+"""
+
+import json
+from functools import partial
+
+import frappe
+
+CACHE_KEY = "medication_recipients"
+CACHE_TTL = 24 * 3600
+
+
+def get_recipient(patient_id):
+    """
+    Resolve one patient
+
+    Returns:
+        dict with patient, user, patient_name and tokens, or None
+    """
+    return get_recipients([patient_id]).get(patient_id)
+
+
+def get_recipients(patient_ids):
+    """
+    Resolve many patients at once (bulk prefetch for a reminder batch)
+
+    Args:
+        patient_ids: Iterable of patient names
+
+    Returns:
+        dict of patient -> recipient dict (unknown patients are omitted)
+    """
+    patient_ids = list({patient for patient in patient_ids if patient})
+    memo = _get_memo()
+
+    missing = [patient for patient in patient_ids if patient not in memo]
+    if missing:
+        redis = frappe.cache()
+        cached = redis.hmget(_key(CACHE_KEY), missing)
+
+        still_missing = []
+        for patient, entry in zip(missing, cached):
+            if entry:
+                memo[patient] = frappe._dict(json.loads(entry))
+            else:
+                still_missing.append(patient)
+
+        if still_missing:
+            loaded = _load_recipients(still_missing)
+            memo.update(loaded)
+
+            if loaded:
+                pipe = redis.pipeline()
+                pipe.hset(_key(CACHE_KEY), mapping={
+                    patient: json.dumps(recipient) for patient, recipient in loaded.items()
+                })
+                pipe.expire(_key(CACHE_KEY), CACHE_TTL)
+                pipe.execute()
+
+    return {patient: memo[patient] for patient in patient_ids if memo.get(patient)}
+
+
+prefetch_recipients = get_recipients
+
+
+def invalidate(patient_ids=None, users=None):
+    """
+    Drop cached recipients
+
+    Args:
+        patient_ids: Patients to drop
+        users: Users whose patients should be dropped (e.g. after a device registration)
+    """
+    patient_ids = set(patient_ids or [])
+
+    if users:
+        patient_ids.update(frappe.get_all(
+            "patient",
+            filters={"user": ["in", list(users)]},
+            pluck="name"
+        ))
+
+    if not patient_ids:
+        return
+
+    memo = _get_memo()
+    for patient in patient_ids:
+        memo.pop(patient, None)
+
+    pipe = frappe.cache().pipeline()
+    pipe.hdel(_key(CACHE_KEY), *patient_ids)
+    pipe.execute()
+
+
+# ============================================
+# DOC EVENTS (hooks.py)
+# ============================================
+
+def on_patient_change(doc, method=None):
+    """
+    Called by hooks.py: doc_events["patient"]["on_update"/"after_delete"]
+    """
+    frappe.db.after_commit.add(partial(invalidate, patient_ids=[doc.name]))
+
+
+def on_api_key_change(doc, method=None):
+    """
+    Called by hooks.py: doc_events["API Key"]["on_update"/"after_delete"]
+    Covers notifications.register_device, which saves the user's API Key
+    """
+    if doc.user:
+        frappe.db.after_commit.add(partial(invalidate, users=[doc.user]))
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _load_recipients(patient_ids):
+    """One query for patients and their active FCM tokens"""
+    from my_medicinal.my_medicinal.reminder_metrics import incr
+
+    incr("sql_queries")
+    rows = frappe.db.sql("""
+        SELECT p.name, p.user, p.patient_name, ak.fcm_token
+        FROM `tabpatient` p
+        LEFT JOIN `tabAPI Key` ak
+            ON ak.user = p.user
+            AND ak.is_active = 1
+            AND IFNULL(ak.fcm_token, '') != ''
+        WHERE p.name IN %(patients)s
+        ORDER BY ak.modified DESC
+    """, {"patients": tuple(patient_ids)}, as_dict=True)
+
+    recipients = {}
+    for row in rows:
+        recipient = recipients.setdefault(row.name, {
+            "patient": row.name,
+            "user": row.user,
+            "patient_name": row.patient_name,
+            "tokens": []
+        })
+
+        if row.fcm_token and row.fcm_token not in recipient["tokens"]:
+            recipient["tokens"].append(row.fcm_token)
+
+    return {patient: frappe._dict(recipient) for patient, recipient in recipients.items()}
+
+
+def _get_memo():
+    if not hasattr(frappe.local, "medication_recipients"):
+        frappe.local.medication_recipients = {}
+
+    return frappe.local.medication_recipients
+
+
+def _key(name):
+    return frappe.cache().make_key(name)
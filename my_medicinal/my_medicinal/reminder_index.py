@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Medication Reminder Index
+Keeps every active (schedule, time) pair in a Redis sorted set scored by
+second-of-day, so a reminder tick costs one range lookup instead of a
+query per schedule.
+"""
+
+import json
+from functools import partial
+
+import frappe
+from frappe.utils import add_days, getdate, get_datetime, now_datetime
+
+INDEX_KEY = "medication_reminder_index"
+SCHEDULES_KEY = "medication_reminder_index:schedules"
+BUILT_KEY = "medication_reminder_index:built"
+
+SECONDS_PER_DAY = 86400
+CHUNK_SIZE = 5000
+
+
+# ============================================
+# INDEX BUILD
+# ============================================
+
+def build_index():
+    """
+    Rebuild the whole index from a single Schedule/Time join
+
+    Returns:
+        Number of (schedule, time) entries indexed
+    """
+    redis = frappe.cache()
+    rows = _fetch_active_times()
+
+    index_key = _key(INDEX_KEY)
+    schedules_key = _key(SCHEDULES_KEY)
+    tmp_index_key = _key(f"{INDEX_KEY}:tmp")
+    tmp_schedules_key = _key(f"{SCHEDULES_KEY}:tmp")
+
+    members_by_schedule = {}
+    pipe = redis.pipeline()
+    pipe.delete(tmp_index_key, tmp_schedules_key)
+
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = {}
+        for row in rows[start:start + CHUNK_SIZE]:
+            member, score = _encode(row)
+            chunk[member] = score
+            members_by_schedule.setdefault(row.name, []).append(member)
+        pipe.zadd(tmp_index_key, chunk)
+
+    for schedule, members in members_by_schedule.items():
+        pipe.hset(tmp_schedules_key, schedule, json.dumps(members))
+
+    pipe.execute()
+
+    # Swap the new index in atomically so a running tick never sees a half-built set
+    pipe = redis.pipeline()
+    if rows:
+        pipe.rename(tmp_index_key, index_key)
+        pipe.rename(tmp_schedules_key, schedules_key)
+    else:
+        pipe.delete(index_key, schedules_key)
+    pipe.set(_key(BUILT_KEY), str(now_datetime()))
+    pipe.execute()
+
+    frappe.logger().info(f"Medication reminder index built: {len(rows)} entries")
+    return len(rows)
+
+
+def ensure_index():
+    """Build the index if it is missing (first run or Redis flush)"""
+    if not frappe.cache().exists(BUILT_KEY):
+        build_index()
+
+
+def refresh_schedules(schedule_names):
+    """
+    Re-index only the given schedules
+
+    Args:
+        schedule_names: List of Medication Schedule names that changed
+    """
+    schedule_names = [name for name in set(schedule_names or []) if name]
+    if not schedule_names:
+        return
+
+    redis = frappe.cache()
+
+    # Nothing to patch yet - the next tick builds the full index
+    if not redis.exists(BUILT_KEY):
+        return
+
+    index_key = _key(INDEX_KEY)
+    schedules_key = _key(SCHEDULES_KEY)
+
+    old_members = redis.hmget(schedules_key, schedule_names)
+    rows = _fetch_active_times(schedule_names)
+
+    new_members = {}
+    for row in rows:
+        member, score = _encode(row)
+        new_members.setdefault(row.name, {})[member] = score
+
+    pipe = redis.pipeline()
+    for name, old in zip(schedule_names, old_members):
+        if old:
+            pipe.zrem(index_key, *json.loads(old))
+
+        if name in new_members:
+            pipe.zadd(index_key, new_members[name])
+            pipe.hset(schedules_key, name, json.dumps(list(new_members[name])))
+        else:
+            pipe.hdel(schedules_key, name)
+    pipe.execute()
+
+
+def assign_missing_slots():
+    """
+    Give Medication Time rows written without MedicationSchedule.validate
+    (imports, SQL) their ledger slot and index them
+    Runs hourly from hooks.py; lookups skip rows without a slot
+
+    Returns:
+        Number of rows assigned a slot
+    """
+    from my_medicinal.my_medicinal.reminder_ledger import assign_slots
+
+    rows = frappe.db.sql("""
+        SELECT name, parent, ledger_slot
+        FROM `tabMedication Time`
+        WHERE parenttype = 'Medication Schedule'
+        AND IFNULL(ledger_slot, 0) = 0
+    """, as_dict=True)
+
+    for row in assign_slots(rows):
+        frappe.db.sql(
+            "UPDATE `tabMedication Time` SET ledger_slot = %s WHERE name = %s",
+            (row.ledger_slot, row.name)
+        )
+    frappe.db.commit()
+
+    if rows:
+        _refresh_and_reschedule([row.parent for row in rows])
+
+    return len(rows)
+
+
+def clear_index():
+    """Drop the index; it is rebuilt lazily on the next tick"""
+    frappe.cache().delete(_key(INDEX_KEY), _key(SCHEDULES_KEY), _key(BUILT_KEY))
+
+
+# ============================================
+# LOOKUP
+# ============================================
+
+def get_due_doses(window_start, window_end):
+    """
+    Get doses scheduled between two datetimes (inclusive)
+
+    Args:
+        window_start: Window start datetime
+        window_end: Window end datetime (may cross midnight)
+
+    Returns:
+        List of dicts with schedule, patient, medication_name, dosage, slot,
+        time, reminder_date and scheduled_time
+    """
+    ensure_index()
+
+    window_start = get_datetime(window_start)
+    window_end = get_datetime(window_end)
+
+    doses = []
+    day = getdate(window_start)
+
+    while day <= getdate(window_end):
+        day_start = window_start if day == getdate(window_start) else get_datetime(day)
+        low = _seconds_of_day(day_start)
+        high = _seconds_of_day(window_end) if day == getdate(window_end) else SECONDS_PER_DAY - 1
+
+        for member in frappe.cache().zrangebyscore(_key(INDEX_KEY), low, high):
+            doses.append(_decode(member, day))
+
+        day = add_days(day, 1)
+
+    _count_scanned(len(doses))
+    return doses
+
+
+def get_schedule_doses(schedule_names, window_start, window_end):
+    """
+    Get the doses of specific schedules between two datetimes (inclusive)
+
+    Reads the per-schedule entries of the index, so no range scan is needed.
+    """
+    schedule_names = [name for name in schedule_names if name]
+    if not schedule_names:
+        return []
+
+    ensure_index()
+
+    window_start = get_datetime(window_start)
+    window_end = get_datetime(window_end)
+
+    members = []
+    for entry in frappe.cache().hmget(_key(SCHEDULES_KEY), schedule_names):
+        if entry:
+            members.extend(json.loads(entry))
+
+    _count_scanned(len(members))
+
+    doses = []
+    day = getdate(window_start)
+
+    while day <= getdate(window_end):
+        for member in members:
+            dose = _decode(member, day)
+            if window_start <= dose.scheduled_time <= window_end:
+                doses.append(dose)
+
+        day = add_days(day, 1)
+
+    return doses
+
+
+# ============================================
+# DOC EVENTS (hooks.py)
+# ============================================
+
+def on_schedule_change(doc, method=None):
+    """
+    Re-index a Medication Schedule once its transaction commits
+    Called by hooks.py: doc_events["Medication Schedule"]["on_update"/"after_delete"]
+    """
+    _refresh_after_commit(doc.name)
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _refresh_after_commit(schedule_name):
+    frappe.db.after_commit.add(partial(_refresh_and_reschedule, [schedule_name]))
+
+
+def _refresh_and_reschedule(schedule_names):
+    from my_medicinal.my_medicinal.reminder_queue import reschedule_schedules
+
+    refresh_schedules(schedule_names)
+    reschedule_schedules(schedule_names)
+
+
+def _count_scanned(count):
+    from my_medicinal.my_medicinal.reminder_metrics import incr
+
+    incr("schedules_scanned", count)
+
+
+def _fetch_active_times(schedule_names=None):
+    """All (schedule, time) pairs for active schedules in one join"""
+    from my_medicinal.my_medicinal.reminder_metrics import incr
+
+    incr("sql_queries")
+    condition = ""
+    values = {}
+
+    if schedule_names:
+        condition = "AND ms.name IN %(schedules)s"
+        values["schedules"] = tuple(schedule_names)
+
+    rows = frappe.db.sql(f"""
+        SELECT ms.name, ms.patient, ms.medication_name, ms.dosage, mt.time, mt.ledger_slot
+        FROM `tabMedication Schedule` ms
+        INNER JOIN `tabMedication Time` mt
+            ON mt.parent = ms.name
+            AND mt.parenttype = 'Medication Schedule'
+        WHERE ms.is_active = 1
+        AND mt.time IS NOT NULL
+        AND mt.ledger_slot > 0
+        {condition}
+        ORDER BY mt.time
+    """, values, as_dict=True)
+
+    return rows
+
+
+def _encode(row):
+    """Compact sorted-set member and its second-of-day score"""
+    seconds = int(row.time.total_seconds()) % SECONDS_PER_DAY
+    time_str = "{:02d}:{:02d}:{:02d}".format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+    member = json.dumps(
+        [row.name, row.patient, row.medication_name, row.dosage, time_str, row.ledger_slot],
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return member, seconds
+
+
+def _decode(member, day):
+    schedule, patient, medication_name, dosage, time_str, slot = json.loads(member)
+    return frappe._dict({
+        "schedule": schedule,
+        "patient": patient,
+        "medication_name": medication_name,
+        "dosage": dosage,
+        "time": time_str,
+        "slot": slot,
+        "reminder_date": str(day),
+        "scheduled_time": get_datetime(f"{day} {time_str}")
+    })
+
+
+def _seconds_of_day(dt):
+    return dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1e6
+
+
+def _key(name):
+    return frappe.cache().make_key(name)
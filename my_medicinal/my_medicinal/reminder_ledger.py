@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Medication Reminder Sent-Ledger
+One Redis bitmap per day with one bit per (schedule, time) slot. Claiming
+a dose is an atomic test-and-set, so the reminder hot path never asks
+MariaDB whether a dose was already reminded.
+
+The bit offset is the Medication Time row's ledger_slot, allocated once
+from a database series and stored on the row, so it survives any Redis
+eviction. Losing a day bitmap can at worst repeat a reminder, never
+suppress one. Day bitmaps expire after LEDGER_TTL.
+"""
+
+import frappe
+from frappe.utils import cint
+
+DAY_KEY = "medication_reminder_ledger:{0}"
+SLOT_SERIES = "medication_reminder_slot"
+
+LEDGER_TTL = 48 * 3600
+
+# KEYS: day bitmap
+# ARGV: ttl, slot offsets...
+# Returns the previous bit of every slot
+CLAIM_SCRIPT = """
+local previous = {}
+for i = 2, #ARGV do
+    previous[#previous + 1] = redis.call('SETBIT', KEYS[1], tonumber(ARGV[i]), 1)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return previous
+"""
+
+CLAIM_BATCH_SIZE = 1000
+
+
+def claim(doses):
+    """
+    Mark doses as reminded and keep only the ones that were not yet
+
+    Args:
+        doses: Doses with slot and reminder_date
+
+    Returns:
+        List of doses claimed by this call
+    """
+    redis = frappe.cache()
+    claim_script = redis.register_script(CLAIM_SCRIPT)
+
+    by_day = {}
+    for dose in doses:
+        by_day.setdefault(dose.reminder_date, []).append(dose)
+
+    claimed = []
+    for day, day_doses in by_day.items():
+        for start in range(0, len(day_doses), CLAIM_BATCH_SIZE):
+            batch = day_doses[start:start + CLAIM_BATCH_SIZE]
+            previous = claim_script(
+                keys=[_key(DAY_KEY.format(day))],
+                args=[LEDGER_TTL] + [cint(dose.slot) for dose in batch]
+            )
+            claimed.extend(dose for dose, bit in zip(batch, previous) if not bit)
+
+    return claimed
+
+
+def release(doses):
+    """
+    Clear the sent bits of claimed doses that were not handed to delivery
+    (e.g. a failed shard), so the next claim takes them again
+    """
+    pipe = frappe.cache().pipeline()
+    for dose in doses:
+        pipe.setbit(_key(DAY_KEY.format(dose.reminder_date)), cint(dose.slot), 0)
+    pipe.execute()
+
+
+def assign_slots(time_rows):
+    """
+    Give Medication Time rows without a ledger slot the next one from the series
+    Called from MedicationSchedule.validate and, for rows written outside
+    it, from reminder_index.assign_missing_slots
+
+    Returns:
+        Rows that were assigned a slot
+    """
+    from frappe.model.naming import getseries
+
+    assigned = []
+    for row in time_rows:
+        if not cint(row.ledger_slot):
+            row.ledger_slot = cint(getseries(SLOT_SERIES, 1))
+            assigned.append(row)
+
+    return assigned
+
+
+def _key(name):
+    return frappe.cache().make_key(name)
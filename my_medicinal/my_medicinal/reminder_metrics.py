@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Medication Reminder Delivery Metrics
+Latency histograms and per-stage counters for the reminder pipeline,
+stored as compact 5-minute rollups (one Redis hash per bucket).
+
+Latencies are measured from the scheduled dose time:
+    enqueue_lag  - dose claimed and handed to a shard worker
+    delivery_lag - push accepted by FCM
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, now_datetime
+
+ROLLUP_KEY = "reminder_metrics:{0}"
+BUCKET_SECONDS = 300
+RETENTION_DAYS = 14
+
+# Histogram upper bounds in seconds; anything slower lands in "inf"
+LATENCY_BOUNDS = [1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600]
+
+STAGES = ("enqueue_lag", "delivery_lag")
+COUNTERS = (
+    "schedules_scanned",
+    "sql_queries",
+    "doses_dispatched",
+    "pushes_attempted",
+    "pushes_failed"
+)
+
+
+# ============================================
+# RECORDING
+# ============================================
+
+def observe(stage, seconds_list):
+    """
+    Record latencies for one stage
+
+    Args:
+        stage: "enqueue_lag" or "delivery_lag"
+        seconds_list: Latencies in seconds
+    """
+    seconds_list = [max(flt(seconds), 0) for seconds in seconds_list]
+    if not seconds_list:
+        return
+
+    fields = {}
+    for seconds in seconds_list:
+        bucket = f"{stage}:le_{_bound_for(seconds)}"
+        fields[bucket] = fields.get(bucket, 0) + 1
+
+    _write(fields, {f"{stage}:sum": sum(seconds_list)}, count_field=(f"{stage}:count", len(seconds_list)))
+
+
+def incr(counter, value=1):
+    """Add to a per-stage counter (schedules_scanned, sql_queries, ...)"""
+    if value:
+        _write({counter: cint(value)})
+
+
+def _write(int_fields, float_fields=None, count_field=None):
+    try:
+        key = _key(ROLLUP_KEY.format(_bucket_start()))
+        pipe = frappe.cache().pipeline()
+
+        for field, value in int_fields.items():
+            pipe.hincrby(key, field, value)
+        for field, value in (float_fields or {}).items():
+            pipe.hincrbyfloat(key, field, value)
+        if count_field:
+            pipe.hincrby(key, *count_field)
+
+        pipe.expire(key, RETENTION_DAYS * 86400)
+        pipe.execute()
+    except Exception:
+        # Metrics must never break reminder delivery
+        frappe.log_error(frappe.get_traceback(), "Reminder Metrics Error")
+
+
+# ============================================
+# API ENDPOINT
+# ============================================
+
+@frappe.whitelist()
+def get_reminder_metrics(hours=24):
+    """
+    Get reminder delivery latency and throughput rollups (admin only)
+
+    Args:
+        hours: Number of hours to return
+
+    Returns:
+        dict with per-bucket rollups and totals, including latency
+        percentiles estimated from the histograms
+    """
+    if "System Manager" not in frappe.get_roles():
+        frappe.throw(_("Not authorized"))
+
+    hours = min(max(cint(hours), 1), RETENTION_DAYS * 24)
+    last_bucket = _bucket_start()
+    buckets = [last_bucket - i * BUCKET_SECONDS for i in range(hours * 3600 // BUCKET_SECONDS)][::-1]
+
+    pipe = frappe.cache().pipeline()
+    for bucket in buckets:
+        pipe.hgetall(_key(ROLLUP_KEY.format(bucket)))
+    raw_rollups = pipe.execute()
+
+    totals = {}
+    rollups = []
+
+    for bucket, raw in zip(buckets, raw_rollups):
+        if not raw:
+            continue
+
+        fields = {_decode(field): flt(_decode(value)) for field, value in raw.items()}
+        rollups.append({"bucket": str(_from_timestamp(bucket)), **_summarize(fields)})
+
+        for field, value in fields.items():
+            totals[field] = totals.get(field, 0) + value
+
+    return {
+        "period_hours": hours,
+        "bucket_seconds": BUCKET_SECONDS,
+        "totals": _summarize(totals),
+        "rollups": rollups
+    }
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _summarize(fields):
+    summary = {counter: cint(fields.get(counter)) for counter in COUNTERS}
+
+    for stage in STAGES:
+        count = cint(fields.get(f"{stage}:count"))
+        histogram = {
+            str(bound): cint(fields.get(f"{stage}:le_{bound}"))
+            for bound in LATENCY_BOUNDS + ["inf"]
+        }
+        summary[stage] = {
+            "count": count,
+            "avg": round(fields.get(f"{stage}:sum", 0) / count, 3) if count else 0,
+            "p50": _percentile(histogram, count, 0.50),
+            "p95": _percentile(histogram, count, 0.95),
+            "p99": _percentile(histogram, count, 0.99),
+            "histogram": histogram
+        }
+
+    return summary
+
+
+def _percentile(histogram, count, quantile):
+    """Upper bound of the histogram bucket holding the quantile"""
+    if not count:
+        return None
+
+    target = count * quantile
+    seen = 0
+    for bound, bucket_count in histogram.items():
+        seen += bucket_count
+        if seen >= target:
+            return bound
+
+    return "inf"
+
+
+def _bound_for(seconds):
+    for bound in LATENCY_BOUNDS:
+        if seconds <= bound:
+            return bound
+    return "inf"
+
+
+def _bucket_start():
+    timestamp = int(now_datetime().timestamp())
+    return timestamp - timestamp % BUCKET_SECONDS
+
+
+def _from_timestamp(value):
+    from datetime import datetime
+    return datetime.fromtimestamp(value)
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _key(name):
+    return frappe.cache().make_key(name)
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Medication Reminder Delayed-Delivery Queue
+Upcoming doses sit in a Redis sorted set scored by their due timestamp.
+The dispatcher pops members as they fall due, so reminders go out at the
+dose time instead of up to one cron interval early or late.
+
+A "processed-until" watermark is kept in Redis and copied to the database
+at most once a minute. After downtime or a Redis flush, the queue is
+re-fed from the watermark so missed doses are caught up; doses already
+sent are held back by the sent-ledger.
+
+Dispatching runs in two places, both safe to overlap because pop_due is
+atomic:
+    - the run-reminder-dispatcher bench command, a long-running process
+      that polls every few seconds (add it to the Procfile/supervisor)
+    - a one-pass run_dispatcher every minute from the scheduler, which
+      keeps reminders going at minute granularity without that process
+"""
+
+import json
+import time as timer
+from datetime import timedelta
+
+import frappe
+from frappe.utils import cint, get_datetime, now_datetime
+
+QUEUE_KEY = "medication_reminder_queue"
+SCHEDULE_MEMBERS_KEY = "medication_reminder_queue:schedule:{0}"
+FED_UNTIL_KEY = "medication_reminder_queue:fed_until"
+WATERMARK_KEY = "medication_reminder_watermark"
+WATERMARK_CACHE_KEY = "medication_reminder_queue:watermark"
+WATERMARK_PERSISTED_KEY = "medication_reminder_queue:watermark_persisted"
+
+# The database copy of the watermark is written at most this often
+WATERMARK_PERSIST_SECONDS = 60
+
+# Atomically take every member due up to ARGV[1] (at most ARGV[2] per call)
+POP_DUE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #items > 0 then
+    redis.call('ZREM', KEYS[1], unpack(items))
+end
+return items
+"""
+
+POP_BATCH_SIZE = 1000
+
+
+# ============================================
+# SETTINGS (site_config.json)
+# ============================================
+
+def get_horizon_minutes():
+    """How far ahead doses are queued"""
+    return cint(frappe.conf.get("medication_reminder_horizon_minutes")) or 30
+
+
+def get_poll_seconds():
+    """How often the dispatcher checks for due doses"""
+    return cint(frappe.conf.get("medication_reminder_poll_seconds")) or 5
+
+
+def get_max_lateness_minutes():
+    """Doses older than this are not reminded any more when catching up"""
+    return cint(frappe.conf.get("medication_reminder_max_lateness_minutes")) or 120
+
+
+# ============================================
+# FEEDER
+# ============================================
+
+def feed_queue(from_watermark=False):
+    """
+    Push upcoming doses into the queue up to now + horizon
+
+    Args:
+        from_watermark: Re-feed from the persisted watermark instead of
+            where the last feed stopped (catch-up after downtime)
+
+    Returns:
+        Number of doses queued
+    """
+    from my_medicinal.my_medicinal.reminder_index import get_due_doses
+
+    now = now_datetime()
+    feed_end = now + timedelta(minutes=get_horizon_minutes())
+    oldest = now - timedelta(minutes=get_max_lateness_minutes())
+
+    fed_until = None if from_watermark else _get_fed_until()
+    feed_start = fed_until or get_watermark() or now
+    feed_start = max(feed_start, oldest)
+
+    if feed_start >= feed_end:
+        return 0
+
+    doses = get_due_doses(feed_start, feed_end)
+    _push(doses)
+
+    frappe.cache().set(_key(FED_UNTIL_KEY), feed_end.timestamp())
+    return len(doses)
+
+
+def reschedule_schedules(schedule_names):
+    """
+    Replace the queued doses of the given schedules only
+
+    Called after the reminder index has been refreshed for these schedules.
+    """
+    from my_medicinal.my_medicinal.reminder_index import get_schedule_doses
+
+    schedule_names = [name for name in set(schedule_names or []) if name]
+    fed_until = _get_fed_until()
+
+    if not schedule_names or not fed_until:
+        return
+
+    redis = frappe.cache()
+    queue_key = _key(QUEUE_KEY)
+    members_keys = [_key(SCHEDULE_MEMBERS_KEY.format(name)) for name in schedule_names]
+
+    pipe = redis.pipeline()
+    for members_key in members_keys:
+        pipe.smembers(members_key)
+    queued = pipe.execute()
+
+    pipe = redis.pipeline()
+    for members_key, members in zip(members_keys, queued):
+        if members:
+            pipe.zrem(queue_key, *members)
+        pipe.delete(members_key)
+    pipe.execute()
+
+    _push(get_schedule_doses(schedule_names, now_datetime(), fed_until))
+
+
+# ============================================
+# DISPATCHER
+# ============================================
+
+def run_dispatcher():
+    """
+    Re-feed from the watermark and dispatch what is due, once
+    Runs every minute from hooks.py and returns within seconds; the
+    run-reminder-dispatcher process handles sub-minute polling
+    """
+    # Recover members lost to a Redis flush or eviction
+    feed_queue(from_watermark=True)
+    return dispatch_due()
+
+
+def run_dispatcher_loop(stop=None):
+    """
+    Poll for due doses every get_poll_seconds() until stop() returns True
+    Body of the run-reminder-dispatcher bench command (a dedicated process,
+    not a scheduler slot)
+    """
+    poll_seconds = get_poll_seconds()
+    feed_queue(from_watermark=True)
+
+    while not (stop and stop()):
+        started = timer.monotonic()
+
+        try:
+            dispatch_due()
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(frappe.get_traceback(), "Reminder Dispatcher Error")
+
+        timer.sleep(max(poll_seconds - (timer.monotonic() - started), 0))
+
+
+def dispatch_due():
+    """
+    Pop every due dose, hand it to the reminder planner and advance the watermark
+
+    Returns:
+        Number of reminders dispatched
+    """
+    from my_medicinal.my_medicinal.tasks import dispatch_reminders
+
+    now = now_datetime()
+    fed_until = _get_fed_until()
+
+    # Keep the queue topped up well ahead of the dispatcher
+    if not fed_until or fed_until < now + timedelta(minutes=get_horizon_minutes() / 2):
+        feed_queue()
+
+    oldest = now - timedelta(minutes=get_max_lateness_minutes())
+    dispatched = 0
+    stale = 0
+
+    while True:
+        doses = pop_due(now)
+        if not doses:
+            break
+
+        fresh = [dose for dose in doses if dose.scheduled_time >= oldest]
+        stale += len(doses) - len(fresh)
+        dispatched += dispatch_reminders(fresh, now) or 0
+
+        if len(doses) < POP_BATCH_SIZE:
+            break
+
+    if stale:
+        frappe.logger().warning(f"Medication reminder queue: dropped {stale} doses older than the lateness limit")
+
+    set_watermark(now)
+    return dispatched
+
+
+def requeue(doses):
+    """
+    Put popped doses back for the next pass (e.g. after a failed shard);
+    ones past the lateness limit are dropped there
+    """
+    _push(doses)
+
+
+def pop_due(until):
+    """Atomically remove and return up to one batch of doses due by `until`"""
+    redis = frappe.cache()
+    pop = redis.register_script(POP_DUE_SCRIPT)
+    members = pop(keys=[_key(QUEUE_KEY)], args=[get_datetime(until).timestamp(), POP_BATCH_SIZE])
+
+    doses = []
+    pipe = redis.pipeline()
+    for member in members:
+        dose = _decode(member)
+        pipe.srem(_key(SCHEDULE_MEMBERS_KEY.format(dose.schedule)), member)
+        doses.append(dose)
+    pipe.execute()
+
+    return doses
+
+
+# ============================================
+# WATERMARK
+# ============================================
+
+def get_watermark():
+    """Datetime up to which every queued dose has been processed"""
+    value = frappe.cache().get(_key(WATERMARK_CACHE_KEY))
+    if value:
+        return _from_timestamp(float(value))
+
+    # Redis was flushed: fall back to the database copy (at most a minute behind)
+    value = frappe.db.get_global(WATERMARK_KEY)
+    return get_datetime(value) if value else None
+
+
+def set_watermark(value):
+    """
+    Advance the processed-until watermark in Redis, and in the database once
+    per WATERMARK_PERSIST_SECONDS across all dispatchers
+    """
+    value = get_datetime(value)
+    redis = frappe.cache()
+    redis.set(_key(WATERMARK_CACHE_KEY), value.timestamp())
+
+    if redis.set(_key(WATERMARK_PERSISTED_KEY), 1, nx=True, ex=WATERMARK_PERSIST_SECONDS):
+        frappe.db.set_global(WATERMARK_KEY, str(value))
+        frappe.db.commit()
+
+
+@frappe.whitelist()
+def get_queue_status():
+    """
+    Get delayed-delivery queue status (admin only)
+
+    Returns:
+        dict with queue size, next due time, fed-until and watermark
+    """
+    if "System Manager" not in frappe.get_roles():
+        frappe.throw(frappe._("Not authorized"))
+
+    redis = frappe.cache()
+    queue_key = _key(QUEUE_KEY)
+    next_due = redis.zrange(queue_key, 0, 0, withscores=True)
+
+    return {
+        "queued": redis.zcard(queue_key),
+        "next_due": str(_from_timestamp(next_due[0][1])) if next_due else None,
+        "fed_until": str(_get_fed_until() or ""),
+        "watermark": str(get_watermark() or "")
+    }
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _push(doses):
+    if not doses:
+        return
+
+    redis = frappe.cache()
+    queue_key = _key(QUEUE_KEY)
+    ttl = (get_horizon_minutes() + get_max_lateness_minutes()) * 60 * 2
+
+    pipe = redis.pipeline()
+    for start in range(0, len(doses), POP_BATCH_SIZE):
+        chunk = {}
+        for dose in doses[start:start + POP_BATCH_SIZE]:
+            member = _encode(dose)
+            chunk[member] = dose.scheduled_time.timestamp()
+
+            members_key = _key(SCHEDULE_MEMBERS_KEY.format(dose.schedule))
+            pipe.sadd(members_key, member)
+            pipe.expire(members_key, ttl)
+        pipe.zadd(queue_key, chunk)
+    pipe.execute()
+
+
+def _encode(dose):
+    return json.dumps(
+        [dose.schedule, dose.patient, dose.medication_name, dose.dosage, dose.time, dose.reminder_date, dose.slot],
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+
+
+def _decode(member):
+    schedule, patient, medication_name, dosage, time_str, reminder_date, slot = json.loads(member)
+    return frappe._dict({
+        "schedule": schedule,
+        "patient": patient,
+        "medication_name": medication_name,
+        "dosage": dosage,
+        "time": time_str,
+        "slot": slot,
+        "reminder_date": reminder_date,
+        "scheduled_time": get_datetime(f"{reminder_date} {time_str}")
+    })
+
+
+def _get_fed_until():
+    value = frappe.cache().get(_key(FED_UNTIL_KEY))
+    return _from_timestamp(float(value)) if value else None
+
+
+def _from_timestamp(value):
+    from datetime import datetime
+    return datetime.fromtimestamp(value)
+
+
+def _key(name):
+    return frappe.cache().make_key(name)
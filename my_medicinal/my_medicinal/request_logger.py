@@ -8,6 +8,12 @@ import time
 from frappe import _
 from datetime import datetime
 
+# Longest a cleanup_old_logs request spends deleting
+CLEANUP_BUDGET_SECONDS = 60
+
+# Responses are written within this many hours of the request being logged
+UPDATE_WINDOW_HOURS = 24
+
 
 class RequestLogger:
     """
@@ -91,7 +97,7 @@ class RequestLogger:
                 return
 
             # Update request log with response data
-            frappe.db.set_value("API Request Log", request_log_id, {
+            RequestLogger._update_log(request_log_id, {
                 "status_code": status_code,
                 "execution_time": execution_time,
                 "response_body": json.dumps(response_data, default=str)[:5000],  # Limit size
@@ -117,7 +123,7 @@ class RequestLogger:
                 return
 
             # Update request log with error data
-            frappe.db.set_value("API Request Log", request_log_id, {
+            RequestLogger._update_log(request_log_id, {
                 "status_code": 500,
                 "error_message": str(error_message)[:1000],
                 "error_type": error_type,
@@ -128,6 +134,28 @@ class RequestLogger:
         except Exception as e:
             frappe.log_error(frappe.get_traceback(), "Error Logging Error")
 
+    @staticmethod
+    def _update_log(request_log_id, values):
+        """
+        Update a request log row written during this request
+
+        The timestamp bound lets a partitioned table (see log_partitions)
+        prune the update to the latest partitions instead of probing all.
+        """
+        values = dict(values, modified=frappe.utils.now_datetime(), modified_by=frappe.session.user)
+        columns = ", ".join(f"`{field}` = %({field})s" for field in values)
+
+        frappe.db.sql(f"""
+            UPDATE `tabAPI Request Log`
+            SET {columns}
+            WHERE name = %(request_log_id)s
+            AND `timestamp` >= %(logged_after)s
+        """, dict(
+            values,
+            request_log_id=request_log_id,
+            logged_after=frappe.utils.add_to_date(frappe.utils.now_datetime(), hours=-UPDATE_WINDOW_HOURS)
+        ))
+
     @staticmethod
     def _redact_sensitive_data(data):
         """
@@ -323,16 +351,9 @@ def cleanup_old_logs(days=30):
     if "System Manager" not in frappe.get_roles():
         frappe.throw(_("Not authorized"))
 
-    from frappe.utils import add_to_date, now_datetime
-
-    cutoff_date = add_to_date(now_datetime(), days=-int(days))
-
-    # Delete old logs
-    deleted = frappe.db.sql("""
-        DELETE FROM `tabAPI Request Log`
-        WHERE timestamp < %s
-    """, (cutoff_date,))
+    from my_medicinal.my_medicinal.retention import purge_doctype
 
-    frappe.db.commit()
+    # Chunked, resumable delete; whatever is left after the budget resumes on the next call
+    result = purge_doctype("API Request Log", days=int(days), deadline=time.monotonic() + CLEANUP_BUDGET_SECONDS)
 
-    return {"deleted_count": deleted}
+    return {"deleted_count": result["deleted"], "complete": result["complete"]}
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Retention Purge
+Deletes expired rows per doctype policy in small chunks instead of one
+unbounded DELETE.
+
+Each chunk selects the next names in (date_field, name) order through the
+policy's index, deletes them by primary key and commits, then sleeps so
+replicas and purge threads keep up. The position after every chunk is kept
+in Redis, so a run stopped by its time budget (or a crash) resumes where
+it left off instead of rescanning deleted index entries.
+
+Site config overrides:
+    retention_days        - {"API Request Log": 14, ...}
+    retention_chunk_size  - rows per DELETE (default 1000)
+    retention_sleep       - seconds between chunks (default 0.2)
+
+Partitioned tables (see log_partitions) drop whole expired partitions
+before the chunked delete.
+"""
+
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, flt, now_datetime, today
+
+from my_medicinal.my_medicinal.job_runner import single_flight
+
+CURSOR_KEY = "retention:cursor:{0}"
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_SLEEP_SECONDS = 0.2
+
+# A nightly run stops after this long and resumes on the next run
+RUN_BUDGET_SECONDS = 20 * 60
+
+# index: covering index for the chunk query (the primary key is implicit)
+RETENTION_POLICIES = {
+    "Notification Log": frappe._dict({
+        "date_field": "creation",
+        "days": 30,
+        "condition": "`read` = 1",
+        "index": ["read", "creation"]
+    }),
+    "API Request Log": frappe._dict({
+        "date_field": "timestamp",
+        "days": 30,
+        "index": ["timestamp"],
+        # Drop whole partitions first once log_partitions has converted the table
+        "partitioned": True
+    }),
+    "Notification Outbox": frappe._dict({
+        # Failed rows are kept for inspection
+        "date_field": "creation",
+        "days": 7,
+        "condition": "`status` = 'Delivered'",
+        "index": ["status", "creation"]
+    }),
+    "Scheduled Job Run": frappe._dict({
+        "date_field": "started_at",
+        "days": 30,
+        "index": ["started_at"]
+    }),
+    "Adherence Report Snapshot": frappe._dict({
+        # get_improvement_rate reads back to the start of last month; 92 days
+        # also covers one Quarterly period
+        "date_field": "snapshot_date",
+        "date_only": True,
+        "days": 92,
+        "index": ["snapshot_date"]
+    }),
+    "Medication Reminder": frappe._dict({
+        # Data field holding YYYY-MM-DD
+        "date_field": "reminder_date",
+        "date_only": True,
+        "days": 90,
+        "index": ["reminder_date"]
+    })
+}
+
+
+@single_flight(lease_seconds=600)
+def purge_expired():
+    """
+    Apply every retention policy within one run budget
+    Runs daily (tasks.all)
+
+    Returns:
+        Number of rows deleted
+    """
+    deadline = time.monotonic() + RUN_BUDGET_SECONDS
+    deleted = 0
+
+    for doctype in RETENTION_POLICIES:
+        result = purge_doctype(doctype, deadline=deadline)
+        deleted += result["deleted"]
+
+        frappe.logger().info(f"Retention {doctype}: deleted {result['deleted']} rows" + ("" if result["complete"] else " (will resume)"))
+
+        if not result["complete"]:
+            break
+
+    return deleted
+
+
+def purge_doctype(doctype, days=None, deadline=None):
+    """
+    Delete rows of one doctype older than its retention window
+
+    Args:
+        doctype: A key of RETENTION_POLICIES
+        days: Override the policy's retention in days
+        deadline: time.monotonic() value after which to stop and keep the cursor
+
+    Returns:
+        dict with deleted (this call) and complete (nothing expired is left)
+    """
+    policy = RETENTION_POLICIES[doctype]
+    days = cint(days) or cint((frappe.conf.get("retention_days") or {}).get(doctype)) or policy.days
+    chunk_size = cint(frappe.conf.get("retention_chunk_size")) or DEFAULT_CHUNK_SIZE
+    sleep_seconds = flt(frappe.conf.get("retention_sleep", DEFAULT_SLEEP_SECONDS))
+
+    cutoff = add_days(today(), -days) if policy.date_only else add_days(now_datetime(), -days)
+    if policy.date_only:
+        cutoff = str(cutoff)
+
+    cache_key = CURSOR_KEY.format(doctype)
+    cursor = frappe.cache().get_value(cache_key) or {"after": None, "deleted": 0, "started_at": str(now_datetime())}
+    deleted = 0
+
+    if policy.partitioned:
+        from my_medicinal.my_medicinal import log_partitions
+
+        # Chunks below then only cover the partition that straddles the cutoff
+        if log_partitions.is_partitioned():
+            deleted += log_partitions.drop_expired_partitions(days)
+
+    while True:
+        rows = _next_chunk(doctype, policy, cutoff, cursor["after"], chunk_size)
+        if not rows:
+            frappe.cache().delete_value(cache_key)
+            return {"deleted": deleted, "complete": True}
+
+        frappe.db.sql(
+            f"DELETE FROM `tab{doctype}` WHERE name IN %(names)s",
+            {"names": tuple(row[1] for row in rows)}
+        )
+        frappe.db.commit()
+
+        deleted += len(rows)
+        cursor["after"] = [str(rows[-1][0]), rows[-1][1]]
+        cursor["deleted"] += len(rows)
+        cursor["updated_at"] = str(now_datetime())
+        frappe.cache().set_value(cache_key, cursor)
+
+        if len(rows) < chunk_size:
+            frappe.cache().delete_value(cache_key)
+            return {"deleted": deleted, "complete": True}
+
+        if deadline and time.monotonic() >= deadline:
+            return {"deleted": deleted, "complete": False}
+
+        time.sleep(sleep_seconds)
+
+
+@frappe.whitelist()
+def get_retention_status():
+    """
+    Policy and in-progress cursor of every retained doctype (admin only)
+    """
+    if "System Manager" not in frappe.get_roles():
+        frappe.throw(_("Not authorized"))
+
+    return [
+        {
+            "doctype": doctype,
+            "date_field": policy.date_field,
+            "days": cint((frappe.conf.get("retention_days") or {}).get(doctype)) or policy.days,
+            "in_progress": frappe.cache().get_value(CURSOR_KEY.format(doctype))
+        }
+        for doctype, policy in RETENTION_POLICIES.items()
+    ]
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _next_chunk(doctype, policy, cutoff, after, chunk_size):
+    """(date, name) of the next expired rows after the cursor, in index order"""
+    date_field = f"`{policy.date_field}`"
+    conditions = [f"{date_field} < %(cutoff)s"]
+
+    if policy.condition:
+        conditions.append(policy.condition)
+
+    if after:
+        conditions.append(f"({date_field} > %(after_date)s OR ({date_field} = %(after_date)s AND name > %(after_name)s))")
+
+    return frappe.db.sql(f"""
+        SELECT {date_field}, name
+        FROM `tab{doctype}`
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {date_field}, name
+        LIMIT {cint(chunk_size)}
+    """, {
+        "cutoff": cutoff,
+        "after_date": after[0] if after else None,
+        "after_name": after[1] if after else None
+    })
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Adherence Risk Scoring
+Nightly stage after the adherence reports. Each feature is loaded for the
+whole population with one grouped query into a NumPy column:
+
+    adherence_30 / adherence_7 - daily rollups, last 30 and 7 days
+    miss_streak                - missed doses since the last taken dose
+    timing_spread              - std deviation of time_difference (minutes)
+    stock_days                 - fewest days until depletion of any active
+                                 schedule with stock (as the stock forecast)
+    consultation_days          - days since the last consultation
+
+Every feature becomes a 0..1 component, weighted into a 0-100 risk score,
+and the strongest components become the patient's risk reasons. Scores
+and reasons are written to Patient Adherence Summary with chunked CASE
+updates, so provider lists sort and filter on them without extra queries.
+"""
+
+import frappe
+from frappe.utils import add_days, get_datetime, now_datetime, today
+
+UPDATE_CHUNK_SIZE = 5000
+
+TREND_DAYS = 7
+WINDOW_DAYS = 30
+
+# (component, weight) - weights add up to 100
+WEIGHTS = (
+    ("low_adherence", 35),
+    ("declining", 20),
+    ("miss_streak", 20),
+    ("irregular_timing", 10),
+    ("low_stock", 10),
+    ("no_consultation", 5)
+)
+
+MAX_REASONS = 3
+MIN_REASON_POINTS = 2
+
+# Feature values at which a component saturates at 1
+MISS_STREAK_CAP = 6
+ADHERENCE_DROP_CAP = 50
+TIMING_SPREAD_CAP = 120
+STOCK_DAYS_HORIZON = 7
+CONSULTATION_GRACE_DAYS = 30
+CONSULTATION_CAP_DAYS = 90
+
+
+def score_patients():
+    """
+    Score every patient with a Patient Adherence Summary
+
+    Returns:
+        Number of patients scored
+    """
+    import numpy as np
+
+    patients = frappe.db.sql_list("SELECT patient FROM `tabPatient Adherence Summary`")
+    if not patients:
+        return 0
+
+    features = _load_features(patients, np)
+    components = _components(features, np)
+
+    weights = np.array([weight for _component, weight in WEIGHTS], dtype=np.float64)
+    points = components * weights
+    scores = np.round(points.sum(axis=1), 1)
+
+    # Strongest components first; weak ones are not worth a reason
+    order = np.argsort(-points, axis=1)[:, :MAX_REASONS]
+
+    updates = []
+    for i, patient in enumerate(patients):
+        reasons = [
+            _reason(WEIGHTS[component][0], features, i)
+            for component in order[i]
+            if points[i, component] >= MIN_REASON_POINTS
+        ]
+        updates.append((patient, float(scores[i]), "\n".join(reasons)))
+
+    _write_scores(updates, now_datetime())
+    return len(updates)
+
+
+# ============================================
+# FEATURES
+# ============================================
+
+def _load_features(patients, np):
+    """One grouped query per feature, aligned to the patients list (NaN when absent)"""
+    index = {patient: i for i, patient in enumerate(patients)}
+    month_start = add_days(today(), -(WINDOW_DAYS - 1))
+    params = {
+        "today": today(),
+        "week_start": add_days(today(), -(TREND_DAYS - 1)),
+        "month_start": month_start,
+        "month_start_time": get_datetime(month_start)
+    }
+
+    doses = _column_block(index, 4, np, """
+        SELECT
+            patient,
+            SUM(IF(rollup_date >= %(week_start)s, scheduled_doses, 0)),
+            SUM(IF(rollup_date >= %(week_start)s, taken_doses, 0)),
+            SUM(scheduled_doses),
+            SUM(taken_doses)
+        FROM `tabAdherence Daily Rollup`
+        WHERE rollup_date BETWEEN %(month_start)s AND %(today)s
+        GROUP BY patient
+    """, params)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        adherence_7 = np.where(doses[:, 0] > 0, doses[:, 1] / doses[:, 0] * 100, np.nan)
+        adherence_30 = np.where(doses[:, 2] > 0, doses[:, 3] / doses[:, 2] * 100, np.nan)
+
+    miss_streak = _column_block(index, 1, np, """
+        SELECT ml.patient, COUNT(*)
+        FROM `tabMedication Log` ml
+        LEFT JOIN (
+            SELECT patient, MAX(scheduled_time) as last_taken
+            FROM `tabMedication Log`
+            WHERE status = 'Taken'
+            AND scheduled_time >= %(month_start_time)s
+            GROUP BY patient
+        ) taken ON taken.patient = ml.patient
+        WHERE ml.status = 'Missed'
+        AND ml.scheduled_time >= %(month_start_time)s
+        AND (taken.last_taken IS NULL OR ml.scheduled_time > taken.last_taken)
+        GROUP BY ml.patient
+    """, params)[:, 0]
+
+    timing_spread = _column_block(index, 1, np, """
+        SELECT patient, STDDEV_POP(time_difference)
+        FROM `tabMedication Log`
+        WHERE status = 'Taken'
+        AND time_difference IS NOT NULL
+        AND scheduled_time >= %(month_start_time)s
+        GROUP BY patient
+    """, params)[:, 0]
+
+    stock_days = _column_block(index, 1, np, """
+        SELECT patient, MIN(days_until_depletion)
+        FROM `tabMedication Schedule`
+        WHERE is_active = 1
+        AND frequency != 'As Needed'
+        AND current_stock > 0
+        AND days_until_depletion IS NOT NULL
+        GROUP BY patient
+    """, params)[:, 0]
+
+    consultation_days = _column_block(index, 1, np, """
+        SELECT patient, DATEDIFF(%(today)s, MAX(creation))
+        FROM `tabMedical Consultation`
+        GROUP BY patient
+    """, params)[:, 0]
+
+    return {
+        "adherence_7": adherence_7,
+        "adherence_30": adherence_30,
+        "miss_streak": np.nan_to_num(miss_streak),
+        "timing_spread": timing_spread,
+        "stock_days": stock_days,
+        "consultation_days": consultation_days
+    }
+
+
+def _column_block(index, width, np, query, params):
+    block = np.full((len(index), width), np.nan)
+
+    for row in frappe.db.sql(query, params):
+        i = index.get(row[0])
+        if i is not None:
+            block[i] = [np.nan if value is None else float(value) for value in row[1:]]
+
+    return block
+
+
+def _components(features, np):
+    """0..1 component per WEIGHTS entry; missing data contributes nothing"""
+    adherence_7 = features["adherence_7"]
+    adherence_30 = features["adherence_30"]
+    consultation_days = features["consultation_days"]
+
+    low_adherence = np.nan_to_num((100 - adherence_30) / 100)
+    declining = np.nan_to_num((adherence_30 - adherence_7) / ADHERENCE_DROP_CAP)
+    miss_streak = features["miss_streak"] / MISS_STREAK_CAP
+    irregular_timing = np.nan_to_num(features["timing_spread"] / TIMING_SPREAD_CAP)
+    low_stock = np.nan_to_num((STOCK_DAYS_HORIZON - features["stock_days"]) / STOCK_DAYS_HORIZON)
+
+    # Never consulted counts as overdue
+    no_consultation = np.where(
+        np.isnan(consultation_days),
+        1,
+        (consultation_days - CONSULTATION_GRACE_DAYS) / (CONSULTATION_CAP_DAYS - CONSULTATION_GRACE_DAYS)
+    )
+
+    components = np.column_stack([
+        low_adherence, declining, miss_streak, irregular_timing, low_stock, no_consultation
+    ])
+    return np.clip(components, 0, 1)
+
+
+def _reason(component, features, i):
+    if component == "low_adherence":
+        return f"30-day adherence {features['adherence_30'][i]:.0f}%"
+    if component == "declining":
+        return f"7-day adherence down {features['adherence_30'][i] - features['adherence_7'][i]:.0f} points"
+    if component == "miss_streak":
+        return f"{int(features['miss_streak'][i])} missed doses in a row"
+    if component == "irregular_timing":
+        return f"Dose timing varies by {features['timing_spread'][i]:.0f} min"
+    if component == "low_stock":
+        return f"Medication runs out in {max(int(features['stock_days'][i]), 0)} days"
+
+    days = features["consultation_days"][i]
+    return "No consultation on record" if days != days else f"No consultation in {int(days)} days"
+
+
+# ============================================
+# WRITE
+# ============================================
+
+def _write_scores(updates, scored_at):
+    """Chunked CASE updates: one statement per chunk instead of one per patient"""
+    for start in range(0, len(updates), UPDATE_CHUNK_SIZE):
+        chunk = updates[start:start + UPDATE_CHUNK_SIZE]
+        cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+        placeholders = ", ".join(["%s"] * len(chunk))
+
+        values = []
+        for patient, score, _reasons in chunk:
+            values.extend([patient, score])
+        for patient, _score, reasons in chunk:
+            values.extend([patient, reasons])
+        values.append(scored_at)
+        values.extend(patient for patient, _score, _reasons in chunk)
+
+        frappe.db.sql(f"""
+            UPDATE `tabPatient Adherence Summary`
+            SET
+                risk_score = CASE name {cases} END,
+                risk_reasons = CASE name {cases} END,
+                risk_scored_at = %s
+            WHERE name IN ({placeholders})
+        """, tuple(values))
+
+        frappe.db.commit()
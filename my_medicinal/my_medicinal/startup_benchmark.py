@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Startup Benchmark
+Measures what importing my_medicinal modules adds to a worker's boot:
+wall time, resident memory and heavy third-party packages loaded.
+
+Each measurement runs in a fresh interpreter that has already imported
+frappe (every web and worker process has), so the numbers are the app's
+own cost. Every module is measured alone, then all of them together.
+
+A module fails its budget when it is too slow or too large, or when it
+pulls in a package from HEAVY_PACKAGES at import time; those belong inside
+the functions that use them. Run with the benchmark-imports bench command.
+"""
+
+import json
+import os
+import pkgutil
+import subprocess
+import sys
+
+APP_PACKAGE = "my_medicinal"
+
+# Loaded lazily by the code that needs them, never at module import
+HEAVY_PACKAGES = ("firebase_admin", "google.cloud", "numpy", "pandas", "dateutil")
+
+DEFAULT_BUDGET = {
+    "module_ms": 100,
+    "module_rss_mb": 8,
+    "total_ms": 1500,
+    "total_rss_mb": 48
+}
+
+PROBE = """
+import importlib, json, resource, sys, time
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+
+import frappe
+
+modules = json.loads(sys.argv[1])
+before = set(sys.modules)
+rss = rss_kb()
+start = time.perf_counter()
+
+try:
+    for module in modules:
+        importlib.import_module(module)
+    error = None
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+
+print(json.dumps({
+    "ms": (time.perf_counter() - start) * 1000,
+    "rss_kb": rss_kb() - rss,
+    "loaded": sorted(set(sys.modules) - before),
+    "error": error
+}))
+"""
+
+
+def get_app_modules():
+    """Every importable my_medicinal module except patches and tests"""
+    package = __import__(APP_PACKAGE)
+    modules = [APP_PACKAGE]
+
+    for module in pkgutil.walk_packages(package.__path__, prefix=f"{APP_PACKAGE}."):
+        leaf = module.name.rsplit(".", 1)[-1]
+        if ".patches" in module.name or leaf.startswith("test_"):
+            continue
+        modules.append(module.name)
+
+    return sorted(modules)
+
+
+def run_benchmark(modules=None, budget=None, repeat=1):
+    """
+    Measure every module alone and all modules together
+
+    Args:
+        modules: Module names (defaults to get_app_modules())
+        budget: Overrides for DEFAULT_BUDGET keys
+        repeat: Runs per measurement; the fastest is kept to cut noise
+
+    Returns:
+        dict with results (per module), total and failures (messages)
+    """
+    modules = list(modules or get_app_modules())
+    budget = dict(DEFAULT_BUDGET, **{key: value for key, value in (budget or {}).items() if value is not None})
+
+    results = [dict(_measure([module], repeat), module=module) for module in modules]
+    total = _measure(modules, repeat)
+
+    failures = []
+    for result in results:
+        failures.extend(_check(result["module"], result, budget["module_ms"], budget["module_rss_mb"]))
+    failures.extend(_check("all modules", total, budget["total_ms"], budget["total_rss_mb"]))
+
+    results.sort(key=lambda result: result["ms"], reverse=True)
+    return {"results": results, "total": total, "budget": budget, "failures": failures}
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _measure(modules, repeat):
+    best = None
+
+    for _run in range(max(int(repeat or 1), 1)):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, json.dumps(modules)],
+            capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+        )
+
+        if output.returncode:
+            lines = output.stderr.strip().splitlines()
+            return {"ms": 0, "rss_mb": 0, "heavy": [], "error": lines[-1] if lines else "probe failed"}
+
+        run = json.loads(output.stdout.strip().splitlines()[-1])
+        if best is None or run["ms"] < best["ms"]:
+            best = run
+
+    return {
+        "ms": round(best["ms"], 1),
+        "rss_mb": round(best["rss_kb"] / 1024, 1),
+        "heavy": sorted({
+            package for package in HEAVY_PACKAGES
+            for name in best["loaded"]
+            if name == package or name.startswith(package + ".")
+        }),
+        "error": best["error"]
+    }
+
+
+def _check(label, result, max_ms, max_rss_mb):
+    if result["error"]:
+        return [f"{label}: import failed ({result['error']})"]
+
+    failures = []
+    if result["ms"] > max_ms:
+        failures.append(f"{label}: {result['ms']} ms > {max_ms} ms")
+    if result["rss_mb"] > max_rss_mb:
+        failures.append(f"{label}: {result['rss_mb']} MB > {max_rss_mb} MB")
+    if result["heavy"]:
+        failures.append(f"{label}: imports {', '.join(result['heavy'])} at module level")
+
+    return failures
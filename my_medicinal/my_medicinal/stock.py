@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Medication Stock Ledger
+Stock changes (refills, doses, manual corrections) are appended to the
+Stock Movement ledger instead of overwriting Medication Schedule rows.
+
+current_stock on the schedule is a snapshot; stock_compacted_until is the
+last movement folded into it. Readers add the pending movements on top,
+and compact_stock_movements folds them into the snapshot in batches.
+
+Writers lock the schedule row (lock_stock) before appending, so the
+movements of one schedule commit in id order and a schedule's watermark
+never passes a movement that is not visible yet.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, now_datetime
+
+from my_medicinal.my_medicinal.job_runner import single_flight
+
+WARNING_DAYS = 5
+
+COMPACT_BATCH_SIZE = 10000
+
+
+# ============================================
+# WRITES (insert-only)
+# ============================================
+
+def lock_stock(schedule_name):
+    """
+    Lock a schedule's stock for this transaction and read it
+
+    Both reads are locking (current) reads, so movements committed after
+    the transaction's snapshot are included.
+
+    Returns:
+        stock dict (see get_current_stock) with patient and last_movement,
+        or None if the schedule does not exist
+    """
+    row = frappe.db.sql("""
+        SELECT
+            name, patient, current_stock, daily_consumption,
+            reorder_level, is_active, stock_compacted_until
+        FROM `tabMedication Schedule`
+        WHERE name = %(name)s
+        FOR UPDATE
+    """, {"name": schedule_name}, as_dict=True)
+
+    if not row:
+        return None
+
+    row = row[0]
+    pending, last_movement = frappe.db.sql("""
+        SELECT IFNULL(SUM(quantity), 0), MAX(name)
+        FROM `tabStock Movement`
+        WHERE medication_schedule = %(name)s
+        AND name > %(watermark)s
+        FOR UPDATE
+    """, {"name": schedule_name, "watermark": cint(row.stock_compacted_until)})[0]
+
+    row.pending = pending
+    stock = _make_stock(row)
+    stock.patient = row.patient
+    stock.last_movement = cint(last_movement) or cint(row.stock_compacted_until)
+
+    return stock
+
+
+def record_movement(schedule_name, quantity, movement_type, patient=None,
+                    reference_doctype=None, reference_name=None, reason=None):
+    """
+    Append a stock movement
+    The caller holds the schedule's lock (see lock_stock)
+
+    Args:
+        schedule_name: Medication Schedule name
+        quantity: Signed change in stock units
+        movement_type: "Refill", "Dose" or "Correction"
+
+    Returns:
+        Stock Movement name
+    """
+    movement = frappe.get_doc({
+        "doctype": "Stock Movement",
+        "medication_schedule": schedule_name,
+        "patient": patient or frappe.db.get_value("Medication Schedule", schedule_name, "patient"),
+        "movement_type": movement_type,
+        "quantity": flt(quantity),
+        "posted_at": now_datetime(),
+        "reference_doctype": reference_doctype,
+        "reference_name": reference_name,
+        "reason": reason
+    })
+    movement.insert(ignore_permissions=True)
+
+    return movement.name
+
+
+def decrement_stock(schedule_name, quantity=1, reference_doctype=None, reference_name=None):
+    """
+    Take stock for a dose
+
+    The movement is clamped to the available balance and nothing is
+    written at zero stock (e.g. a schedule that does not track stock), so
+    the balance never goes below zero and readers and compaction agree.
+
+    Args:
+        schedule_name: Medication Schedule name
+        quantity: Units to subtract
+
+    Returns:
+        dict with current_stock and days_until_depletion, or None if the
+        schedule does not exist
+    """
+    quantity = flt(quantity) or 1
+
+    old = lock_stock(schedule_name)
+    if not old:
+        return None
+
+    quantity = min(quantity, old.balance)
+    if quantity <= 0:
+        return old
+
+    now = now_datetime()
+    frappe.db.sql("""
+        INSERT INTO `tabStock Movement`
+            (creation, modified, owner, modified_by, docstatus, idx,
+             medication_schedule, patient, movement_type, quantity, posted_at,
+             reference_doctype, reference_name)
+        VALUES
+            (%(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+             %(schedule)s, %(patient)s, 'Dose', %(quantity)s, %(now)s,
+             %(reference_doctype)s, %(reference_name)s)
+    """, {
+        "now": now,
+        "user": frappe.session.user,
+        "schedule": schedule_name,
+        "patient": old.patient,
+        "quantity": -quantity,
+        "reference_doctype": reference_doctype,
+        "reference_name": reference_name
+    })
+
+    stock = _moved(old, -quantity)
+
+    crossed_reorder = stock.current_stock <= stock.reorder_level < old.current_stock
+    crossed_warning = stock.days_until_depletion <= WARNING_DAYS < old.days_until_depletion
+
+    if stock.is_active and (crossed_reorder or crossed_warning):
+        frappe.enqueue(
+            "my_medicinal.my_medicinal.stock.send_low_stock_side_effects",
+            queue="short",
+            enqueue_after_commit=True,
+            schedule_name=schedule_name
+        )
+
+    return stock
+
+
+def refill_stock(schedule_name, quantity, reason=None):
+    """Add stock from a refill"""
+    current = lock_stock(schedule_name)
+    record_movement(schedule_name, flt(quantity), "Refill", patient=current.patient, reason=reason)
+    return _moved(current, flt(quantity))
+
+
+def set_stock(schedule_name, new_stock, reason=None):
+    """Manual correction to an absolute stock level"""
+    current = lock_stock(schedule_name)
+    # From the unclamped balance readers sum, so the result folds to new_stock
+    delta = flt(new_stock) - current.balance
+
+    if delta:
+        record_movement(schedule_name, delta, "Correction", patient=current.patient, reason=reason)
+
+    return _moved(current, delta)
+
+
+def absorb_stock_edit(doc):
+    """
+    Turn a direct edit of current_stock on the form into a Correction
+    Called from MedicationSchedule.validate; the edited value becomes the
+    new snapshot and the correction only serves as the audit trail
+    """
+    current = lock_stock(doc.name)
+    delta = flt(doc.current_stock) - current.balance
+    last_movement = current.last_movement
+
+    if delta:
+        last_movement = record_movement(
+            doc.name, delta, "Correction", patient=doc.patient,
+            reason=_("Edited on Medication Schedule")
+        )
+
+    doc.stock_compacted_until = cint(last_movement)
+
+
+def send_low_stock_side_effects(schedule_name):
+    """Low-stock alert for a schedule whose stock just crossed a threshold (background job)"""
+    try:
+        schedule = frappe.get_doc("Medication Schedule", schedule_name)
+        stock = get_current_stock(schedule_name)
+        schedule.current_stock = stock.current_stock
+        schedule.days_until_depletion = stock.days_until_depletion
+        schedule.send_low_stock_alert()
+        frappe.db.commit()
+
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "Low Stock Side Effects Error")
+
+
+# ============================================
+# READS (snapshot + pending movements)
+# ============================================
+
+def get_current_stock(schedule_name):
+    """
+    Current stock of one schedule
+
+    Returns:
+        dict with current_stock, days_until_depletion, pending movements
+        total, the unclamped balance and the schedule's daily_consumption,
+        reorder_level and is_active
+    """
+    return get_current_stocks([schedule_name]).get(schedule_name)
+
+
+def get_current_stocks(schedule_names):
+    """
+    Current stock of many schedules in one query
+
+    Returns:
+        dict of schedule name -> stock dict (see get_current_stock)
+    """
+    schedule_names = list({name for name in schedule_names if name})
+    if not schedule_names:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT
+            ms.name, ms.current_stock, ms.daily_consumption,
+            ms.reorder_level, ms.is_active,
+            IFNULL(SUM(sm.quantity), 0) as pending
+        FROM `tabMedication Schedule` ms
+        LEFT JOIN `tabStock Movement` sm
+            ON sm.medication_schedule = ms.name
+            AND sm.name > ms.stock_compacted_until
+        WHERE ms.name IN %(names)s
+        GROUP BY ms.name
+    """, {"names": tuple(schedule_names)}, as_dict=True)
+
+    return {row.name: _make_stock(row) for row in rows}
+
+
+@frappe.whitelist()
+def get_stock(medication_schedule):
+    """
+    Get current stock of a medication schedule (snapshot + pending movements)
+
+    Args:
+        medication_schedule: Medication Schedule name
+
+    Returns:
+        dict with current_stock and days_until_depletion
+    """
+    frappe.has_permission("Medication Schedule", "read", medication_schedule, throw=True)
+
+    stock = get_current_stock(medication_schedule)
+    if not stock:
+        frappe.throw(_("Medication Schedule not found"))
+
+    return {
+        "medication_schedule": medication_schedule,
+        "current_stock": stock.current_stock,
+        "days_until_depletion": stock.days_until_depletion
+    }
+
+
+# ============================================
+# COMPACTION (scheduled)
+# ============================================
+
+@single_flight()
+def compact_stock_movements():
+    """
+    Fold pending movements into the Medication Schedule snapshots
+    Runs every 5 minutes from hooks.py
+
+    Each schedule is folded from its own watermark, in batches of schedules.
+
+    Returns:
+        Number of schedule snapshots updated
+    """
+    after = ""
+    folded = 0
+
+    while True:
+        deltas = frappe.db.sql("""
+            SELECT
+                ms.name, ms.stock_compacted_until,
+                SUM(sm.quantity), MAX(sm.name)
+            FROM `tabMedication Schedule` ms
+            INNER JOIN `tabStock Movement` sm
+                ON sm.medication_schedule = ms.name
+                AND sm.name > ms.stock_compacted_until
+            WHERE ms.name > %(after)s
+            GROUP BY ms.name
+            ORDER BY ms.name
+            LIMIT %(limit)s
+        """, {"after": after, "limit": COMPACT_BATCH_SIZE})
+
+        if not deltas:
+            break
+
+        _fold(deltas)
+        frappe.db.commit()
+
+        folded += len(deltas)
+        after = deltas[-1][0]
+
+        if len(deltas) < COMPACT_BATCH_SIZE:
+            break
+
+    return folded
+
+
+def _fold(deltas):
+    """
+    One CASE update: snapshot += delta, days recomputed, watermark advanced
+    A schedule whose watermark moved since it was read (a form edit
+    re-based it) is left for the next run
+    """
+    cases = " ".join(["WHEN %s THEN %s"] * len(deltas))
+    placeholders = ", ".join(["%s"] * len(deltas))
+
+    values = []
+    for name, _watermark, delta, _last in deltas:
+        values.extend([name, delta])
+    for name, _watermark, _delta, last in deltas:
+        values.extend([name, last])
+    values.append(now_datetime())
+    values.extend(name for name, _watermark, _delta, _last in deltas)
+    for name, watermark, _delta, _last in deltas:
+        values.extend([name, watermark])
+
+    # Single-table UPDATE assigns left to right, so days use the new stock
+    frappe.db.sql(f"""
+        UPDATE `tabMedication Schedule`
+        SET
+            current_stock = GREATEST(current_stock + CASE name {cases} END, 0),
+            days_until_depletion = IF(
+                daily_consumption > 0, FLOOR(current_stock / daily_consumption), 0
+            ),
+            stock_compacted_until = CASE name {cases} END,
+            last_stock_update = %s
+        WHERE name IN ({placeholders})
+        AND stock_compacted_until = CASE name {cases} END
+    """, tuple(values))
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _make_stock(row):
+    """Stock dict from a schedule row with its pending movements total"""
+    balance = flt(row.current_stock) + flt(row.pending)
+    current_stock = max(balance, 0)
+    daily_consumption = flt(row.daily_consumption)
+
+    return frappe._dict({
+        "name": row.name,
+        "current_stock": current_stock,
+        "days_until_depletion": int(current_stock / daily_consumption) if daily_consumption > 0 else 0,
+        "pending": flt(row.pending),
+        "balance": balance,
+        "daily_consumption": daily_consumption,
+        "reorder_level": cint(row.reorder_level),
+        "is_active": cint(row.is_active)
+    })
+
+
+def _moved(stock, quantity):
+    """stock (from lock_stock) after a movement of quantity"""
+    row = frappe._dict(stock)
+    row.pending = flt(stock.pending) + flt(quantity)
+    row.current_stock = flt(stock.balance) - flt(stock.pending)
+
+    moved = _make_stock(row)
+    moved.patient = stock.patient
+    return moved
@@ -6,144 +6,369 @@ import frappe
 from frappe import _
 from frappe.utils import today, now_datetime, add_days, get_datetime, time_diff_in_hours
 import json
+from my_medicinal.my_medicinal.job_runner import single_flight
 
 # ============================================
 # SCHEDULED TASKS
 # ============================================
 
+@single_flight(lease_seconds=300)
 def all():
     """Tasks that run every day"""
-    check_stock_depletion()
-    generate_daily_adherence_reports()
-    cleanup_old_notifications()
+    rows = check_stock_depletion() or 0
+    rows += generate_daily_adherence_reports() or 0
+    
+    # One combined notification per patient for tonight's alerts
+    from my_medicinal.my_medicinal.alert_digest import flush_digests
+    rows += flush_digests()
+    
+    # Move logs past the archive horizon out of the hot table
+    from my_medicinal.my_medicinal.log_archive import archive_medication_logs
+    rows += archive_medication_logs() or 0
+    
+    # Chunked retention purge (Notification Log, API Request Log, Medication Reminder)
+    from my_medicinal.my_medicinal.retention import purge_expired
+    rows += purge_expired() or 0
+    return rows
 
 
+@single_flight()
 def hourly():
     """Tasks that run every hour"""
-    send_medication_reminders()
+    return send_medication_reminders()
 
 
 # ============================================
 # 1. MEDICATION REMINDERS
 # ============================================
 
+@single_flight(mode="coalesce")
 def send_medication_reminders():
     """
-    Check upcoming medications and send reminders
-    Runs every hour (or every 5 minutes in production)
+    Top up the delayed-delivery queue and dispatch doses that are due
+    Runs every 5 minutes as a safety net; reminder_queue.run_dispatcher
+    delivers every minute and the run-reminder-dispatcher process every
+    few seconds
     """
     try:
-        from datetime import datetime, timedelta
+        from my_medicinal.my_medicinal.reminder_queue import feed_queue, dispatch_due
         
         print("\n?? Checking medication reminders...")
         
-        # Get current time + 5 minutes window
-        now = now_datetime()
-        window_end = now + timedelta(minutes=5)
-        
-        # Get all active medication schedules
-        schedules = frappe.get_all(
-            "Medication Schedule",
-            filters={"is_active": 1},
-            fields=["name", "patient", "medication_name", "dosage"]
-        )
-        
-        reminders_sent = 0
+        queued = feed_queue()
+        dispatched = dispatch_due()
         
-        for schedule in schedules:
-            # Get times for this schedule
-            times = frappe.get_all(
-                "Medication Time",
-                filters={"parent": schedule.name},
-                fields=["time"],
-                order_by="time"
-            )
-            
-            for time_entry in times:
-                # Build scheduled datetime for today
-                scheduled_time = get_datetime(f"{today()} {time_entry.time}")
-                
-                # Check if within reminder window
-                if now <= scheduled_time <= window_end:
-                    # Check if already reminded today
-                    existing_reminder = frappe.db.exists(
-                        "Medication Reminder",
-                        {
-                            "medication_schedule": schedule.name,
-                            "reminder_date": today(),
-                            "reminder_time": time_entry.time
-                        }
-                    )
-                    
-                    if not existing_reminder:
-                        # Create reminder
-                        reminder = frappe.get_doc({
-                            "doctype": "Medication Reminder",
-                            "medication_schedule": schedule.name,
-                            "patient": schedule.patient,
-                            "reminder_date": today(),
-                            "reminder_time": time_entry.time,
-                            "status": "Pending",
-                            "reminder_sent_at": now_datetime()
-                        })
-                        reminder.insert(ignore_permissions=True)
-                        
-                        # Send notification
-                        send_medication_notification(
-                            schedule.patient,
-                            schedule.medication_name,
-                            schedule.dosage,
-                            time_entry.time
-                        )
-                        
-                        reminders_sent += 1
+        print(f"? Queued {queued} upcoming doses, dispatched {dispatched} medication reminders")
         
-        frappe.db.commit()
-        print(f"? Sent {reminders_sent} medication reminders")
+        return dispatched
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Medication Reminders Error")
         print(f"? Error in reminders: {str(e)}")
 
-def send_medication_notification(patient_id, medication_name, dosage, time):
-    """Send notification for medication reminder"""
+
+def dispatch_reminders(doses, now=None):
+    """
+    Claim due doses and fan them out to shard workers
+    
+    The claim is a test-and-set on the Redis sent-ledger, so this path never
+    touches MariaDB; the Medication Reminder audit rows are written by a
+    background job.
+    
+    Args:
+        doses: Due doses popped from the reminder queue
+        now: Dispatch time (defaults to now)
+    
+    Returns:
+        Number of reminders dispatched
+    """
+    from my_medicinal.my_medicinal import reminder_metrics
+    from my_medicinal.my_medicinal.reminder_ledger import claim
+    
+    if not doses:
+        return 0
+    
+    now = now or now_datetime()
+    
+    # Atomic test-and-set: only doses not reminded yet come back
+    due_doses = claim(doses)
+    
+    if due_doses:
+        frappe.enqueue(
+            "my_medicinal.my_medicinal.tasks.write_reminder_audit",
+            queue="long",
+            doses=due_doses,
+            sent_at=now
+        )
+    
+    shards = plan_reminder_shards(due_doses, get_reminder_shard_count())
+    for shard, shard_doses in shards.items():
+        try:
+            frappe.enqueue(
+                "my_medicinal.my_medicinal.tasks.send_reminder_shard",
+                queue="short",
+                timeout=240,
+                shard=shard,
+                doses=shard_doses
+            )
+        except Exception:
+            frappe.log_error(frappe.get_traceback(), f"Medication Reminder Shard {shard} Enqueue Error")
+            return_doses(shard_doses)
+    
+    # Scheduled dose time -> handed to a shard worker
+    enqueued_at = now_datetime()
+    reminder_metrics.observe(
+        "enqueue_lag",
+        [(enqueued_at - dose.scheduled_time).total_seconds() for dose in due_doses]
+    )
+    reminder_metrics.incr("doses_dispatched", len(due_doses))
+    
+    frappe.logger().info(
+        f"Medication reminders planned: {len(due_doses)} due, {len(doses) - len(due_doses)} already sent, "
+        f"{len(shards)} shards"
+    )
+    
+    return len(due_doses)
+
+
+def write_reminder_audit(doses, sent_at):
+    """
+    Write Medication Reminder audit rows for dispatched doses (background job)
+    
+    Rows that already exist are skipped, so a retried job does not duplicate them.
+    """
+    import time as timer
+    
+    started = timer.monotonic()
+    
+    already_written = get_sent_reminder_keys(doses)
+    doses = [
+        dose for dose in doses
+        if (dose.schedule, dose.reminder_date, dose.time) not in already_written
+    ]
+    
+    rows_written = insert_reminders_bulk(doses, sent_at)
+    frappe.db.commit()
+    
+    write_seconds = timer.monotonic() - started
+    rows_per_second = rows_written / write_seconds if write_seconds > 0 else rows_written
+    frappe.logger().info(
+        f"Medication reminder audit: {rows_written} rows in {write_seconds:.2f}s ({rows_per_second:.0f} rows/s)"
+    )
+    
+    return rows_written
+
+
+def send_reminder_shard(shard, doses):
+    """
+    Deliver one shard of planned reminders (RQ job on the short queue)
+    
+    Args:
+        shard: Shard number
+        doses: Due doses planned by send_medication_reminders
+    
+    Returns:
+        dict with shard, doses, rows written and duration in seconds
+    """
+    import time as timer
+    
+    started = timer.monotonic()
+    
+    from my_medicinal.my_medicinal.outbox import deliver_now
+    
+    try:
+        queued = send_medication_notifications(doses)
+        frappe.db.commit()
+    except Exception:
+        # Nothing reached the outbox: un-claim the doses so they are sent again
+        frappe.db.rollback()
+        frappe.log_error(frappe.get_traceback(), f"Medication Reminder Shard {shard} Error")
+        return_doses(doses)
+        raise
+    
+    # Deliver this shard's reminders now instead of waiting for the drain job;
+    # committed outbox rows are retried by the drain job if this fails
+    try:
+        rows_written = deliver_now(queued)
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), f"Medication Reminder Shard {shard} Error")
+        raise
+    
+    duration = timer.monotonic() - started
+    frappe.logger().info(
+        f"Medication reminder shard {shard}: {len(doses)} doses, "
+        f"{rows_written} rows in {duration:.2f}s"
+    )
+    
+    return {
+        "shard": shard,
+        "doses": len(doses),
+        "rows_written": rows_written,
+        "duration": round(duration, 3)
+    }
+
+
+def return_doses(doses):
+    """
+    Release claimed doses that were not handed to the outbox and put them
+    back on the reminder queue for the next dispatcher pass
+    """
+    from my_medicinal.my_medicinal import reminder_queue
+    from my_medicinal.my_medicinal.reminder_ledger import release
+    
     try:
-        # Import FCM function
-        from my_medicinal.my_medicinal.notifications import send_medication_notification_fcm
-        
-        # Send via FCM
-        fcm_result = send_medication_notification_fcm(
-            patient_id,
-            medication_name,
-            dosage,
-            time
+        release(doses)
+        reminder_queue.requeue(doses)
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "Medication Reminder Return Error")
+
+
+def plan_reminder_shards(doses, shard_count):
+    """
+    Partition doses into shards by a stable hash of the patient
+    
+    A patient's doses always land in the same shard, so one slow recipient
+    only delays the patients that share its shard.
+    
+    Returns:
+        dict of shard number -> list of doses (empty shards omitted)
+    """
+    import zlib
+    
+    shard_count = max(int(shard_count or 1), 1)
+    shards = {}
+    
+    for dose in doses:
+        shard = zlib.crc32((dose.patient or "").encode()) % shard_count
+        shards.setdefault(shard, []).append(dose)
+    
+    return shards
+
+
+def get_reminder_shard_count():
+    """Number of reminder shards, set with `medication_reminder_shards` in site_config.json"""
+    return frappe.utils.cint(frappe.conf.get("medication_reminder_shards")) or 4
+
+
+def get_sent_reminder_keys(doses):
+    """
+    Load reminder rows already written for the doses' schedules and dates in one query
+    
+    Returns:
+        Set of (medication_schedule, reminder_date, reminder_time) tuples
+    """
+    from my_medicinal.my_medicinal.reminder_metrics import incr
+    
+    if not doses:
+        return set()
+    
+    incr("sql_queries")
+    sent = frappe.db.sql("""
+        SELECT medication_schedule, reminder_date, reminder_time
+        FROM `tabMedication Reminder`
+        WHERE reminder_date IN %(dates)s
+        AND medication_schedule IN %(schedules)s
+    """, {
+        "dates": tuple({dose.reminder_date for dose in doses}),
+        "schedules": tuple({dose.schedule for dose in doses})
+    })
+    
+    return {
+        (schedule, str(reminder_date), format_time(reminder_time))
+        for schedule, reminder_date, reminder_time in sent
+    }
+
+
+def insert_reminders_bulk(doses, sent_at):
+    """Write Medication Reminder rows for the given doses with one bulk insert"""
+    if not doses:
+        return 0
+    
+    user = frappe.session.user
+    fields = [
+        "name", "creation", "modified", "owner", "modified_by",
+        "medication_schedule", "patient", "reminder_date", "reminder_time",
+        "status", "reminder_sent_at"
+    ]
+    values = [
+        (
+            frappe.generate_hash(length=10), sent_at, sent_at, user, user,
+            dose.schedule, dose.patient, dose.reminder_date, dose.time,
+            "pending", sent_at
+        )
+        for dose in doses
+    ]
+    
+    frappe.db.bulk_insert("Medication Reminder", fields, values)
+    
+    from my_medicinal.my_medicinal.reminder_metrics import incr
+    incr("sql_queries")
+    
+    return len(values)
+
+
+def send_medication_notifications(doses):
+    """
+    Queue medication reminders (Notification Log + push) in the outbox with
+    one multi-row insert; delivery metrics are recorded when they are sent
+    
+    Returns:
+        List of outbox row names
+    """
+    if not doses:
+        return []
+    
+    from my_medicinal.my_medicinal import reminder_metrics
+    from my_medicinal.my_medicinal.notifications import get_medication_reminder_push
+    from my_medicinal.my_medicinal.outbox import enqueue_many
+    from my_medicinal.my_medicinal.recipients import prefetch_recipients
+    
+    # One bulk prefetch resolves user and name for the whole shard
+    patients = prefetch_recipients(dose.patient for dose in doses)
+    entries = []
+    
+    for dose in doses:
+        patient = patients.get(dose.patient)
+        if not patient or not patient.user:
+            continue
+        
+        title, body, data = get_medication_reminder_push(
+            dose.patient, dose.medication_name, dose.dosage, dose.time
         )
         
-        # Also log in DB (fallback)
-        patient = frappe.get_doc("patient", patient_id)
-        notification = frappe.get_doc({
-            "doctype": "Notification Log",
-            "subject": f"? Medication Time",
+        entries.append({
+            "event_type": "medication_reminder",
+            # A retried shard queues each dose once
+            "event_key": f"reminder:{dose.schedule}:{dose.reminder_date}:{dose.time}",
             "for_user": patient.user,
-            "type": "Alert",
+            "patient": dose.patient,
+            "due_at": dose.scheduled_time,
+            "subject": "? Medication Time",
             "document_type": "Medication Schedule",
-            "email_content": f"""
+            "document_name": dose.schedule,
+            "message": f"""
                 <p>my dear{patient.patient_name},</p>
-                <p>it's time for your medication: <strong>{medication_name}</strong></p>
-                <p>Dose: {dosage}</p>
-                <p>Time: {time}</p>
-            """
+                <p>it's time for your medication: <strong>{dose.medication_name}</strong></p>
+                <p>Dose: {dose.dosage}</p>
+                <p>Time: {dose.time}</p>
+            """,
+            "push": {"title": title, "body": body, "data": data}
         })
-        notification.insert(ignore_permissions=True)
-        
-        if fcm_result.get('push', {}).get('success'):
-            print(f"? FCM + DB notification sent to {patient.patient_name}")
-        else:
-            print(f"??  DB notification sent (FCM failed): {patient.patient_name}")
-        
-    except Exception as e:
-        frappe.log_error(frappe.get_traceback(), "Send Notification Error")
-        print(f"? Notification error: {str(e)}")
+    
+    names = enqueue_many(entries)
+    if names:
+        reminder_metrics.incr("sql_queries")
+    
+    return names
+
+
+def format_time(value):
+    """Normalize a TIME column (timedelta) or string to HH:MM:SS"""
+    if hasattr(value, "total_seconds"):
+        seconds = int(value.total_seconds())
+        return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+    
+    return str(value)
 
 
 # ============================================
@@ -156,56 +381,36 @@ def check_stock_depletion():
     Runs daily at midnight
     """
     try:
+        from my_medicinal.my_medicinal.alert_digest import clear_alert
+        from my_medicinal.my_medicinal.stock import compact_stock_movements
+        from my_medicinal.my_medicinal.stock_forecast import forecast_stock_depletion
+        
         print("\n?? Checking medication stock...")
         
-        # Get all active schedules
-        schedules = frappe.get_all(
-            "Medication Schedule",
-            filters={"is_active": 1, "current_stock": [">", 0]},
-            fields=[
-                "name", "patient", "medication_name",
-                "current_stock", "dosage", "frequency"
-            ]
-        )
+        # Fold pending stock movements so the forecast reads fresh snapshots
+        compact_stock_movements()
+        
+        # One vectorized pass over all active schedules; only changed rows are written
+        forecast = forecast_stock_depletion()
+        frappe.db.commit()
+        
+        # Alert only schedules whose alert tier rose since the last run
+        alerts = forecast["alerts"]
         
-        alerts_sent = 0
-        
-        for schedule in schedules:
-            # Calculate daily consumption
-            dosage = float(schedule.dosage.split()[0] if schedule.dosage else 1)
-            
-            # Frequency mapping
-            freq_map = {
-                "Once Daily": 1,
-                "Twice Daily": 2,
-                "Three Times Daily": 3,
-                "Four Times Daily": 4
-            }
-            times_per_day = freq_map.get(schedule.frequency, 1)
-            
-            daily_consumption = dosage * times_per_day
-            
-            if daily_consumption > 0:
-                days_remaining = int(schedule.current_stock / daily_consumption)
-                
-                # Update schedule
-                frappe.db.set_value(
-                    "Medication Schedule",
-                    schedule.name,
-                    "days_until_depletion",
-                    days_remaining
-                )
-                
-                # Send alerts based on days remaining
-                if days_remaining <= 2:
-                    send_stock_alert(schedule, days_remaining, "Critical")
-                    alerts_sent += 1
-                elif days_remaining <= 5:
-                    send_stock_alert(schedule, days_remaining, "Warning")
-                    alerts_sent += 1
+        for schedule in alerts:
+            send_stock_alert(schedule, schedule.days_until_depletion, schedule.tier)
+        
+        # Refilled schedules may alert again the next time they run low
+        for schedule in forecast["cleared"]:
+            clear_alert(schedule.patient, "stock", schedule.name)
         
         frappe.db.commit()
-        print(f"? Sent {alerts_sent} stock alerts")
+        print(
+            f"? Forecast {forecast['scanned']} schedules, updated {forecast['updated']}, "
+            f"queued {len(alerts)} stock alerts"
+        )
+        
+        return forecast["scanned"]
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Stock Depletion Check Error")
@@ -213,9 +418,9 @@ def check_stock_depletion():
 
 
 def send_stock_alert(schedule, days_remaining, priority):
-    """Send stock depletion alert"""
+    """Queue a stock depletion alert for the patient's nightly digest"""
     try:
-        patient = frappe.get_doc("patient", schedule.patient)
+        from my_medicinal.my_medicinal.alert_digest import add_alert
         
         if days_remaining <= 0:
             title = "?? ??? ??????!"
@@ -227,23 +432,12 @@ def send_stock_alert(schedule, days_remaining, priority):
             title = "?? ?????"
             message = f"{schedule.medication_name} ????? ???? {days_remaining} ????"
         
-        # Create notification
-        notification = frappe.get_doc({
-            "doctype": "Notification Log",
-            "subject": title,
-            "for_user": patient.user,
-            "type": "Alert",
-            "document_type": "Medication Schedule",
-            "document_name": schedule.name,
-            "email_content": f"""
-                <p>????? {patient.patient_name},</p>
-                <p>{message}</p>
-                <p>??????? ??????: {schedule.current_stock}</p>
-            """
-        })
-        notification.insert(ignore_permissions=True)
-        
-        print(f"?? Stock alert sent for {schedule.medication_name}")
+        # Deduplicated by tier: the same schedule is not re-alerted at the same priority
+        add_alert(
+            schedule.patient, "stock", schedule.name, priority,
+            title, f"{message} (??????? ??????: {schedule.current_stock})",
+            document_type="Medication Schedule", document_name=schedule.name
+        )
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Send Stock Alert Error")
@@ -259,89 +453,31 @@ def generate_daily_adherence_reports():
     Runs daily
     """
     try:
+        from my_medicinal.my_medicinal.adherence_reports import generate_reports
+        from my_medicinal.my_medicinal.alert_digest import clear_alert
+        from my_medicinal.my_medicinal.risk_scoring import score_patients
+        
         print("\n?? Generating adherence reports...")
         
-        # Get all active patients with medications
-        patients = frappe.db.sql("""
-            SELECT DISTINCT patient
-            FROM `tabMedication Schedule`
-            WHERE is_active = 1
-        """, as_dict=True)
-        
-        reports_generated = 0
-        
-        for patient_row in patients:
-            patient_id = patient_row.patient
-            
-            # Calculate adherence for last 30 days
-            from_date = add_days(today(), -30)
-            
-            # Get total scheduled doses
-            total_logs = frappe.db.count(
-                "Medication Log",
-                {
-                    "patient": patient_id,
-                    "scheduled_date": [">=", from_date]
-                }
-            )
-            
-            if total_logs > 0:
-                # Get taken doses
-                taken_logs = frappe.db.count(
-                    "Medication Log",
-                    {
-                        "patient": patient_id,
-                        "scheduled_date": [">=", from_date],
-                        "status": "Taken"
-                    }
-                )
-                
-                # Calculate adherence
-                adherence = round((taken_logs / total_logs) * 100, 2)
-                
-                # Create/update adherence report
-                existing_report = frappe.db.get_value(
-                    "Adherence Report",
-                    {
-                        "patient": patient_id,
-                        "report_period": "Monthly",
-                        "start_date": from_date
-                    },
-                    "name"
-                )
-                
-                if existing_report:
-                    # Update existing
-                    report = frappe.get_doc("Adherence Report", existing_report)
-                else:
-                    # Create new
-                    report = frappe.get_doc({
-                        "doctype": "Adherence Report",
-                        "patient": patient_id,
-                        "report_period": "Monthly",
-                        "start_date": from_date,
-                        "end_date": today()
-                    })
-                
-                report.total_doses_scheduled = total_logs
-                report.doses_taken = taken_logs
-                report.doses_missed = total_logs - taken_logs
-                report.adherence_percentage = adherence
-                report.generated_at = now_datetime()
-                
-                if existing_report:
-                    report.save(ignore_permissions=True)
-                else:
-                    report.insert(ignore_permissions=True)
-                
-                reports_generated += 1
-                
-                # Send notification if adherence is low
-                if adherence < 80:
-                    send_adherence_alert(patient_id, adherence)
+        # One grouped query over the daily rollups, then chunked bulk upserts into
+        # one rolling report per patient (plus tonight's history snapshot)
+        reported = generate_reports("Monthly")
+        
+        for patient_id, adherence in reported:
+            # Send notification if adherence is low
+            if adherence < 80:
+                send_adherence_alert(patient_id, adherence)
+            else:
+                clear_alert(patient_id, "adherence", "monthly")
         
         frappe.db.commit()
-        print(f"? Generated {reports_generated} adherence reports")
+        print(f"? Generated {len(reported)} adherence reports")
+        
+        # Risk scores read the summaries refreshed above
+        scored = score_patients()
+        print(f"? Scored adherence risk for {scored} patients")
+        
+        return len(reported)
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Adherence Reports Error")
@@ -349,22 +485,15 @@ def generate_daily_adherence_reports():
 
 
 def send_adherence_alert(patient_id, adherence):
-    """Send low adherence alert"""
+    """Queue a low adherence alert for the patient's nightly digest"""
     try:
-        patient = frappe.get_doc("patient", patient_id)
+        from my_medicinal.my_medicinal.alert_digest import add_alert
         
-        notification = frappe.get_doc({
-            "doctype": "Notification Log",
-            "subject": "?? ???? ???????? ??????",
-            "for_user": patient.user,
-            "type": "Alert",
-            "email_content": f"""
-                <p>????? {patient.patient_name},</p>
-                <p>???? ??????? ??????? {adherence}%</p>
-                <p>???? ????? ??????? ?????? ??? ???? ???????!</p>
-            """
-        })
-        notification.insert(ignore_permissions=True)
+        add_alert(
+            patient_id, "adherence", "monthly", "Very Low" if adherence < 50 else "Low",
+            "?? ???? ???????? ??????",
+            f"???? ??????? ??????? {adherence}% - ???? ????? ??????? ?????? ??? ???? ???????!"
+        )
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Send Adherence Alert Error")
@@ -374,25 +503,21 @@ def send_adherence_alert(patient_id, adherence):
 # 4. CLEANUP
 # ============================================
 
+@single_flight()
 def cleanup_old_notifications():
     """
     Delete old read notifications (older than 30 days)
-    Runs weekly
+    Chunked and resumable; the daily retention purge also covers it
     """
     try:
-        print("\n?? Cleaning up old notifications...")
+        from my_medicinal.my_medicinal.retention import purge_doctype
         
-        cutoff_date = add_days(today(), -30)
+        print("\n?? Cleaning up old notifications...")
         
-        # Delete old read notifications
-        frappe.db.sql("""
-            DELETE FROM `tabNotification Log`
-            WHERE read = 1
-            AND creation < %(cutoff_date)s
-        """, {"cutoff_date": cutoff_date})
+        deleted = purge_doctype("Notification Log")["deleted"]
+        print(f"? Deleted {deleted} old notifications")
         
-        frappe.db.commit()
-        print(f"? Deleted old notifications")
+        return deleted
         
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Cleanup Error")
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+"""
+Unread Notification Counter
+Per-user count of unread Notification Log rows, kept in Redis so the app's
+badge never needs a COUNT scan.
+
+    notification_unread:<user>   integer, expires after COUNTER_TTL_SECONDS
+
+Writers adjust the counter after their transaction commits: the outbox for
+the logs it inserts, the bulk read endpoints for rows they mark read. An
+adjustment only applies to a counter that exists; a missing one is loaded
+from the table (which already includes the committed change), so a lost
+update heals at the latest when the key expires. Every change is pushed to
+the user's sessions as a "notification_badge" realtime event.
+"""
+
+import frappe
+from frappe.utils import cint
+
+UNREAD_KEY = "notification_unread:{0}"
+COUNTER_TTL_SECONDS = 86400
+
+BADGE_EVENT = "notification_badge"
+
+# INCRBY only when the key exists; never below zero
+ADJUST_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return nil
+end
+local value = redis.call('incrby', KEYS[1], ARGV[1])
+if value < 0 then
+    redis.call('set', KEYS[1], 0, 'EX', ARGV[2])
+    value = 0
+end
+return value
+"""
+
+
+def get_unread_count(user):
+    return get_unread_counts([user])[user]
+
+
+def get_unread_counts(users):
+    """
+    Unread count per user, loading missing counters with one grouped query
+
+    Returns:
+        dict of user -> count
+    """
+    users = list(dict.fromkeys(users))
+    if not users:
+        return {}
+
+    values = frappe.cache().mget([_key(user) for user in users])
+    counts = {user: cint(value) for user, value in zip(users, values) if value is not None}
+
+    missing = [user for user in users if user not in counts]
+    if missing:
+        counts.update(_load(missing))
+
+    return counts
+
+
+def adjust(deltas, publish=True):
+    """
+    Apply committed changes to the counters and push the new badges
+
+    Call after the transaction that changed Notification Log commits.
+
+    Args:
+        deltas: dict of user -> change in unread rows (+ inserted, - read)
+    """
+    deltas = {user: cint(delta) for user, delta in deltas.items() if user and cint(delta)}
+    if not deltas:
+        return {}
+
+    try:
+        pipe = frappe.cache().pipeline()
+        for user, delta in deltas.items():
+            pipe.eval(ADJUST_SCRIPT, 1, _key(user), delta, COUNTER_TTL_SECONDS)
+
+        counts = {user: cint(value) for user, value in zip(deltas, pipe.execute()) if value is not None}
+
+        missing = [user for user in deltas if user not in counts]
+        if missing:
+            counts.update(_load(missing))
+
+    except Exception:
+        # The badge is a cache; the table stays correct
+        frappe.log_error(frappe.get_traceback(), "Unread Counter Error")
+        return {}
+
+    if publish:
+        publish_badges(counts)
+
+    return counts
+
+
+def publish_badges(counts):
+    for user, count in counts.items():
+        frappe.publish_realtime(BADGE_EVENT, {"unread": count}, user=user)
+
+
+def on_log_change(doc, method=None):
+    """
+    Notification Log inserted or deleted through the document API (e.g. by
+    Frappe itself); bulk paths adjust the counter directly
+    Called by hooks.py: doc_events
+    """
+    if cint(doc.read) or not doc.for_user:
+        return
+
+    delta = -1 if method == "on_trash" else 1
+    frappe.db.after_commit.add(lambda: adjust({doc.for_user: delta}))
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _load(users):
+    """Count unread rows of users from the table and cache the counters"""
+    rows = frappe.db.sql("""
+        SELECT for_user, COUNT(*)
+        FROM `tabNotification Log`
+        WHERE for_user IN %(users)s
+        AND `read` = 0
+        GROUP BY for_user
+    """, {"users": tuple(users)})
+
+    counts = dict.fromkeys(users, 0)
+    counts.update({user: cint(count) for user, count in rows})
+
+    pipe = frappe.cache().pipeline()
+    for user, count in counts.items():
+        pipe.set(_key(user), count, ex=COUNTER_TTL_SECONDS)
+    pipe.execute()
+
+    return counts
+
+
+def _key(user):
+    return frappe.cache().make_key(UNREAD_KEY.format(user))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+import frappe
+
+
+def execute():
+    """
+    Give every Medication Time row a durable sent-ledger slot and drop the
+    Redis-allocated slot map it replaces
+    """
+    from my_medicinal.my_medicinal import reminder_index, reminder_queue
+    from my_medicinal.my_medicinal.reminder_ledger import SLOT_SERIES
+
+    frappe.reload_doc("my_medicinal", "doctype", "medication_time")
+
+    start = frappe.db.sql("SELECT IFNULL(MAX(ledger_slot), 0) FROM `tabMedication Time`")[0][0]
+    frappe.db.sql("SET @slot := %s", (start,))
+    frappe.db.sql("""
+        UPDATE `tabMedication Time`
+        SET ledger_slot = (@slot := @slot + 1)
+        WHERE IFNULL(ledger_slot, 0) = 0
+        ORDER BY creation, name
+    """)
+
+    last = frappe.db.sql("SELECT IFNULL(MAX(ledger_slot), 0) FROM `tabMedication Time`")[0][0]
+    frappe.db.sql("""
+        INSERT INTO `tabSeries` (name, current) VALUES (%(series)s, %(last)s)
+        ON DUPLICATE KEY UPDATE current = GREATEST(current, %(last)s)
+    """, {"series": SLOT_SERIES, "last": last})
+
+    # Index and queue members now carry the slot; both are rebuilt from the
+    # database (the queue from its watermark) on the next dispatcher run
+    reminder_index.clear_index()
+    frappe.cache().delete(
+        frappe.cache().make_key(reminder_queue.QUEUE_KEY),
+        frappe.cache().make_key(reminder_queue.FED_UNTIL_KEY),
+        frappe.cache().make_key("medication_reminder_ledger:slots"),
+        frappe.cache().make_key("medication_reminder_ledger:next_slot")
+    )
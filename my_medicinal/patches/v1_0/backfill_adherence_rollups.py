@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+import frappe
+
+
+def execute():
+    """Build Adherence Daily Rollup rows for existing Medication Logs"""
+    from my_medicinal.my_medicinal.adherence_rollup import rebuild_rollups
+
+    frappe.reload_doc("my_medicinal", "doctype", "adherence_daily_rollup")
+    rebuild_rollups()
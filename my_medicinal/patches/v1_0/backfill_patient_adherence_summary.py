@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+import frappe
+
+
+def execute():
+    """
+    Seed Patient Adherence Summary from each patient's latest Adherence Report
+    The nightly report job keeps it current afterwards
+    """
+    frappe.reload_doc("my_medicinal", "doctype", "patient_adherence_summary")
+
+    frappe.db.sql("""
+        INSERT IGNORE INTO `tabPatient Adherence Summary`
+            (name, creation, modified, owner, modified_by, docstatus, idx,
+             patient, report_period, adherence_percentage, band, computed_at)
+        SELECT
+            ar.patient, ar.creation, ar.modified, ar.owner, ar.modified_by, 0, 0,
+            ar.patient, ar.report_period, IFNULL(ar.adherence_percentage, 0),
+            CASE
+                WHEN ar.adherence_percentage >= 80 THEN 'High'
+                WHEN ar.adherence_percentage >= 50 THEN 'Medium'
+                ELSE 'Low'
+            END,
+            IFNULL(ar.generated_at, ar.modified)
+        FROM `tabAdherence Report` ar
+        LEFT JOIN `tabAdherence Report` newer
+            ON newer.patient = ar.patient
+            AND (
+                newer.modified > ar.modified
+                OR (newer.modified = ar.modified AND newer.name > ar.name)
+            )
+        WHERE IFNULL(ar.patient, '') != ''
+        AND newer.name IS NULL
+    """)
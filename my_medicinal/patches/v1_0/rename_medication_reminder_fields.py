@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.utils.rename_field import rename_field
+
+
+def execute():
+    """Rename misspelled Medication Reminder columns to the names the code uses"""
+    frappe.reload_doc("my_medicinal", "doctype", "medication_reminder")
+
+    for old_fieldname, new_fieldname in (
+        ("patint", "patient"),
+        ("remindrt_time", "reminder_time"),
+    ):
+        if frappe.db.has_column("Medication Reminder", old_fieldname):
+            rename_field("Medication Reminder", old_fieldname, new_fieldname)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, My Medicinal and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.utils.rename_field import rename_field
+
+
+def execute():
+    """
+    Move Adherence Report to one rolling row per patient and period
+
+    - rename the misspelled patint column to patient
+    - title-case report_period values to match the field options
+    - copy every existing report into Adherence Report Snapshot history
+    - keep only the latest report per patient and period, named "{patient}-{period}"
+    """
+    frappe.reload_doc("my_medicinal", "doctype", "adherence_report")
+    frappe.reload_doc("my_medicinal", "doctype", "adherence_report_snapshot")
+
+    if frappe.db.has_column("Adherence Report", "patint"):
+        rename_field("Adherence Report", "patint", "patient")
+
+    frappe.db.sql("""
+        UPDATE `tabAdherence Report`
+        SET report_period = CONCAT(UPPER(LEFT(report_period, 1)), LOWER(SUBSTRING(report_period, 2)))
+        WHERE IFNULL(report_period, '') != ''
+    """)
+
+    frappe.db.sql("""
+        INSERT IGNORE INTO `tabAdherence Report Snapshot`
+            (name, creation, modified, owner, modified_by, docstatus, idx,
+             patient, report_period, snapshot_date,
+             total_doses_scheduled, doses_taken, doses_missed, doses_skipped,
+             adherence_percentage)
+        SELECT
+            CONCAT(patient, '-', report_period, '-', DATE(IFNULL(generated_at, creation))),
+            creation, modified, owner, modified_by, 0, 0,
+            patient, report_period, DATE(IFNULL(generated_at, creation)),
+            IFNULL(total_doses_scheduled, 0), IFNULL(doses_taken, 0),
+            IFNULL(doses_missed, 0), IFNULL(doses_skipped, 0),
+            IFNULL(adherence_percentage, 0)
+        FROM `tabAdherence Report`
+        WHERE IFNULL(patient, '') != ''
+        AND IFNULL(report_period, '') != ''
+    """)
+
+    frappe.db.sql("""
+        DELETE older
+        FROM `tabAdherence Report` older
+        INNER JOIN `tabAdherence Report` newer
+            ON newer.patient = older.patient
+            AND newer.report_period = older.report_period
+            AND (
+                newer.creation > older.creation
+                OR (newer.creation = older.creation AND newer.name > older.name)
+            )
+    """)
+
+    frappe.db.sql("""
+        UPDATE `tabAdherence Report`
+        SET name = CONCAT(patient, '-', report_period)
+        WHERE IFNULL(patient, '') != ''
+        AND IFNULL(report_period, '') != ''
+    """)